@@ -1,6 +1,9 @@
 import json
 import os
+import random
+from time import monotonic, time
 
+from celery.signals import worker_process_shutdown, worker_shutdown
 from flask import current_app
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -12,10 +15,19 @@ from app.config import Config, QueueNames
 from app.dao import notifications_dao
 from app.dao.notifications_dao import update_notification_status_by_id
 from app.delivery import send_to_providers
-from app.enums import NotificationStatus
+from app.delivery.sending_status_buffer import sending_status_buffer
+from app.enums import NotificationStatus, NotificationType
 from app.exceptions import NotificationTechnicalFailureException
 from notifications_utils.clients.redis import total_limit_cache_key
 
+# How long one run of deliver-sms-batches keeps claiming batches for. Runs
+# overlap safely, because each notification can only be claimed once.
+DELIVERY_BATCHES_TIME_LIMIT = 60
+
+DELIVERY_RETRIES_KEY = "delivery-retries"
+DELIVERY_RETRIES_BATCH_SIZE = 1000
+DELIVERY_RETRIES_DEAD_LETTER_KEY = "delivery-retries-dead-letter"
+
 
 @notify_celery.task(
     bind=True, name="deliver_sms", max_retries=48, default_retry_delay=300
@@ -60,6 +72,9 @@ def deliver_sms(self, notification_id):
             )
 
         try:
+            countdown = 0 if self.request.retries == 0 else self.default_retry_delay
+            if _schedule_retry(self, notification_id, countdown):
+                return
             if self.request.retries == 0:
                 self.retry(
                     queue=QueueNames.RETRY,
@@ -84,6 +99,117 @@ def deliver_sms(self, notification_id):
             raise NotificationTechnicalFailureException(message)
 
 
+@notify_celery.task(name="deliver-sms-batches")
+def deliver_sms_batches():
+    """
+    Sends SMS notifications from jobs in batches, rather than with a
+    deliver_sms task per notification, until there are none left waiting.
+
+    Only runs if DELIVER_SMS_IN_BATCHES is switched on, in which case
+    save_sms leaves notifications from jobs for this task to pick up.
+    """
+    if not current_app.config["DELIVER_SMS_IN_BATCHES"]:
+        return
+
+    _deliver_in_batches(
+        NotificationType.SMS,
+        send_to_providers.send_sms_batch_to_provider,
+        deliver_sms,
+        batch_size=current_app.config["SMS_DELIVERY_BATCH_SIZE"],
+        max_workers=current_app.config["SMS_DELIVERY_CONCURRENCY"],
+    )
+
+
+@notify_celery.task(name="deliver-email-batches")
+def deliver_email_batches():
+    """
+    Sends email notifications from jobs in batches, like
+    deliver_sms_batches.
+
+    Only runs if DELIVER_EMAIL_IN_BATCHES is switched on, in which case
+    save_email leaves notifications from jobs for this task to pick up.
+    """
+    if not current_app.config["DELIVER_EMAIL_IN_BATCHES"]:
+        return
+
+    _deliver_in_batches(
+        NotificationType.EMAIL,
+        send_to_providers.send_email_batch_to_provider,
+        deliver_email,
+        batch_size=current_app.config["EMAIL_DELIVERY_BATCH_SIZE"],
+        max_workers=current_app.config["EMAIL_DELIVERY_CONCURRENCY"],
+    )
+
+
+def _deliver_in_batches(
+    notification_type, send_batch, retry_task, batch_size, max_workers
+):
+    start_time = monotonic()
+    while monotonic() - start_time < DELIVERY_BATCHES_TIME_LIMIT:
+        batch_start_time = monotonic()
+        notifications = notifications_dao.dao_claim_created_notifications_from_jobs(
+            notification_type, batch_size
+        )
+        if notifications:
+            sent, to_retry = send_batch(notifications, max_workers=max_workers)
+            _retry_batch_deliveries(retry_task, to_retry)
+            elapsed = monotonic() - batch_start_time
+            current_app.logger.info(
+                f"Sent {sent} of a batch of {len(notifications)} {notification_type} "
+                f"notifications in {elapsed:.2f}s ({sent / elapsed:.1f} per second)"
+            )
+        if len(notifications) < batch_size:
+            break
+
+
+def _retry_batch_deliveries(task, notification_ids):
+    """
+    Hands notifications which a batch failed to send to `task`, as its first
+    retry, in `task.default_retry_delay` seconds, so they’re retried in the
+    same way, and as many times, as if `task` had failed to send them.
+
+    Anything that can’t be handed over is left created, to be claimed by a
+    later batch once DELIVERY_CLAIM_TIMEOUT has passed.
+    """
+    if not notification_ids:
+        return
+    if _add_delivery_retries(
+        task, notification_ids, retries=1, countdown=task.default_retry_delay
+    ):
+        return
+    for notification_id in notification_ids:
+        try:
+            task.apply_async(
+                [str(notification_id)],
+                queue=QueueNames.RETRY,
+                countdown=task.default_retry_delay,
+                retries=1,
+                expires=Config.DEFAULT_REDIS_EXPIRE_TIME,
+            )
+        except Exception:
+            current_app.logger.exception(
+                f"Couldn’t retry delivery of notification {notification_id}"
+            )
+
+
+@notify_celery.task(name="release-abandoned-delivery-claims")
+def release_abandoned_delivery_claims():
+    """
+    Puts notifications which deliver-sms-batches or deliver-email-batches
+    claimed but never sent, because the worker died, back to be claimed
+    again.
+    """
+    config = current_app.config
+    if not (config["DELIVER_SMS_IN_BATCHES"] or config["DELIVER_EMAIL_IN_BATCHES"]):
+        return
+
+    released = notifications_dao.dao_release_abandoned_delivery_claims()
+    if released:
+        current_app.logger.warning(
+            f"Released {released} notifications claimed for delivery but never sent"
+        )
+
+
 @notify_celery.task(
     bind=True, name="deliver_email", max_retries=48, default_retry_delay=30
 )
@@ -96,13 +222,8 @@ def deliver_email(self, notification_id):
 
         if not notification:
             raise NoResultFound()
-        personalisation = redis_store.get(f"email-personalisation-{notification_id}")
-        recipient = redis_store.get(f"email-recipient-{notification_id}")
-        if personalisation:
-            notification.personalisation = json.loads(personalisation)
-        if recipient:
-            notification.recipient = json.loads(recipient)
 
+        # Gets the address and personalisation from redis itself
         send_to_providers.send_email_to_provider(notification)
     except EmailClientNonRetryableException:
         current_app.logger.exception(f"Email notification {notification_id} failed")
@@ -118,6 +239,8 @@ def deliver_email(self, notification_id):
                     f"RETRY: Email notification {notification_id} failed"
                 )
 
+            if _schedule_retry(self, notification_id, self.default_retry_delay):
+                return
             self.retry(queue=QueueNames.RETRY, expires=Config.DEFAULT_REDIS_EXPIRE_TIME)
         except self.MaxRetriesExceededError:
             message = (
@@ -132,3 +255,112 @@ def deliver_email(self, notification_id):
                 NotificationStatus.TECHNICAL_FAILURE,
             )
             raise NotificationTechnicalFailureException(message)
+
+
+def _schedule_retry(task, notification_id, countdown):
+    """
+    With RETRY_DELIVERIES_FROM_REDIS switched on, schedules a retry of a
+    delivery task in `countdown` seconds by adding it to the
+    DELIVERY_RETRIES_KEY sorted set, scored by when it should run, for
+    move_due_delivery_retries to send. That way workers don’t hold on to
+    retries as tasks with a countdown. Retries are spread out by up to
+    DELIVERY_RETRY_JITTER seconds.
+
+    Returns False if the retry wasn’t scheduled, in which case the caller
+    should use `task.retry`.
+    """
+    if not (current_app.config["RETRY_DELIVERIES_FROM_REDIS"] and redis_store.active):
+        return False
+    if task.request.retries >= task.max_retries:
+        raise task.MaxRetriesExceededError()
+
+    return _add_delivery_retries(
+        task, [notification_id], task.request.retries + 1, countdown
+    )
+
+
+def _add_delivery_retries(task, notification_ids, retries, countdown):
+    """
+    Schedules `task` for each of `notification_ids`, as retry number
+    `retries`, in the DELIVERY_RETRIES_KEY sorted set, if
+    RETRY_DELIVERIES_FROM_REDIS is switched on. Returns whether they were
+    scheduled.
+    """
+    if not (current_app.config["RETRY_DELIVERIES_FROM_REDIS"] and redis_store.active):
+        return False
+
+    now = time()
+    jitter = current_app.config["DELIVERY_RETRY_JITTER"]
+    scheduled = {
+        json.dumps(
+            {
+                "task": task.name,
+                "notification_id": str(notification_id),
+                "retries": retries,
+            }
+        ): now
+        + countdown
+        + random.uniform(0, jitter)
+        for notification_id in notification_ids
+    }
+    try:
+        redis_store.zadd(DELIVERY_RETRIES_KEY, scheduled, raise_exception=True)
+    except Exception:
+        return False
+    return True
+
+
+@notify_celery.task(name="move-due-delivery-retries")
+def move_due_delivery_retries():
+    """
+    Sends the delivery retries scheduled by _schedule_retry which are due,
+    in batches, to the retry queue.
+
+    If one can’t be sent, it and the rest of its batch are put back, to be
+    sent by the next run. One which can’t be decoded, or is for a task
+    which doesn’t exist, is moved to DELIVERY_RETRIES_DEAD_LETTER_KEY.
+    """
+    tasks = {task.name: task for task in (deliver_sms, deliver_email)}
+    now = time()
+    while True:
+        retries = redis_store.pop_by_score(
+            DELIVERY_RETRIES_KEY, now, DELIVERY_RETRIES_BATCH_SIZE
+        )
+        for index, retry in enumerate(retries):
+            try:
+                task = json.loads(retry)
+                deliver = tasks[task["task"]]
+                notification_id, task_retries = task["notification_id"], task["retries"]
+            except Exception:
+                # Otherwise it’d be put back, with the rest of its batch,
+                # every run
+                current_app.logger.exception(
+                    f"Could not decode a delivery retry, "
+                    f"moving it to {DELIVERY_RETRIES_DEAD_LETTER_KEY}"
+                )
+                redis_store.rpush(DELIVERY_RETRIES_DEAD_LETTER_KEY, retry)
+                continue
+            try:
+                deliver.apply_async(
+                    [notification_id],
+                    queue=QueueNames.RETRY,
+                    retries=task_retries,
+                    expires=Config.DEFAULT_REDIS_EXPIRE_TIME,
+                )
+            except Exception:
+                current_app.logger.exception(
+                    f"Failed to send delivery retries, putting {len(retries) - index} back"
+                )
+                redis_store.zadd(
+                    DELIVERY_RETRIES_KEY, {retry: now for retry in retries[index:]}
+                )
+                return
+        if len(retries) < DELIVERY_RETRIES_BATCH_SIZE:
+            break
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_sending_status_buffer(**kwargs):
+    # Don’t lose the statuses of notifications which have been sent
+    sending_status_buffer.flush()
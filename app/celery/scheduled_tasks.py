@@ -1,11 +1,13 @@
-import json
 from datetime import datetime, timedelta
+from time import time
 
+from celery.signals import worker_ready
 from flask import current_app
 from sqlalchemy import between, select, union
 from sqlalchemy.exc import SQLAlchemyError
 
 from app import db, notify_celery, redis_store, zendesk_client
+from app.celery import provider_tasks
 from app.celery.tasks import (
     get_recipient_csv_and_template_and_sender_id,
     process_incomplete_jobs,
@@ -37,13 +39,27 @@ from app.dao.services_dao import (
 from app.dao.users_dao import delete_codes_older_created_more_than_a_day_ago
 from app.enums import JobStatus, NotificationType
 from app.models import Job, Notification
-from app.notifications.process_notifications import send_notification_to_queue
+from app.notifications.notification_codec import decode_queued_notification
+from app.notifications.process_notifications import (
+    send_notification_to_queue,
+    serialise_queued_notification,
+)
 from app.utils import utc_now
 from notifications_utils import aware_utcnow
+from notifications_utils.clients.redis import delivery_swept_cache_key
 from notifications_utils.clients.zendesk.zendesk_client import NotifySupportTicket
 
 MAX_NOTIFICATION_FAILS = 10000
 
+# The list which notifications wait on to be inserted by batch-insert-notifications
+MESSAGE_QUEUE_KEY = "message_queue"
+# Where notifications from message_queue which can’t be decoded are kept
+MESSAGE_QUEUE_DEAD_LETTER_KEY = "message_queue-dead-letter"
+MESSAGE_QUEUE_BATCH_SIZE = 10000
+# A batch claimed from message_queue this many seconds ago which hasn’t been
+# released is assumed to have been abandoned by a worker which died
+MESSAGE_QUEUE_CLAIM_TIMEOUT = 300
+
 
 @notify_celery.task(name="run-scheduled-jobs")
 def run_scheduled_jobs():
@@ -170,6 +186,44 @@ def replay_created_notifications():
             send_notification_to_queue(notification=n)
 
 
+@notify_celery.task(name="deliver-created-sms-stragglers")
+def deliver_created_sms_stragglers():
+    """
+    Sends SMS which batch_insert_notifications inserted but didn’t manage to
+    send for delivery, if DELIVER_AFTER_BATCH_INSERT is switched on.
+    replay_created_notifications catches anything older.
+
+    Each notification is only sent once, even if it’s still created next
+    time, because it’s waiting for a retry or for its status to be updated.
+    """
+    if not current_app.config["DELIVER_AFTER_BATCH_INSERT"]:
+        return
+
+    sweep_period = 60 * 60
+    notifications = {
+        delivery_swept_cache_key(n.id): n
+        for n in notifications_not_yet_sent(
+            current_app.config["DELIVERY_SWEEP_AGE"],
+            NotificationType.SMS,
+            newer_than_seconds=sweep_period,
+            include_jobs=not current_app.config["DELIVER_SMS_IN_BATCHES"],
+        )
+    }
+    notifications = [
+        notifications[key]
+        for key in redis_store.set_if_not_exists(
+            list(notifications), "1", ex=sweep_period
+        )
+    ]
+    if notifications:
+        current_app.logger.warning(
+            f"Sending {len(notifications)} SMS notifications which are still created "
+            "to the delivery queue"
+        )
+    for n in notifications:
+        send_notification_to_queue(notification=n)
+
+
 @notify_celery.task(name="check-for-missing-rows-in-completed-jobs")
 def check_for_missing_rows_in_completed_jobs():
 
@@ -268,17 +322,10 @@ def process_delivery_receipts(self):
         cloudwatch.init_app(current_app)
         start_time = aware_utcnow() - timedelta(minutes=3)
         end_time = aware_utcnow()
-        delivered_receipts, failed_receipts = cloudwatch.check_delivery_receipts(
-            start_time, end_time
-        )
-        delivered_receipts = list(delivered_receipts)
-        for i in range(0, len(delivered_receipts), batch_size):
-            batch = delivered_receipts[i : i + batch_size]
-            dao_update_delivery_receipts(batch, True)
-        failed_receipts = list(failed_receipts)
-        for i in range(0, len(failed_receipts), batch_size):
-            batch = failed_receipts[i : i + batch_size]
-            dao_update_delivery_receipts(batch, False)
+        for receipts, delivered in cloudwatch.stream_delivery_receipts(
+            start_time, end_time, batch_size
+        ):
+            dao_update_delivery_receipts(receipts, delivered)
     except Exception as ex:
         retry_count = self.request.retries
         wait_time = 3600 * 2**retry_count
@@ -299,43 +346,73 @@ def cleanup_delivery_receipts(self):
 
 @notify_celery.task(bind=True, name="batch-insert-notifications")
 def batch_insert_notifications(self):
+    """
+    Inserts the notifications waiting on the message_queue list, claiming
+    them in batches of up to MESSAGE_QUEUE_BATCH_SIZE until it’s empty.
+
+    Each batch is moved to a claim list in one round trip, and only
+    released once it’s been inserted (or requeued), so if a worker dies
+    part way through, recover_message_queue_claims puts its batch back on
+    the queue rather than it being lost.
+
+    Where the notification inserter is running (see NotificationInserter)
+    there’s usually nothing left for this to do, but it still inserts
+    anything waiting in case the inserter isn’t running.
+    """
+    while True:
+        claim_key, items = redis_store.claim_list_batch(
+            MESSAGE_QUEUE_KEY, MESSAGE_QUEUE_BATCH_SIZE
+        )
+        if not items:
+            break
+        try:
+            insert_message_queue_batch(items)
+        finally:
+            redis_store.release_list_batch(MESSAGE_QUEUE_KEY, claim_key)
+        if len(items) < MESSAGE_QUEUE_BATCH_SIZE:
+            break
+
+
+def insert_message_queue_batch(items):
+    """
+    Inserts the notifications serialised in `items`, taken from
+    message_queue, and returns the ones which were inserted. If they can’t
+    be inserted they’re put back on the queue, unless they’re stale.
+    """
     batch = []
+    # ids of the notifications to send for delivery once they’re inserted
+    to_deliver = set()
 
-    # TODO We probably need some way to clear the list if
-    # things go haywire.  A command?
-
-    # with redis_store.pipeline():
-    #     while redis_store.llen("message_queue") > 0:
-    #         redis_store.lpop("message_queue")
-    #     current_app.logger.info("EMPTY!")
-    #     return
-    current_len = redis_store.llen("message_queue")
-    with redis_store.pipeline():
-        # since this list is being fed by other processes, just grab what is available when
-        # this call is made and process that.
-
-        count = 0
-        while count < current_len:
-            count = count + 1
-            notification_bytes = redis_store.lpop("message_queue")
-            notification_dict = json.loads(notification_bytes.decode("utf-8"))
-            notification_dict["status"] = notification_dict.pop("notification_status")
+    for notification_bytes in items:
+        try:
+            notification_dict, deliver_after_insert = decode_queued_notification(
+                notification_bytes
+            )
             if not notification_dict.get("created_at"):
                 notification_dict["created_at"] = utc_now()
-            elif isinstance(notification_dict["created_at"], list):
-                notification_dict["created_at"] = notification_dict["created_at"][0]
             notification = Notification(**notification_dict)
-            # notify-api-749 do not write to db
-            # if we have a verify_code we know this is the authentication notification at login time
-            # and not csv (containing PII) provided by the user, so allow verify_code to continue to exist
-            if notification is None:
-                continue
-            if "verify_code" in str(notification.personalisation):
-                pass
-            else:
-                batch.append(notification)
+        except Exception:
+            # Otherwise it’d stop the rest of the batch being inserted, every
+            # time the batch was recovered
+            current_app.logger.exception(
+                f"Could not decode a notification from {MESSAGE_QUEUE_KEY}, "
+                f"moving it to {MESSAGE_QUEUE_DEAD_LETTER_KEY}"
+            )
+            redis_store.rpush(MESSAGE_QUEUE_DEAD_LETTER_KEY, notification_bytes)
+            continue
+        if deliver_after_insert:
+            to_deliver.add(notification.id)
+        # notify-api-749 do not write to db
+        # if we have a verify_code we know this is the authentication notification at login time
+        # and not csv (containing PII) provided by the user, so allow verify_code to continue to exist
+        if notification is None:
+            continue
+        if "verify_code" in str(notification.personalisation):
+            pass
+        else:
+            batch.append(notification)
     try:
-        dao_batch_insert_notifications(batch)
+        inserted = dao_batch_insert_notifications(batch)
     except Exception:
         current_app.logger.exception("Notification batch insert failed")
         for n in batch:
@@ -349,4 +426,46 @@ def batch_insert_notifications(self):
                 )
                 continue
             else:
-                redis_store.rpush("message_queue", json.dumps(n.serialize_for_redis(n)))
+                redis_store.rpush(
+                    MESSAGE_QUEUE_KEY,
+                    serialise_queued_notification(n, n.id in to_deliver),
+                )
+        return []
+    else:
+        # Anything that doesn’t get sent here will be sent by
+        # deliver_created_sms_stragglers. Notifications which were already
+        # there, from a batch that’s been recovered or requeued, may already
+        # be being delivered, so aren’t sent again.
+        for n in batch:
+            if n.id in to_deliver and str(n.id) in inserted:
+                try:
+                    provider_tasks.deliver_sms.apply_async(
+                        [str(n.id)], queue=QueueNames.SEND_SMS
+                    )
+                except Exception:
+                    current_app.logger.exception(
+                        f"Could not send notification {n.id} for delivery"
+                    )
+        return batch
+
+
+@notify_celery.task(name="recover-message-queue-claims")
+def recover_message_queue_claims():
+    """
+    Puts batches claimed from message_queue more than
+    MESSAGE_QUEUE_CLAIM_TIMEOUT seconds ago, which were never released
+    because the worker inserting them died, back on the queue. Some of them
+    may have been inserted already, so they can be inserted more than once.
+    """
+    recovered = redis_store.recover_list_batches(
+        MESSAGE_QUEUE_KEY, time() - MESSAGE_QUEUE_CLAIM_TIMEOUT
+    )
+    if recovered:
+        current_app.logger.warning(
+            f"Recovered {recovered} notifications claimed from {MESSAGE_QUEUE_KEY} but never inserted"
+        )
+
+
+@worker_ready.connect
+def recover_message_queue_claims_on_startup(**kwargs):
+    recover_message_queue_claims.apply_async(queue=QueueNames.PERIODIC)
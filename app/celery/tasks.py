@@ -256,6 +256,12 @@ def save_sms(self, service_id, notification_id, encrypted_notification, sender_i
             # up retrying because IntegrityError is a subclass of SQLAlchemyError
             return
 
+        if saved_notification.already_existed:
+            current_app.logger.warning(
+                f"{NotificationType.SMS}: {notification_id} already exists."
+            )
+            return
+
         # Kick off sns process in provider_tasks.py
         sn = saved_notification
         current_app.logger.info(
@@ -263,9 +269,15 @@ def save_sms(self, service_id, notification_id, encrypted_notification, sender_i
                 f"Deliver sms for job_id: {sn.job_id} row_number: {sn.job_row_number}"
             )
         )
-        provider_tasks.deliver_sms.apply_async(
-            [str(saved_notification.id)], queue=QueueNames.SEND_SMS, countdown=60
-        )
+        if (
+            not (current_app.config["DELIVER_SMS_IN_BATCHES"] and sn.job_id)
+            and not sn.deliver_after_insert
+        ):
+            # Otherwise deliver-sms-batches or batch-insert-notifications
+            # will send it
+            provider_tasks.deliver_sms.apply_async(
+                [str(saved_notification.id)], queue=QueueNames.SEND_SMS, countdown=60
+            )
 
         current_app.logger.debug(
             f"SMS {saved_notification.id} created at {saved_notification.created_at} "
@@ -301,7 +313,6 @@ def save_email(
             "Email {} failed as restricted service".format(notification_id)
         )
         return
-    original_notification = get_notification(notification_id)
     try:
         saved_notification = persist_notification(
             template_id=notification["template"],
@@ -319,7 +330,17 @@ def save_email(
             reply_to_text=reply_to_text,
         )
         # we only want to send once
-        if original_notification is None:
+        if saved_notification.already_existed:
+            current_app.logger.warning(
+                f"{NotificationType.EMAIL}: {notification_id} already exists."
+            )
+            return
+
+        # if it’s from a job and we’re delivering in batches
+        # deliver-email-batches will pick it up
+        if not (
+            current_app.config["DELIVER_EMAIL_IN_BATCHES"] and saved_notification.job_id
+        ):
             provider_tasks.deliver_email.apply_async(
                 [str(saved_notification.id)], queue=QueueNames.SEND_EMAIL
             )
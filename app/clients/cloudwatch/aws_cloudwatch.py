@@ -46,10 +46,10 @@ class AwsCloudwatchClient(Client):
     def is_localstack(self):
         return self._is_localstack
 
-    def _get_log(self, log_group_name, start, end):
-        # Check all cloudwatch logs from the time the notification was sent (currently 5 minutes previously) until now
+    def _get_log_pages(self, log_group_name, start, end):
+        # Check all cloudwatch logs from the time the notification was sent (currently 5 minutes previously) until now,
+        # yielding the events a page at a time so the next page is only fetched once they’ve been dealt with
         next_token = None
-        all_log_events = []
 
         while True:
             if next_token:
@@ -65,12 +65,10 @@ class AwsCloudwatchClient(Client):
                     startTime=int(start.timestamp() * 1000),
                     endTime=int(end.timestamp() * 1000),
                 )
-            log_events = response.get("events", [])
-            all_log_events.extend(log_events)
+            yield response.get("events", [])
             next_token = response.get("nextToken")
             if not next_token:
                 break
-        return all_log_events
 
     def warn_if_dev_is_opted_out(self, provider_response, notification_id):
         if (
@@ -165,34 +163,55 @@ class AwsCloudwatchClient(Client):
     # that filter_log_events.  But we are blocked by a permissions issue in the broker.
     # So for now, use filter_log_events and grab all log_events over a 10 minute interval,
     # and run this on a schedule.
-    def check_delivery_receipts(self, start, end):
+    def stream_delivery_receipts(self, start, end, batch_size):
+        """
+        Yields `(receipts, delivered)` for the delivered and then the failed
+        SMS delivery receipts between `start` and `end`, in batches of up to
+        `batch_size` receipts in the form dao_update_delivery_receipts
+        expects. Batches are yielded as soon as they fill up, while the log
+        is still being paged through, so only a page of events and a batch
+        of receipts are held at once however many there are.
+
+        Receipts are deduplicated by message id within a batch. One which is
+        logged more than once can still be in two batches, which just
+        updates its notification twice.
+        """
         region = cloud_config.sns_region
         account_number = self._extract_account_number(cloud_config.ses_domain_arn)
-        log_group_name = f"sns/{region}/{account_number[4]}/DirectPublishToPhoneNumber"
-        delivered_event_set = self._get_receipts(log_group_name, start, end)
-        current_app.logger.info(
-            (f"Delivered message count: {len(delivered_event_set)}")
+        base_log_group_name = (
+            f"sns/{region}/{account_number[4]}/DirectPublishToPhoneNumber"
         )
-        log_group_name = (
-            f"sns/{region}/{account_number[4]}/DirectPublishToPhoneNumber/Failure"
-        )
-        failed_event_set = self._get_receipts(log_group_name, start, end)
-        current_app.logger.info((f"Failed message count: {len(failed_event_set)}"))
-
-        return delivered_event_set, failed_event_set
-
-    def _get_receipts(self, log_group_name, start, end):
-        event_set = set()
-        all_events = self._get_log(log_group_name, start, end)
-        for event in all_events:
-            try:
-                actual_event = self.event_to_db_format(event["message"])
-                event_set.add(json.dumps(actual_event))
-            except Exception:
-                current_app.logger.exception(
-                    f"Could not format delivery receipt {event} for db insert"
-                )
-        return event_set
+        for log_group_name, delivered in (
+            (base_log_group_name, True),
+            (f"{base_log_group_name}/Failure", False),
+        ):
+            count = 0
+            for receipts in self._get_receipt_batches(
+                log_group_name, start, end, batch_size
+            ):
+                count += len(receipts)
+                yield receipts, delivered
+            current_app.logger.info(
+                f"{'Delivered' if delivered else 'Failed'} message count: {count}"
+            )
+
+    def _get_receipt_batches(self, log_group_name, start, end, batch_size):
+        batch = {}
+        for events in self._get_log_pages(log_group_name, start, end):
+            for event in events:
+                try:
+                    receipt = self.event_to_db_format(event["message"])
+                except Exception:
+                    current_app.logger.exception(
+                        f"Could not format delivery receipt {event} for db insert"
+                    )
+                    continue
+                batch[receipt["notification.messageId"]] = receipt
+                if len(batch) == batch_size:
+                    yield list(batch.values())
+                    batch = {}
+        if batch:
+            yield list(batch.values())
 
     def _aws_value_or_default(self, event, top_level, second_level):
         if event.get(top_level) is None or event[top_level].get(second_level) is None:
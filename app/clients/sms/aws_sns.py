@@ -9,6 +9,7 @@ from boto3 import client
 from app.clients import AWS_CLIENT_CONFIG
 from app.clients.sms import SmsClient
 from app.cloudfoundry_config import cloud_config
+from notifications_utils.recipients import PhoneNumber
 
 
 class AwsSnsClient(SmsClient):
@@ -48,14 +49,21 @@ class AwsSnsClient(SmsClient):
 
     def send_sms(self, to, content, reference, sender=None, international=False):
         matched = False
-        if "+" not in to:
-            to = f"+{to}"
+        if isinstance(to, PhoneNumber):
+            # Already parsed, so there’s no need to search it for numbers
+            numbers = [to.e164]
+        else:
+            if "+" not in to:
+                to = f"+{to}"
+            numbers = (
+                phonenumbers.format_number(
+                    match.number, phonenumbers.PhoneNumberFormat.E164
+                )
+                for match in phonenumbers.PhoneNumberMatcher(to, None)
+            )
 
-        for match in phonenumbers.PhoneNumberMatcher(to, None):
+        for to in numbers:
             matched = True
-            to = phonenumbers.format_number(
-                match.number, phonenumbers.PhoneNumberFormat.E164
-            )
 
             # See documentation
             # https://docs.aws.amazon.com/sns/latest/dg/sms_publish-to-phone.html#sms_publish_sdk
@@ -2,9 +2,12 @@ import csv
 import functools
 import itertools
 import secrets
+import signal
+import timeit
 import uuid
 from datetime import datetime, timedelta
 from os import getenv
+from time import monotonic
 
 import click
 import flask
@@ -12,7 +15,7 @@ from click_datetime import Datetime as click_dt
 from faker import Faker
 from flask import current_app, json
 from notifications_python_client.authentication import create_jwt_token
-from sqlalchemy import and_, select, text, update
+from sqlalchemy import TIMESTAMP, and_, case, cast, delete, select, text, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -25,6 +28,10 @@ from app.dao.annual_billing_dao import (
     set_default_free_allowance_for_service,
 )
 from app.dao.jobs_dao import dao_get_job_by_id
+from app.dao.notifications_dao import (
+    dao_batch_insert_notifications,
+    dao_update_delivery_receipts,
+)
 from app.dao.organization_dao import (
     dao_add_service_to_organization,
     dao_get_organization_by_email_address,
@@ -57,10 +64,17 @@ from app.models import (
     TemplateHistory,
     User,
 )
+from app.notifications.notification_codec import (
+    decode_queued_notification,
+    encode_queued_notification,
+)
+from app.notifications.notification_inserter import notification_inserter
 from app.utils import utc_now
 from notifications_utils.recipients import RecipientCSV
+from notifications_utils.sms_segments import get_sms_fragment_counts
 from notifications_utils.template import SMSMessageTemplate
 from tests.app.db import (
+    create_api_key,
     create_job,
     create_notification,
     create_organization,
@@ -481,25 +495,32 @@ def fix_billable_units():
     )
     all = db.session.execute(stmt).scalars().all()
 
+    # Render every message, fetching each template version once, then count
+    # their fragments together
+    templates = {}
+    messages = []
     for notification in all:
-        template_model = dao_get_template_by_id(
-            notification.template_id, notification.template_version
+        version = (notification.template_id, notification.template_version)
+        if version not in templates:
+            templates[version] = dao_get_template_by_id(*version).__dict__
+        messages.append(
+            SMSMessageTemplate(
+                templates[version],
+                values=notification.personalisation,
+                prefix=notification.service.name,
+                show_prefix=notification.service.prefix_sms,
+            ).content_with_placeholders_filled_in
         )
 
-        template = SMSMessageTemplate(
-            template_model.__dict__,
-            values=notification.personalisation,
-            prefix=notification.service.name,
-            show_prefix=notification.service.prefix_sms,
-        )
+    for notification, billable_units in zip(all, get_sms_fragment_counts(messages)):
         current_app.logger.info(
-            f"Updating notification: {notification.id} with {template.fragment_count} billable_units"
+            f"Updating notification: {notification.id} with {billable_units} billable_units"
         )
 
         stmt = (
             update(Notification)
             .where(Notification.id == notification.id)
-            .values({"billable_units": template.fragment_count})
+            .values({"billable_units": billable_units})
         )
         db.session.execute(stmt)
     db.session.commit()
@@ -789,6 +810,17 @@ def _update_template(id, name, template_type, content, subject):
     db.session.commit()
 
 
+@notify_command(name="run-notification-inserter")
+def run_notification_inserter():
+    """
+    Inserts notifications from message_queue as they arrive, until it’s
+    stopped, see NotificationInserter.
+    """
+    signal.signal(signal.SIGTERM, lambda *args: notification_inserter.stop())
+    signal.signal(signal.SIGINT, lambda *args: notification_inserter.stop())
+    notification_inserter.run()
+
+
 @notify_command(name="clear-redis-list")
 @click.option("-n", "--name_of_list", required=True)
 def clear_redis_list(name_of_list):
@@ -1000,6 +1032,253 @@ def add_test_notifications_to_db(generate):  # pragma: no cover
         current_app.logger.info(f"{num} {notification.id} created")
 
 
+# compare inserting batches of notifications with the ORM and with COPY
+@notify_command(name="benchmark-batch-insert")
+@click.option(
+    "-r",
+    "--rows",
+    multiple=True,
+    type=int,
+    default=[1000, 10000, 50000],
+    help="Batch sizes to insert, can be given more than once",
+)
+def benchmark_batch_insert(rows):  # pragma: no cover
+    if getenv("NOTIFY_ENVIRONMENT", "") not in ["development", "test"]:
+        current_app.logger.error("Can only be run in development")
+        return
+
+    service = create_service(check_if_service_exists=True)
+    template = create_template(service=service)
+
+    def make_batch(size):
+        return [
+            Notification(
+                id=uuid.uuid4(),
+                to=fake.numerify("+1202#######"),
+                service_id=service.id,
+                template_id=template.id,
+                template_version=template.version,
+                notification_type=template.template_type,
+                key_type=KeyType.NORMAL,
+                status=NotificationStatus.CREATED,
+                created_at=utc_now(),
+                billable_units=1,
+            )
+            for _ in range(size)
+        ]
+
+    def bulk_save_objects(batch):
+        db.session.bulk_save_objects(batch)
+        db.session.commit()
+
+    for size in rows:
+        for name, insert in (
+            ("bulk_save_objects", bulk_save_objects),
+            ("COPY", dao_batch_insert_notifications),
+        ):
+            batch = make_batch(size)
+            start = monotonic()
+            insert(batch)
+            elapsed = monotonic() - start
+            print(  # noqa
+                f"{name}: {size} rows in {elapsed:.2f}s ({size / elapsed:.0f} rows per second)"
+            )
+            if name == "COPY":
+                start = monotonic()
+                inserted = len(dao_batch_insert_notifications(batch))
+                print(  # noqa
+                    f"COPY retry: {inserted} of {size} rows inserted in {monotonic() - start:.2f}s"
+                )
+            db.session.execute(
+                delete(Notification).where(Notification.template_id == template.id)
+            )
+            db.session.commit()
+
+
+# compare updating notifications from delivery receipts with CASE expressions
+# and with UPDATE … FROM (VALUES …)
+@notify_command(name="benchmark-delivery-receipts")
+@click.option(
+    "-r",
+    "--receipts",
+    multiple=True,
+    type=int,
+    default=[10000, 100000],
+    help="Numbers of receipts to update with, can be given more than once",
+)
+def benchmark_delivery_receipts(receipts):  # pragma: no cover
+    if getenv("NOTIFY_ENVIRONMENT", "") not in ["development", "test"]:
+        current_app.logger.error("Can only be run in development")
+        return
+
+    service = create_service(check_if_service_exists=True)
+    template = create_template(service=service)
+
+    def case_update(batch):
+        def by_message_id(key):
+            return case(
+                *[
+                    (Notification.message_id == r["notification.messageId"], r[key])
+                    for r in batch
+                ]
+            )
+
+        db.session.execute(
+            update(Notification)
+            .where(
+                Notification.message_id.in_(
+                    [r["notification.messageId"] for r in batch]
+                )
+            )
+            .values(
+                carrier=by_message_id("delivery.phoneCarrier"),
+                status=NotificationStatus.DELIVERED,
+                sent_at=cast(by_message_id("@timestamp"), TIMESTAMP),
+                provider_response=by_message_id("delivery.providerResponse"),
+                message_cost=by_message_id("delivery.priceInUSD"),
+            )
+        )
+        db.session.commit()
+
+    for size in receipts:
+        notifications = [
+            Notification(
+                id=uuid.uuid4(),
+                to="1",
+                service_id=service.id,
+                template_id=template.id,
+                template_version=template.version,
+                notification_type=template.template_type,
+                key_type=KeyType.NORMAL,
+                status=NotificationStatus.SENDING,
+                created_at=utc_now(),
+                billable_units=1,
+                message_id=str(uuid.uuid4()),
+            )
+            for _ in range(size)
+        ]
+        dao_batch_insert_notifications(notifications)
+        batch = [
+            {
+                "notification.messageId": notification.message_id,
+                "delivery.phoneCarrier": "Verizon",
+                "delivery.providerResponse": "Phone accepted msg",
+                "@timestamp": str(utc_now()),
+                "delivery.priceInUSD": 0.00881,
+            }
+            for notification in notifications
+        ]
+        for name, update_receipts in (
+            ("CASE", case_update),
+            ("UPDATE FROM VALUES", lambda b: dao_update_delivery_receipts(b, True)),
+        ):
+            start = monotonic()
+            update_receipts(batch)
+            elapsed = monotonic() - start
+            print(  # noqa
+                f"{name}: {size} receipts in {elapsed:.2f}s ({size / elapsed:.0f} per second)"
+            )
+        db.session.execute(
+            delete(Notification).where(Notification.template_id == template.id)
+        )
+        db.session.commit()
+
+
+# compare queueing notifications as JSON and in the binary encoding
+@notify_command(name="benchmark-notification-codec")
+@click.option("-n", "--number", type=int, default=100000)
+def benchmark_notification_codec(number):  # pragma: no cover
+    if getenv("NOTIFY_ENVIRONMENT", "") not in ["development", "test"]:
+        current_app.logger.error("Can only be run in development")
+        return
+
+    notification = Notification(
+        id=uuid.uuid4(),
+        to="+12028675309",
+        normalised_to="12028675309",
+        job_id=uuid.uuid4(),
+        job_row_number=1,
+        service_id=uuid.uuid4(),
+        template_id=uuid.uuid4(),
+        template_version=1,
+        key_type=KeyType.NORMAL,
+        billable_units=1,
+        notification_type=NotificationType.SMS,
+        created_at=utc_now(),
+        status=NotificationStatus.CREATED,
+        personalisation={"name": fake.name()},
+        international=False,
+        phone_prefix="1",
+        rate_multiplier=1.0,
+        reply_to_text="+18005550100",
+    )
+
+    def encode_json():
+        return json.dumps(notification.serialize_for_redis(notification)).encode()
+
+    def encode_binary():
+        return encode_queued_notification(notification)
+
+    for name, encode in (("JSON", encode_json), ("binary", encode_binary)):
+        encoded = encode()
+        encode_time = timeit.timeit(encode, number=number) / number
+        decode_time = (
+            timeit.timeit(
+                lambda encoded=encoded: decode_queued_notification(encoded),
+                number=number,
+            )
+            / number
+        )
+        print(  # noqa
+            f"{name}: {len(encoded)} bytes, {encode_time * 1e6:.1f}µs to encode, "
+            f"{decode_time * 1e6:.1f}µs to decode"
+        )
+
+
+@notify_command(name="benchmark-post-sms")
+@click.option("-n", "--number", type=int, default=1000)
+def benchmark_post_sms(number):  # pragma: no cover
+    """
+    Times POST /v2/notifications/sms, sending to a new service, with and
+    without QUEUE_API_SMS_WITHOUT_MODEL. Needs QUEUE_NOTIFICATIONS_IN_BINARY
+    switched on.
+    """
+    if getenv("NOTIFY_ENVIRONMENT", "") not in ["development", "test"]:
+        current_app.logger.error("Can only be run in development")
+        return
+
+    service = create_service(
+        service_name=f"Benchmark service {uuid.uuid4()}",
+        message_limit=number * 2,
+        total_message_limit=number * 2,
+    )
+    template = create_template(service)
+    api_key = create_api_key(service)
+    client = current_app.test_client()
+
+    def post_sms():
+        token = create_jwt_token(secret=api_key.secret, client_id=str(service.id))
+        start_time = monotonic()
+        response = client.post(
+            "/v2/notifications/sms",
+            json={"phone_number": "+12028675309", "template_id": str(template.id)},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        elapsed = monotonic() - start_time
+        if response.status_code != 201:
+            raise Exception(response.get_data(as_text=True))
+        return elapsed
+
+    for without_model in (False, True):
+        current_app.config["QUEUE_API_SMS_WITHOUT_MODEL"] = without_model
+        times = sorted(post_sms() for _ in range(number))
+        print(  # noqa
+            f"QUEUE_API_SMS_WITHOUT_MODEL={without_model}: "
+            f"p50 {times[len(times) // 2] * 1000:.2f}ms, "
+            f"p99 {times[int(len(times) * 0.99)] * 1000:.2f}ms"
+        )
+
+
 # generate n number of test users into the dev DB
 @notify_command(name="add-test-users-to-db")
 @click.option("-g", "--generate", required=True, prompt=True, default="1")
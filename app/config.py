@@ -117,6 +117,20 @@ class Config(object):
     SMS_PROVIDER_RESTING_POINTS = {
         "sns": 100,
     }
+    EMAIL_PROVIDER_RESTING_POINTS = {
+        "ses": 100,
+    }
+    # A provider isn’t used for PROVIDER_CIRCUIT_BREAKER_RESET_TIME seconds
+    # after PROVIDER_CIRCUIT_BREAKER_FAILURES failed sends in a row, where sends
+    # which take longer than PROVIDER_SLOW_RESPONSE_TIME seconds count as
+    # failures, see ProviderRouter
+    PROVIDER_CIRCUIT_BREAKER_FAILURES = int(
+        getenv("PROVIDER_CIRCUIT_BREAKER_FAILURES", 5)
+    )
+    PROVIDER_CIRCUIT_BREAKER_RESET_TIME = float(
+        getenv("PROVIDER_CIRCUIT_BREAKER_RESET_TIME", 30)
+    )
+    PROVIDER_SLOW_RESPONSE_TIME = float(getenv("PROVIDER_SLOW_RESPONSE_TIME", 5))
 
     # Zendesk
     ZENDESK_API_KEY = getenv("ZENDESK_API_KEY")
@@ -131,6 +145,82 @@ class Config(object):
     # Antivirus
     ANTIVIRUS_ENABLED = getenv("ANTIVIRUS_ENABLED", "1") == "1"
 
+    # Messages per second that can be sent, across all workers, through each
+    # provider, e.g. {"sns": 20, "ses": 14}, and through each SMS origination
+    # number, e.g. {"+18445550100": 3}. SMS_SENDER_SEND_RATE applies to numbers
+    # without their own rate. Anything unset isn’t limited
+    PROVIDER_SEND_RATES = json.loads(getenv("PROVIDER_SEND_RATES", "{}"))
+    SMS_SENDER_SEND_RATES = json.loads(getenv("SMS_SENDER_SEND_RATES", "{}"))
+    SMS_SENDER_SEND_RATE = float(getenv("SMS_SENDER_SEND_RATE", 0))
+    # How many seconds of sending at those rates can be saved up and sent at once
+    SEND_RATE_BURST_SECONDS = float(getenv("SEND_RATE_BURST_SECONDS", 1))
+    # How many seconds to wait for capacity to send before giving up, so the
+    # message is retried later rather than holding on to the worker
+    SEND_CAPACITY_MAX_WAIT = float(getenv("SEND_CAPACITY_MAX_WAIT", 5))
+
+    # Spread SMS from any of a service’s numbers across all of them, and SMS
+    # from senders which aren’t numbers across PLATFORM_SMS_SENDER_POOL, so
+    # that large jobs aren’t limited by the send rate of one number. Each
+    # service’s senders are cached for SMS_SENDER_POOL_CACHE_TTL seconds
+    SPREAD_SMS_ACROSS_SENDERS = getenv("SPREAD_SMS_ACROSS_SENDERS", "0") == "1"
+    PLATFORM_SMS_SENDER_POOL = json.loads(getenv("PLATFORM_SMS_SENDER_POOL", "[]"))
+    SMS_SENDER_POOL_CACHE_TTL = int(getenv("SMS_SENDER_POOL_CACHE_TTL", 60))
+
+    # Send SMS which are written to the database by batch-insert-notifications
+    # for delivery as soon as they’re inserted, and everything else as soon as
+    # it’s persisted, instead of a minute later. SMS which are still created
+    # after DELIVERY_SWEEP_AGE seconds are sent again by
+    # deliver-created-sms-stragglers
+    DELIVER_AFTER_BATCH_INSERT = getenv("DELIVER_AFTER_BATCH_INSERT", "0") == "1"
+    DELIVERY_SWEEP_AGE = int(getenv("DELIVERY_SWEEP_AGE", 600))
+
+    # Queue SMS notifications to be inserted in a compact binary encoding, see
+    # app.notifications.notification_codec, rather than as JSON. Either can
+    # be inserted, so switch this on once every worker can decode it
+    QUEUE_NOTIFICATIONS_IN_BINARY = getenv("QUEUE_NOTIFICATIONS_IN_BINARY", "0") == "1"
+    # With that switched on, queue SMS sent through the API straight from the
+    # request, without building a Notification
+    QUEUE_API_SMS_WITHOUT_MODEL = getenv("QUEUE_API_SMS_WITHOUT_MODEL", "0") == "1"
+
+    # How the notification inserter process (flask command
+    # run-notification-inserter) batches notifications from message_queue: up
+    # to NOTIFICATION_INSERTER_BATCH_SIZE at once, waiting at most
+    # NOTIFICATION_INSERTER_WINDOW seconds for a batch to fill up
+    NOTIFICATION_INSERTER_BATCH_SIZE = int(
+        getenv("NOTIFICATION_INSERTER_BATCH_SIZE", 1000)
+    )
+    NOTIFICATION_INSERTER_WINDOW = float(getenv("NOTIFICATION_INSERTER_WINDOW", 0.05))
+
+    # Mark notifications as sending in batches after they’ve been sent to the
+    # provider, rather than with an UPDATE each, see SendingStatusBuffer
+    BUFFER_SENDING_STATUS_UPDATES = getenv("BUFFER_SENDING_STATUS_UPDATES", "0") == "1"
+    SENDING_STATUS_BUFFER_SIZE = int(getenv("SENDING_STATUS_BUFFER_SIZE", 200))
+    SENDING_STATUS_BUFFER_MAX_AGE = float(getenv("SENDING_STATUS_BUFFER_MAX_AGE", 1))
+
+    # Schedule retries of deliver_sms and deliver_email in redis, for the
+    # move-due-delivery-retries task to send when they’re due, instead of as
+    # tasks with a countdown. Retries are spread out by up to
+    # DELIVERY_RETRY_JITTER seconds
+    RETRY_DELIVERIES_FROM_REDIS = getenv("RETRY_DELIVERIES_FROM_REDIS", "0") == "1"
+    DELIVERY_RETRY_JITTER = float(getenv("DELIVERY_RETRY_JITTER", 30))
+
+    # Send SMS from jobs with the deliver-sms-batches task instead of one
+    # deliver_sms task per notification
+    DELIVER_SMS_IN_BATCHES = getenv("DELIVER_SMS_IN_BATCHES", "0") == "1"
+    SMS_DELIVERY_BATCH_SIZE = int(getenv("SMS_DELIVERY_BATCH_SIZE", 500))
+    SMS_DELIVERY_CONCURRENCY = int(getenv("SMS_DELIVERY_CONCURRENCY", 20))
+    # The same for email. Concurrency should stay within the SES client’s
+    # connection pool (max_pool_connections in AWS_CLIENT_CONFIG)
+    DELIVER_EMAIL_IN_BATCHES = getenv("DELIVER_EMAIL_IN_BATCHES", "0") == "1"
+    EMAIL_DELIVERY_BATCH_SIZE = int(getenv("EMAIL_DELIVERY_BATCH_SIZE", 500))
+    EMAIL_DELIVERY_CONCURRENCY = int(getenv("EMAIL_DELIVERY_CONCURRENCY", 20))
+    # Notifications claimed by a batch which still haven’t been sent after
+    # DELIVERY_CLAIM_TIMEOUT seconds, because the worker died, are put back to
+    # be claimed again by release-abandoned-delivery-claims. Notifications a
+    # batch put back after failing to send them aren’t claimed again for as
+    # long, which leaves them to their deliver_sms or deliver_email retry
+    DELIVERY_CLAIM_TIMEOUT = int(getenv("DELIVERY_CLAIM_TIMEOUT", 900))
+
     SENDING_NOTIFICATIONS_TIMEOUT_PERIOD = 259200  # 3 days
     INVITATION_EXPIRATION_DAYS = 2
     TEST_MESSAGE_FILENAME = "Test message"
@@ -226,6 +316,31 @@ class Config(object):
                 "schedule": 10.0,
                 "options": {"queue": QueueNames.PERIODIC},
             },
+            "recover-message-queue-claims": {
+                "task": "recover-message-queue-claims",
+                "schedule": timedelta(minutes=5),
+                "options": {"queue": QueueNames.PERIODIC},
+            },
+            "deliver-sms-batches": {
+                "task": "deliver-sms-batches",
+                "schedule": 5.0,
+                "options": {"queue": QueueNames.SEND_SMS},
+            },
+            "release-abandoned-delivery-claims": {
+                "task": "release-abandoned-delivery-claims",
+                "schedule": timedelta(minutes=5),
+                "options": {"queue": QueueNames.PERIODIC},
+            },
+            "move-due-delivery-retries": {
+                "task": "move-due-delivery-retries",
+                "schedule": 10.0,
+                "options": {"queue": QueueNames.PERIODIC},
+            },
+            "deliver-email-batches": {
+                "task": "deliver-email-batches",
+                "schedule": 5.0,
+                "options": {"queue": QueueNames.SEND_EMAIL},
+            },
             "expire-or-delete-invitations": {
                 "task": "expire-or-delete-invitations",
                 "schedule": timedelta(minutes=66),
@@ -241,6 +356,11 @@ class Config(object):
                 "schedule": crontab(minute="*/10"),
                 "options": {"queue": QueueNames.PERIODIC},
             },
+            "deliver-created-sms-stragglers": {
+                "task": "deliver-created-sms-stragglers",
+                "schedule": crontab(),
+                "options": {"queue": QueueNames.PERIODIC},
+            },
             "replay-created-notifications": {
                 "task": "replay-created-notifications",
                 "schedule": crontab(minute="0, 15, 30, 45"),
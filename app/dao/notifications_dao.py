@@ -1,3 +1,4 @@
+import io
 import json
 import os
 from datetime import datetime, timedelta
@@ -6,18 +7,26 @@ from time import time
 from flask import current_app
 from sqlalchemy import (
     TIMESTAMP,
+    Float,
+    Integer,
+    String,
     asc,
     cast,
+    column,
     delete,
     desc,
     func,
+    inspect,
     or_,
     select,
     text,
     union,
     update,
+    values,
 )
-from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import joinedload, make_transient_to_detached
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import functions
 from sqlalchemy.sql.expression import case
@@ -26,9 +35,13 @@ from werkzeug.datastructures import MultiDict
 from app import create_uuid, db
 from app.dao.dao_utils import autocommit
 from app.dao.inbound_sms_dao import Pagination
-from app.dao.jobs_dao import dao_get_job_by_id
 from app.enums import KeyType, NotificationStatus, NotificationType
-from app.models import FactNotificationStatus, Notification, NotificationHistory
+from app.models import (
+    FactNotificationStatus,
+    Job,
+    Notification,
+    NotificationHistory,
+)
 from app.utils import (
     emit_job_update_summary,
     escape_special_characters,
@@ -78,6 +91,12 @@ def dao_notification_exists(notification_id) -> bool:
 
 @autocommit
 def dao_create_notification(notification):
+    """
+    Inserts a notification with INSERT ... ON CONFLICT (id) DO NOTHING, so
+    that a task which is delivered twice, even at the same time, doesn’t
+    insert it twice. Returns whether it was inserted, or False if a
+    notification with its id already existed.
+    """
     if not notification.id:
         # need to populate defaulted fields before we create the notification history object
         notification.id = create_uuid()
@@ -96,35 +115,52 @@ def dao_create_notification(notification):
     notification.to = "1"
     notification.normalised_to = "1"
 
-    # notify-api-1454 insert only if it doesn't exist
-    if not dao_notification_exists(notification.id):
-        db.session.add(notification)
-        # There have been issues with invites expiring.
-        # Ensure the created at value is set and debug.
-        if notification.notification_type == "email":
-            orig_time = notification.created_at
-            now_time = utc_now()
+    # There have been issues with invites expiring.
+    # Ensure the created at value is set and debug.
+    if notification.notification_type == "email":
+        orig_time = notification.created_at
+        now_time = utc_now()
+        try:
+            diff_time = now_time - orig_time
+        except TypeError:
             try:
-                diff_time = now_time - orig_time
-            except TypeError:
-                try:
-                    orig_time = datetime.strptime(orig_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-                except ValueError:
-                    orig_time = datetime.strptime(orig_time, "%Y-%m-%d")
-                diff_time = now_time - orig_time
+                orig_time = datetime.strptime(orig_time, "%Y-%m-%dT%H:%M:%S.%fZ")
+            except ValueError:
+                orig_time = datetime.strptime(orig_time, "%Y-%m-%d")
+            diff_time = now_time - orig_time
+        current_app.logger.error(
+            f"dao_create_notification orig created at: {orig_time} and now created at: {now_time}"
+        )
+        if diff_time.total_seconds() > 300:
             current_app.logger.error(
-                f"dao_create_notification orig created at: {orig_time} and now created at: {now_time}"
+                "Something is wrong with notification.created_at in email!"
             )
-            if diff_time.total_seconds() > 300:
+            if os.getenv("NOTIFY_ENVIRONMENT") not in ["test"]:
+                notification.created_at = now_time
+                notification.updated_at = now_time
                 current_app.logger.error(
-                    "Something is wrong with notification.created_at in email!"
+                    f"Email notification created_at reset to   {notification.created_at}"
                 )
-                if os.getenv("NOTIFY_ENVIRONMENT") not in ["test"]:
-                    notification.created_at = now_time
-                    dao_update_notification(notification)
-                    current_app.logger.error(
-                        f"Email notification created_at reset to   {notification.created_at}"
-                    )
+
+    # Otherwise it’d be flushed before the insert
+    if notification in db.session:
+        db.session.expunge(notification)
+
+    # notify-api-1454 insert only if it doesn't exist
+    inserted_id = db.session.execute(
+        postgresql.insert(Notification.__table__)
+        .values(_notification_values(notification))
+        .on_conflict_do_nothing(index_elements=[Notification.id])
+        .returning(Notification.id)
+    ).scalar()
+    if inserted_id is None:
+        return False
+
+    # Add it to the session as if it had been inserted by the ORM, so its
+    # relationships load and later changes to it are saved
+    make_transient_to_detached(notification)
+    db.session.add(notification)
+    return True
 
 
 def country_records_delivery(phone_prefix):
@@ -168,6 +204,16 @@ def update_notification_message_id(notification_id, message_id):
     db.session.commit()
 
 
+def update_notification_reference(notification_id, reference):
+    stmt = (
+        update(Notification)
+        .where(Notification.id == notification_id)
+        .values(reference=reference)
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+
 @autocommit
 def update_notification_status_by_id(
     notification_id, status, sent_by=None, provider_response=None, carrier=None
@@ -615,6 +661,219 @@ def dao_timeout_notifications(cutoff_time, limit=100000):
     return notifications
 
 
+def dao_claim_created_notifications_from_jobs(notification_type, limit):
+    """
+    Claims up to `limit` notifications of `notification_type` from jobs which
+    are waiting to be sent, oldest first, by moving them from created to sending in a single
+    statement. `SKIP LOCKED` means workers claiming at the same time get
+    different notifications, and anything that only sends created
+    notifications will leave these ones alone.
+
+    Notifications updated in the last DELIVERY_CLAIM_TIMEOUT seconds, which
+    a batch put back to created to be retried, are left to the retry.
+    """
+    claimable = (
+        select(Notification.id)
+        .where(
+            Notification.status == NotificationStatus.CREATED,
+            Notification.notification_type == notification_type,
+            Notification.key_type == KeyType.NORMAL,
+            Notification.job_id.isnot(None),
+            Notification.message_id.is_(None),
+            or_(
+                Notification.updated_at.is_(None),
+                Notification.updated_at < _delivery_claim_cutoff(),
+            ),
+        )
+        .order_by(Notification.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(Notification)
+        .where(Notification.id.in_(claimable.scalar_subquery()))
+        .values(status=NotificationStatus.SENDING, updated_at=utc_now())
+        .returning(Notification)
+        .execution_options(synchronize_session=False)
+    )
+    notifications = db.session.execute(stmt).scalars().all()
+    for notification in notifications:
+        # Keep what we’ve loaded, rather than reading each notification
+        # again when it’s expired by the commit
+        db.session.expunge(notification)
+    db.session.commit()
+    return notifications
+
+
+@autocommit
+def dao_release_abandoned_delivery_claims():
+    """
+    Puts notifications from jobs which were claimed by
+    `dao_claim_created_notifications_from_jobs` more than
+    DELIVERY_CLAIM_TIMEOUT seconds ago, but never recorded as sent, back to
+    created, to be claimed again. That happens when a worker dies in the
+    middle of a batch.
+
+    Returns how many notifications were put back.
+    """
+    stmt = (
+        update(Notification)
+        .where(
+            Notification.status == NotificationStatus.SENDING,
+            Notification.sent_at.is_(None),
+            Notification.key_type == KeyType.NORMAL,
+            Notification.job_id.isnot(None),
+            Notification.updated_at < _delivery_claim_cutoff(),
+        )
+        # Keep updated_at as it is, so they can be claimed straight away
+        .values(status=NotificationStatus.CREATED, updated_at=Notification.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
+def _delivery_claim_cutoff():
+    return utc_now() - timedelta(seconds=current_app.config["DELIVERY_CLAIM_TIMEOUT"])
+
+
+@autocommit
+def dao_update_sent_sms_notifications(sent_notifications):
+    """
+    Records the provider, message id and billable units of SMS notifications
+    which have been handed to the provider, in a single
+    `UPDATE … FROM (VALUES …)` statement.
+
+    `sent_notifications` is a list of
+    `(notification_id, message_id, billable_units, sent_by)` tuples.
+    """
+    if not sent_notifications:
+        return 0
+
+    sent = values(
+        column("id", UUID(as_uuid=True)),
+        column("message_id", String),
+        column("billable_units", Integer),
+        column("sent_by", String),
+        name="sent",
+    ).data(sent_notifications)
+    now = utc_now()
+    stmt = (
+        update(Notification)
+        .where(Notification.id == sent.c.id)
+        .values(
+            message_id=sent.c.message_id,
+            billable_units=sent.c.billable_units,
+            sent_by=sent.c.sent_by,
+            sent_at=now,
+            updated_at=now,
+            # notify-api-742 remove phone numbers from db
+            to="1",
+            normalised_to="1",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
+@autocommit
+def dao_update_sent_email_notifications(sent_notifications):
+    """
+    Records the provider and reference of email notifications which have been
+    handed to the provider, like `dao_update_sent_sms_notifications`.
+
+    `sent_notifications` is a list of `(notification_id, reference, sent_by)`
+    tuples.
+    """
+    if not sent_notifications:
+        return 0
+
+    sent = values(
+        column("id", UUID(as_uuid=True)),
+        column("reference", String),
+        column("sent_by", String),
+        name="sent",
+    ).data(sent_notifications)
+    now = utc_now()
+    stmt = (
+        update(Notification)
+        .where(Notification.id == sent.c.id)
+        .values(
+            reference=sent.c.reference,
+            sent_by=sent.c.sent_by,
+            sent_at=now,
+            updated_at=now,
+            to="1",
+            normalised_to="1",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
+@autocommit
+def dao_update_notifications_to_sending(sent_notifications):
+    """
+    Does what `update_notification_to_sending` does for each of
+    `sent_notifications`, in a single `UPDATE … FROM (VALUES …)` statement.
+    Notifications which have already reached a final status, for example
+    because a delivery receipt got there first, keep it.
+
+    `sent_notifications` is a list of
+    `(notification_id, sent_at, sent_by, billable_units)` tuples, where
+    billable_units can be None to leave it as it is. The provider’s reference
+    or message id is written as soon as the message is sent, with
+    `update_notification_reference` or `update_notification_message_id`.
+    """
+    if not sent_notifications:
+        return 0
+
+    sent = values(
+        column("id", UUID(as_uuid=True)),
+        column("sent_at", TIMESTAMP),
+        column("sent_by", String),
+        column("billable_units", Integer),
+        name="sent",
+    ).data(sent_notifications)
+    stmt = (
+        update(Notification)
+        .where(Notification.id == sent.c.id)
+        .values(
+            status=case(
+                (
+                    Notification.status.in_(NotificationStatus.completed_types()),
+                    Notification.status,
+                ),
+                else_=NotificationStatus.SENDING,
+            ),
+            sent_at=sent.c.sent_at,
+            sent_by=sent.c.sent_by,
+            billable_units=func.coalesce(
+                sent.c.billable_units, Notification.billable_units
+            ),
+            updated_at=utc_now(),
+            # notify-api-742 remove phone numbers from db
+            to="1",
+            normalised_to="1",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
+@autocommit
+def dao_update_notification_statuses_by_id(notification_ids, status):
+    if not notification_ids:
+        return 0
+
+    stmt = (
+        update(Notification)
+        .where(Notification.id.in_(notification_ids))
+        .values(status=status, updated_at=utc_now())
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount
+
+
 @autocommit
 def dao_update_notifications_by_reference(references, update_dict):
     stmt = (
@@ -762,14 +1021,28 @@ def dao_get_last_notification_added_for_job_id(job_id):
     return last_notification_added
 
 
-def notifications_not_yet_sent(should_be_sending_after_seconds, notification_type):
+def notifications_not_yet_sent(
+    should_be_sending_after_seconds,
+    notification_type,
+    newer_than_seconds=None,
+    include_jobs=True,
+):
     older_than_date = utc_now() - timedelta(seconds=should_be_sending_after_seconds)
 
     stmt = select(Notification).where(
         Notification.created_at <= older_than_date,
         Notification.notification_type == notification_type,
         Notification.status == NotificationStatus.CREATED,
+        # Sent, but its status hasn’t been written yet (see
+        # SendingStatusBuffer)
+        Notification.message_id.is_(None),
     )
+    if newer_than_seconds is not None:
+        stmt = stmt.where(
+            Notification.created_at > utc_now() - timedelta(seconds=newer_than_seconds)
+        )
+    if not include_jobs:
+        stmt = stmt.where(Notification.job_id.is_(None))
     notifications = db.session.execute(stmt).scalars().all()
     return notifications
 
@@ -836,80 +1109,68 @@ def get_service_ids_with_notifications_on_date(notification_type, date):
 
 
 def dao_update_delivery_receipts(receipts, delivered):
+    """
+    Records SMS delivery receipts, in a single `UPDATE … FROM (VALUES …)`
+    statement joined on message id, and emits an update for each job the
+    notifications are from.
+
+    `receipts` are dicts, or the same as JSON, in the form
+    AwsCloudwatchClient.event_to_db_format returns them. `delivered` is
+    whether they’re receipts for delivered or failed messages.
+    """
     start_time_millis = time() * 1000
-    new_receipts = []
+    rows = {}
     for r in receipts:
         if isinstance(r, str):
             r = json.loads(r)
-        new_receipts.append(r)
-
-    receipts = new_receipts
-    id_to_carrier = {
-        r["notification.messageId"]: r["delivery.phoneCarrier"] for r in receipts
-    }
-    id_to_provider_response = {
-        r["notification.messageId"]: r["delivery.providerResponse"] for r in receipts
-    }
-    id_to_timestamp = {r["notification.messageId"]: r["@timestamp"] for r in receipts}
+        rows[r["notification.messageId"]] = (
+            r["notification.messageId"],
+            r["delivery.phoneCarrier"],
+            r["delivery.providerResponse"],
+            r["@timestamp"],
+            float(r["delivery.priceInUSD"]),
+        )
+    if not rows:
+        return
 
-    id_to_message_cost = {
-        r["notification.messageId"]: r["delivery.priceInUSD"] for r in receipts
-    }
     status_to_update_with = NotificationStatus.DELIVERED
     if not delivered:
         status_to_update_with = NotificationStatus.FAILED
 
+    received = values(
+        column("message_id", String),
+        column("carrier", String),
+        column("provider_response", String),
+        column("sent_at", String),
+        column("message_cost", Float),
+        name="received",
+    ).data(list(rows.values()))
     stmt = (
         update(Notification)
-        .where(Notification.message_id.in_(id_to_carrier.keys()))
+        .where(Notification.message_id == received.c.message_id)
         .values(
-            carrier=case(
-                *[
-                    (Notification.message_id == key, value)
-                    for key, value in id_to_carrier.items()
-                ]
-            ),
+            carrier=received.c.carrier,
             status=status_to_update_with,
-            sent_at=case(
-                *[
-                    (Notification.message_id == key, cast(value, TIMESTAMP))
-                    for key, value in id_to_timestamp.items()
-                ]
-            ),
-            provider_response=case(
-                *[
-                    (Notification.message_id == key, value)
-                    for key, value in id_to_provider_response.items()
-                ]
-            ),
-            message_cost=case(
-                *[
-                    (Notification.message_id == key, value)
-                    for key, value in id_to_message_cost.items()
-                ]
-            ),
+            sent_at=cast(received.c.sent_at, TIMESTAMP),
+            provider_response=received.c.provider_response,
+            message_cost=received.c.message_cost,
         )
+        .returning(Notification.job_id)
+        .execution_options(synchronize_session=False)
     )
-    db.session.execute(stmt)
+    job_ids = set(db.session.execute(stmt).scalars().all())
     db.session.commit()
     elapsed_time = (time() * 1000) - start_time_millis
     current_app.logger.info(
         f"#loadtestperformance batch update query time: \
-        updated {len(receipts)} notification in {elapsed_time} ms"
-    )
-    job_ids = (
-        db.session.execute(
-            select(Notification.job_id).where(
-                Notification.message_id.in_(id_to_carrier.keys())
-            )
-        )
-        .scalars()
-        .all()
+        updated {len(rows)} notification in {elapsed_time} ms"
     )
 
-    for job_id in set(job_ids):
-        job = dao_get_job_by_id(job_id)
-        emit_job_update_summary(job)
+    job_ids.discard(None)
+    if job_ids:
+        jobs = db.session.execute(select(Job).where(Job.id.in_(job_ids))).scalars()
+        for job in jobs:
+            emit_job_update_summary(job)
 
 
 def dao_close_out_delivery_receipts():
@@ -931,8 +1192,88 @@ def dao_close_out_delivery_receipts():
         )
 
 
+# The attribute and column of every column of notifications, in the order
+# they’re copied in by dao_batch_insert_notifications
+_NOTIFICATION_COLUMNS = [
+    (attr.key, attr.columns[0]) for attr in inspect(Notification).column_attrs
+]
+
+
+def _copy_value(value):
+    # Postgres’s COPY text format, see https://www.postgresql.org/docs/current/sql-copy.html
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _notification_values(notification):
+    # Columns which aren’t set get their defaults from the insert
+    values = notification.__dict__
+    return {
+        table_column.name: values[key]
+        for key, table_column in _NOTIFICATION_COLUMNS
+        if key in values
+    }
+
+
+def _notification_copy_row(notification):
+    values = notification.__dict__
+    row = []
+    for key, table_column in _NOTIFICATION_COLUMNS:
+        if key in values:
+            value = values[key]
+        elif table_column.default is not None and table_column.default.is_scalar:
+            value = table_column.default.arg
+        elif table_column.default is not None and table_column.default.is_callable:
+            value = table_column.default.arg(None)
+        else:
+            value = None
+        row.append(_copy_value(value))
+    return "\t".join(row) + "\n"
+
+
 def dao_batch_insert_notifications(batch):
-    db.session.bulk_save_objects(batch)
+    """
+    Inserts a batch of notifications by streaming them into a temporary
+    table with COPY, then into notifications with one INSERT … SELECT.
+    Notifications which are already there are skipped, so a batch that’s
+    retried after it was inserted isn’t inserted twice.
+
+    Returns the ids, as strings, of the notifications which were inserted.
+    """
+    if not batch:
+        return set()
+
+    columns = ", ".join(
+        f'"{table_column.name}"' for _, table_column in _NOTIFICATION_COLUMNS
+    )
+    rows = io.StringIO("".join(_notification_copy_row(n) for n in batch))
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE notifications_batch (LIKE notifications) ON COMMIT DROP"
+        )
+        cursor.copy_expert(f"COPY notifications_batch ({columns}) FROM STDIN", rows)
+        cursor.execute(
+            f"INSERT INTO notifications ({columns}) SELECT {columns} FROM notifications_batch "
+            "ON CONFLICT DO NOTHING RETURNING id"
+        )
+        inserted = {str(notification_id) for (notification_id,) in cursor.fetchall()}
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        cursor.close()
     db.session.commit()
-    current_app.logger.info(f"Batch inserted notifications: {len(batch)}")
-    return len(batch)
+    current_app.logger.info(
+        f"Batch inserted notifications: {len(inserted)} of {len(batch)}"
+    )
+    return inserted
@@ -0,0 +1,48 @@
+from threading import Lock
+
+from cachetools import TTLCache
+
+from app import redis_store
+from app.dao.email_branding_dao import dao_get_email_branding_by_id
+from notifications_utils.clients.redis import email_branding_version_cache_key
+
+
+class EmailBrandingCache:
+    """
+    Email brandings, serialised, cached in-process for a minute so they
+    aren’t queried for every email. Call `invalidate` when a branding
+    changes. That bumps a version number for the branding in redis, which
+    every process checks when it looks the branding up, so they all stop
+    using the old one. If redis is disabled, other processes carry on using
+    it until it expires from their cache.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._brandings = TTLCache(maxsize=1024, ttl=60)
+
+    def get(self, email_branding_id):
+        email_branding_id = str(email_branding_id)
+        version = redis_store.get(email_branding_version_cache_key(email_branding_id))
+        with self._lock:
+            cached = self._brandings.get(email_branding_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        branding = dao_get_email_branding_by_id(email_branding_id).serialize()
+        with self._lock:
+            self._brandings[email_branding_id] = (version, branding)
+        return branding
+
+    def invalidate(self, email_branding_id):
+        email_branding_id = str(email_branding_id)
+        with self._lock:
+            self._brandings.pop(email_branding_id, None)
+        redis_store.incr(email_branding_version_cache_key(email_branding_id))
+
+    def clear(self):
+        with self._lock:
+            self._brandings.clear()
+
+
+email_branding_cache = EmailBrandingCache()
@@ -0,0 +1,142 @@
+import random
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+
+from flask import current_app
+
+# How many of each provider’s most recent sends its health is measured over
+HEALTH_WINDOW = 100
+# Latency below this doesn’t make a provider any more likely to be chosen
+LATENCY_FLOOR = 0.05
+
+
+class ProviderHealth:
+    """
+    The latency and outcome of a provider’s recent sends, and a circuit
+    breaker which opens after PROVIDER_CIRCUIT_BREAKER_FAILURES failures in a
+    row, where sends slower than PROVIDER_SLOW_RESPONSE_TIME count as
+    failures. While it’s open the provider isn’t chosen, until
+    PROVIDER_CIRCUIT_BREAKER_RESET_TIME seconds later, when one send is let
+    through to find out if it has recovered.
+    """
+
+    def __init__(self):
+        self.sends = deque(maxlen=HEALTH_WINDOW)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record(self, latency, failed, config):
+        failed = failed or latency > config["PROVIDER_SLOW_RESPONSE_TIME"]
+        self.sends.append((latency, failed))
+        self.trial_started_at = None
+        if failed:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= config["PROVIDER_CIRCUIT_BREAKER_FAILURES"]:
+                self.opened_at = monotonic()
+        else:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def available(self, config):
+        if self.opened_at is None:
+            return True
+        now = monotonic()
+        if now - self.opened_at < config["PROVIDER_CIRCUIT_BREAKER_RESET_TIME"]:
+            return False
+        # Half open, so one send at a time is let through
+        return (
+            self.trial_started_at is None
+            or now - self.trial_started_at >= config["PROVIDER_SLOW_RESPONSE_TIME"]
+        )
+
+    def chosen(self):
+        if self.opened_at is not None:
+            self.trial_started_at = monotonic()
+
+    @property
+    def error_rate(self):
+        if not self.sends:
+            return 0
+        return sum(failed for _, failed in self.sends) / len(self.sends)
+
+    def latency(self, percentile=50):
+        if not self.sends:
+            return None
+        latencies = sorted(latency for latency, _ in self.sends)
+        return latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+
+
+class ProviderRouter:
+    """
+    Chooses which provider client to send each message through, from those
+    which are active, using the weights in SMS_PROVIDER_RESTING_POINTS or
+    EMAIL_PROVIDER_RESTING_POINTS. Each weight is divided by the provider’s
+    median latency, so that a slow provider is used less, and providers
+    whose circuit breaker is open aren’t used at all (see ProviderHealth).
+
+    Health is measured in each process, from the sends wrapped in `measure`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._health = {}
+
+    def health(self, provider_name):
+        with self._lock:
+            return self._health.setdefault(provider_name, ProviderHealth())
+
+    def choose(self, providers, weights):
+        config = current_app.config
+        with self._lock:
+            available = [
+                provider
+                for provider in providers
+                if self._health.setdefault(provider.name, ProviderHealth()).available(
+                    config
+                )
+            ]
+            # If every circuit is open, sending and failing is no worse than not
+            # sending at all
+            candidates = available or providers
+            effective_weights = [
+                weights.get(provider.name, 0)
+                / max(self._health[provider.name].latency() or 0, LATENCY_FLOOR)
+                for provider in candidates
+            ]
+            if any(effective_weights):
+                chosen = random.choices(candidates, weights=effective_weights)[0]
+            else:
+                chosen = candidates[0]
+            self._health[chosen.name].chosen()
+        return chosen
+
+    @contextmanager
+    def measure(self, provider_name, ignore=()):
+        """
+        Records how long the send in the block took, and whether it failed.
+        Exceptions in `ignore` are about the message, not the provider, so
+        don’t count as failures.
+        """
+        config = current_app.config
+        start_time = monotonic()
+        try:
+            yield
+        except ignore:
+            self._record(provider_name, monotonic() - start_time, False, config)
+            raise
+        except Exception:
+            self._record(provider_name, monotonic() - start_time, True, config)
+            raise
+        self._record(provider_name, monotonic() - start_time, False, config)
+
+    def _record(self, provider_name, latency, failed, config):
+        with self._lock:
+            self._health.setdefault(provider_name, ProviderHealth()).record(
+                latency, failed, config
+            )
+
+
+provider_router = ProviderRouter()
@@ -1,6 +1,11 @@
+import itertools
 import json
 import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
+from functools import partial
+from time import monotonic, sleep
 from urllib import parse
 
 from cachetools import TTLCache, cached
@@ -15,24 +20,45 @@ from app import (
 )
 from app.aws.s3 import get_personalisation_from_s3, get_phone_number_from_s3
 from app.celery.test_key_tasks import send_email_response, send_sms_response
-from app.dao.email_branding_dao import dao_get_email_branding_by_id
+from app.clients.email import EmailClientNonRetryableException
+from app.clients.email.aws_ses import AwsSesClientThrottlingSendRateException
 from app.dao.notifications_dao import (
     dao_update_notification,
+    dao_update_notification_statuses_by_id,
+    dao_update_sent_email_notifications,
+    dao_update_sent_sms_notifications,
     update_notification_message_id,
+    update_notification_reference,
 )
 from app.dao.provider_details_dao import get_provider_details_by_notification_type
-from app.dao.service_sms_sender_dao import dao_get_sms_senders_by_service_id
+from app.delivery.email_branding_cache import email_branding_cache
+from app.delivery.provider_router import provider_router
+from app.delivery.sending_status_buffer import sending_status_buffer
+from app.delivery.sms_sender_pool import sms_sender_pool
 from app.enums import BrandType, KeyType, NotificationStatus, NotificationType
-from app.exceptions import NotificationTechnicalFailureException
+from app.exceptions import (
+    NotificationTechnicalFailureException,
+    SendCapacityTimeoutException,
+)
 from app.serialised_models import SerialisedService, SerialisedTemplate
 from app.utils import hilite, utc_now
-from notifications_utils.clients.redis import total_limit_cache_key
+from notifications_utils.clients.redis import (
+    send_rate_cache_key,
+    total_limit_cache_key,
+)
+from notifications_utils.recipients import InvalidPhoneError, PhoneNumber
 from notifications_utils.template import (
     HTMLEmailTemplate,
     PlainTextEmailTemplate,
     SMSMessageTemplate,
 )
 
+SEND_CAPACITY_POLL_INTERVAL = 0.1
+
+# Where each wait_for_send_capacity starts in its senders, so that messages are
+# spread across them when none of them are limited
+_sender_turns = itertools.count()
+
 
 def send_sms_to_provider(notification):
     """Final step in the message send flow.
@@ -89,38 +115,13 @@ def send_sms_to_provider(notification):
                 # Therefore we pull all the data from our DB models into `send_sms_kwargs`now before
                 # closing the session (as otherwise it would be reopened immediately)
 
-                # We start by trying to get the phone number from a job in s3.  If we fail, we assume
-                # the phone number is for the verification code on login, which is not a job.
-                recipient = None
-                # It is our 2facode, maybe
-                recipient = _get_verify_code(notification)
-                if recipient is None:
-                    recipient = get_phone_number_from_s3(
-                        notification.service_id,
-                        notification.job_id,
-                        notification.job_row_number,
-                    )
-
-                # TODO This is temporary to test the capability of validating phone numbers
-                # The future home of the validation is TBD
-                _experimentally_validate_phone_numbers(recipient)
-
-                # TODO current we allow US phone numbers to be uploaded without the country code (1)
-                # This will break certain international phone numbers (Norway, Denmark, East Timor)
-                # When we officially announce support for international numbers, US numbers must contain
-                # their country code.
-                recipient = str(recipient)
-                if len(recipient) == 10:
-                    if os.getenv("NOTIFY_ENVIRONMENT") not in [
-                        "test"
-                    ]:  # we want to test intl support
-                        recipient = f"1{recipient}"
+                recipient = _get_sms_recipient(notification)
 
                 sender_numbers = get_sender_numbers(notification)
-                if notification.reply_to_text not in sender_numbers:
-                    raise ValueError(
-                        f"{notification.reply_to_text} not in {sender_numbers} #notify-debug-admin-1701"
-                    )
+                _check_sender_number(notification, sender_numbers)
+                senders = sms_sender_pool.numbers_for(
+                    service.id, notification.reply_to_text
+                )
 
                 send_sms_kwargs = {
                     "to": recipient,
@@ -130,15 +131,21 @@ def send_sms_to_provider(notification):
                     "international": notification.international,
                 }
                 db.session.close()  # no commit needed as no changes to objects have been made above
-                real_sender_number = notification.reply_to_text
+                send_sms_kwargs["sender"] = wait_for_send_capacity(
+                    provider.name, senders
+                )
+                real_sender_number = send_sms_kwargs["sender"]
                 # interleave spaces to bypass PII scrubbing since sender number is not PII
                 arr = list(real_sender_number)
                 real_sender_number = " ".join(arr)
                 current_app.logger.info(
                     f"#notify-debug-api-1701 real sender number going to AWS is {real_sender_number}"
                 )
-                message_id = provider.send_sms(**send_sms_kwargs)
+                with provider_router.measure(provider.name):
+                    message_id = provider.send_sms(**send_sms_kwargs)
 
+                # Delivery receipts look notifications up by their message id,
+                # and can arrive before a buffered status update is written
                 update_notification_message_id(notification.id, message_id)
             except Exception as e:
                 n = notification
@@ -154,7 +161,14 @@ def send_sms_to_provider(notification):
                 msg = f"Send to AWS!!! for job_id {n.job_id} row_number {n.job_row_number} message_id {message_id}"
                 current_app.logger.info(hilite(msg))
                 notification.billable_units = template.fragment_count
-                update_notification_to_sending(notification, provider)
+                if current_app.config["BUFFER_SENDING_STATUS_UPDATES"]:
+                    sending_status_buffer.add(
+                        notification.id,
+                        provider.name,
+                        billable_units=notification.billable_units,
+                    )
+                else:
+                    update_notification_to_sending(notification, provider)
 
                 cache_key = total_limit_cache_key(service.id)
                 redis_store.incr(cache_key)
@@ -162,6 +176,394 @@ def send_sms_to_provider(notification):
     return message_id
 
 
+def send_sms_batch_to_provider(notifications, max_workers):
+    """
+    Sends SMS notifications which have been claimed for delivery (see
+    `dao_claim_created_notifications_from_jobs`).
+
+    Everything that needs the database or S3 is done first, one
+    notification at a time, then the session is closed and up to
+    `max_workers` messages are published to the provider at once. The
+    results are written back with one statement for the notifications
+    which were sent and one for each kind of failure.
+
+    Notifications which failed in a way that might not happen again go back
+    to created, for the caller to retry with deliver_sms.
+
+    Returns the number of notifications sent and the ids of those to retry.
+    """
+    services = {}
+    sender_numbers = {}
+    technical_failures = []
+    to_retry = []
+    to_send = []
+
+    for notification in notifications:
+        try:
+            if notification.service_id not in services:
+                services[notification.service_id] = SerialisedService.from_id(
+                    notification.service_id
+                )
+                sender_numbers[notification.service_id] = get_sender_numbers(
+                    notification
+                )
+            service = services[notification.service_id]
+            if not service.active:
+                technical_failures.append(notification.id)
+                continue
+
+            notification.personalisation = get_personalisation_from_s3(
+                notification.service_id,
+                notification.job_id,
+                notification.job_row_number,
+            )
+            template = SMSMessageTemplate(
+                SerialisedTemplate.from_id_and_service_id(
+                    template_id=notification.template_id,
+                    service_id=service.id,
+                    version=notification.template_version,
+                ).__dict__,
+                values=notification.personalisation,
+                prefix=service.name,
+                show_prefix=service.prefix_sms,
+            )
+            _check_sender_number(notification, sender_numbers[service.id])
+            to_send.append(
+                (
+                    notification,
+                    provider_to_use(NotificationType.SMS, notification.international),
+                    template.fragment_count,
+                    sms_sender_pool.numbers_for(service.id, notification.reply_to_text),
+                    {
+                        "to": _get_sms_recipient(notification),
+                        "content": str(template),
+                        "reference": str(notification.id),
+                        "sender": notification.reply_to_text,
+                        "international": notification.international,
+                    },
+                )
+            )
+        except Exception:
+            current_app.logger.exception(
+                f"SMS notification delivery for id: {notification.id} failed"
+            )
+            to_retry.append(notification.id)
+
+    # We don’t want to hold a database connection open while we wait on the
+    # provider, see `send_sms_to_provider`
+    db.session.close()
+
+    results = _send_concurrently(
+        [
+            (provider.name, senders, partial(provider.send_sms, **kwargs))
+            for _, provider, _, senders, kwargs in to_send
+        ],
+        max_workers,
+    )
+
+    sent = []
+    sent_per_service = Counter()
+    for (notification, provider, billable_units, _, _), result in zip(to_send, results):
+        if isinstance(result, SendCapacityTimeoutException):
+            current_app.logger.warning(
+                f"SMS notification {notification.id} had no capacity to send"
+            )
+            to_retry.append(notification.id)
+            continue
+        if isinstance(result, Exception):
+            current_app.logger.error(
+                f"SMS notification delivery for id: {notification.id} failed",
+                exc_info=result,
+            )
+            to_retry.append(notification.id)
+            continue
+        sent.append((notification.id, result, billable_units, provider.name))
+        sent_per_service[notification.service_id] += 1
+
+    dao_update_sent_sms_notifications(sent)
+    dao_update_notification_statuses_by_id(
+        technical_failures, NotificationStatus.TECHNICAL_FAILURE
+    )
+    dao_update_notification_statuses_by_id(to_retry, NotificationStatus.CREATED)
+
+    for service_id, count in sent_per_service.items():
+        redis_store.incrby(total_limit_cache_key(service_id), count)
+
+    return len(sent), to_retry
+
+
+def send_email_batch_to_provider(notifications, max_workers):
+    """
+    Sends email notifications which have been claimed for delivery (see
+    `dao_claim_created_notifications_from_jobs`), in the same way as
+    `send_sms_batch_to_provider`.
+
+    Emails which SES throttled, or which failed in a way that might not
+    happen again, go back to created for the caller to retry with
+    deliver_email, which waits before sending them so SES gets a rest.
+
+    Returns the number of notifications sent and the ids of those to retry.
+    """
+    services = {}
+    html_email_options = {}
+    technical_failures = []
+    to_retry = []
+    to_send = []
+
+    email_contexts = _get_email_contexts(notifications)
+    for notification, email_context in zip(notifications, email_contexts):
+        try:
+            if notification.service_id not in services:
+                service = SerialisedService.from_id(notification.service_id)
+                services[notification.service_id] = service
+                html_email_options[notification.service_id] = get_html_email_options(
+                    service
+                )
+            service = services[notification.service_id]
+            if not service.active:
+                technical_failures.append(notification.id)
+                continue
+
+            recipient = _set_email_context(notification, email_context)
+
+            template_dict = SerialisedTemplate.from_id_and_service_id(
+                template_id=notification.template_id,
+                service_id=service.id,
+                version=notification.template_version,
+            ).__dict__
+            html_email = HTMLEmailTemplate(
+                template_dict,
+                values=notification.personalisation,
+                **html_email_options[service.id],
+            )
+            plain_text_email = PlainTextEmailTemplate(
+                template_dict, values=notification.personalisation
+            )
+            to_send.append(
+                (
+                    notification,
+                    provider_to_use(NotificationType.EMAIL, False),
+                    {
+                        "source": (
+                            f'"{service.name}" <{service.email_from}@'
+                            f'{current_app.config["NOTIFY_EMAIL_DOMAIN"]}>'
+                        ),
+                        "to_addresses": recipient,
+                        "subject": plain_text_email.subject,
+                        "body": str(plain_text_email),
+                        "html_body": html_email.render_in_shell(
+                            formatter=remove_brackets
+                        ),
+                        "reply_to_address": notification.reply_to_text,
+                    },
+                )
+            )
+        except Exception:
+            current_app.logger.exception(
+                f"Email notification delivery for id: {notification.id} failed"
+            )
+            to_retry.append(notification.id)
+
+    db.session.close()
+
+    results = _send_concurrently(
+        [
+            (provider.name, (None,), partial(provider.send_email, **kwargs))
+            for _, provider, kwargs in to_send
+        ],
+        max_workers,
+    )
+
+    sent = []
+    for (notification, provider, _), result in zip(to_send, results):
+        if isinstance(result, AwsSesClientThrottlingSendRateException):
+            current_app.logger.warning(
+                f"Email notification {notification.id} was rate limited by SES"
+            )
+            to_retry.append(notification.id)
+        elif isinstance(result, SendCapacityTimeoutException):
+            current_app.logger.warning(
+                f"Email notification {notification.id} had no capacity to send"
+            )
+            to_retry.append(notification.id)
+        elif isinstance(result, EmailClientNonRetryableException):
+            current_app.logger.error(
+                f"Email notification {notification.id} failed", exc_info=result
+            )
+            technical_failures.append(notification.id)
+        elif isinstance(result, Exception):
+            current_app.logger.error(
+                f"Email notification {notification.id} failed", exc_info=result
+            )
+            to_retry.append(notification.id)
+        else:
+            sent.append((notification.id, result, provider.name))
+
+    dao_update_sent_email_notifications(sent)
+    dao_update_notification_statuses_by_id(
+        technical_failures, NotificationStatus.TECHNICAL_FAILURE
+    )
+    dao_update_notification_statuses_by_id(to_retry, NotificationStatus.CREATED)
+
+    return len(sent), to_retry
+
+
+def _send_concurrently(sends, max_workers):
+    """
+    Calls each of `sends`, a list of `(provider_name, senders, send)`, on a
+    pool of up to `max_workers` threads, which share the provider client’s
+    connection pool. Sends are only started once there’s capacity for them
+    from one of their `senders` (see `take_send_capacity`), which is taken
+    for as many at once as possible, spread evenly across the senders. When
+    there’s more than one, `send` is called with the `sender` it was given
+    capacity from. Each send is measured for `provider_router`. Returns what
+    each one returned, or the exception it raised, in the same order.
+
+    Sends which don’t get capacity within SEND_CAPACITY_MAX_WAIT seconds
+    aren’t started, and return a SendCapacityTimeoutException.
+    """
+    app = current_app._get_current_object()
+    deadline = monotonic() + current_app.config["SEND_CAPACITY_MAX_WAIT"]
+
+    def call(provider_name, send):
+        with app.app_context():
+            try:
+                with provider_router.measure(
+                    provider_name, ignore=EmailClientNonRetryableException
+                ):
+                    return send()
+            except Exception as e:
+                return e
+
+    waiting = defaultdict(list)
+    for index, (provider_name, senders, _) in enumerate(sends):
+        waiting[(provider_name, senders)].append(index)
+
+    futures = [None] * len(sends)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting:
+            for (provider_name, senders), indexes in list(waiting.items()):
+                for position, sender in enumerate(senders):
+                    # Ask for an even share of what’s left from each sender
+                    share = -(-len(indexes) // (len(senders) - position))
+                    taken = take_send_capacity(provider_name, share, sender)
+                    for index in indexes[:taken]:
+                        send = sends[index][2]
+                        if len(senders) > 1:
+                            send = partial(send, sender=sender)
+                        futures[index] = executor.submit(call, provider_name, send)
+                    indexes = indexes[taken:]
+                if indexes:
+                    waiting[(provider_name, senders)] = indexes
+                else:
+                    del waiting[(provider_name, senders)]
+            if waiting:
+                if monotonic() >= deadline:
+                    break
+                sleep(SEND_CAPACITY_POLL_INTERVAL)
+        timed_out = SendCapacityTimeoutException(
+            f"No capacity to send within {current_app.config['SEND_CAPACITY_MAX_WAIT']}s"
+        )
+        return [timed_out if future is None else future.result() for future in futures]
+
+
+def take_send_capacity(provider_name, requested, sender=None):
+    """
+    Takes capacity to send up to `requested` messages through
+    `provider_name`, and through `sender` for SMS, from token buckets shared
+    by every worker, so that together they stay within PROVIDER_SEND_RATES
+    and SMS_SENDER_SEND_RATES. Returns how many messages can be sent now.
+    """
+    config = current_app.config
+    rates = {
+        send_rate_cache_key(provider_name): config["PROVIDER_SEND_RATES"].get(
+            provider_name
+        )
+    }
+    if sender:
+        rates[send_rate_cache_key(provider_name, sender)] = config[
+            "SMS_SENDER_SEND_RATES"
+        ].get(sender, config["SMS_SENDER_SEND_RATE"])
+    buckets = {
+        key: (rate, max(1, rate * config["SEND_RATE_BURST_SECONDS"]))
+        for key, rate in rates.items()
+        if rate
+    }
+    return redis_store.take_tokens(buckets, requested)
+
+
+def wait_for_send_capacity(provider_name, senders=(None,)):
+    """
+    Waits until there’s capacity to send a message through `provider_name`
+    from one of `senders`, and returns that sender. Raises
+    SendCapacityTimeoutException, so the message is retried, if there isn’t
+    any within SEND_CAPACITY_MAX_WAIT seconds.
+    """
+    max_wait = current_app.config["SEND_CAPACITY_MAX_WAIT"]
+    deadline = monotonic() + max_wait
+    start = next(_sender_turns)
+    while True:
+        for position in range(len(senders)):
+            sender = senders[(start + position) % len(senders)]
+            if take_send_capacity(provider_name, 1, sender):
+                return sender
+        if monotonic() >= deadline:
+            raise SendCapacityTimeoutException(
+                f"No capacity to send through {provider_name} within {max_wait}s"
+            )
+        sleep(SEND_CAPACITY_POLL_INTERVAL)
+
+
+def _get_sms_recipient(notification):
+    # We start by trying to get the phone number from a job in s3.  If we fail, we assume
+    # the phone number is for the verification code on login, which is not a job.
+    recipient = None
+    # It is our 2facode, maybe
+    recipient = _get_verify_code(notification)
+    if recipient is None:
+        recipient = get_phone_number_from_s3(
+            notification.service_id,
+            notification.job_id,
+            notification.job_row_number,
+        )
+
+    # TODO This is temporary to test the capability of validating phone numbers
+    # The future home of the validation is TBD
+    _experimentally_validate_phone_numbers(recipient)
+
+    # TODO current we allow US phone numbers to be uploaded without the country code (1)
+    # This will break certain international phone numbers (Norway, Denmark, East Timor)
+    # When we officially announce support for international numbers, US numbers must contain
+    # their country code.
+    recipient = str(recipient)
+    if len(recipient) == 10:
+        if os.getenv("NOTIFY_ENVIRONMENT") not in [
+            "test"
+        ]:  # we want to test intl support
+            recipient = f"1{recipient}"
+    return _parse_sms_recipient(recipient)
+
+
+def _parse_sms_recipient(recipient):
+    # The number was validated when the notification was created, so it only
+    # needs parsing, once, here rather than the provider client searching the
+    # recipient for it. Anything that can’t be parsed is left for the client to
+    # deal with, as it always has been.
+    try:
+        return PhoneNumber.from_validated(
+            recipient if "+" in recipient else f"+{recipient}"
+        )
+    except InvalidPhoneError:
+        return recipient
+
+
+def _check_sender_number(notification, sender_numbers):
+    if notification.reply_to_text not in sender_numbers:
+        raise ValueError(
+            f"{notification.reply_to_text} not in {sender_numbers} #notify-debug-admin-1701"
+        )
+
+
 def _experimentally_validate_phone_numbers(recipient):
     if "+" not in recipient:
         recipient_lookup = f"+{recipient}"
@@ -183,23 +585,18 @@ def _get_verify_code(notification):
 
 
 def get_sender_numbers(notification):
-    possible_senders = dao_get_sms_senders_by_service_id(notification.service_id)
-    sender_numbers = []
-    for possible_sender in possible_senders:
-        sender_numbers.append(possible_sender.sms_sender)
-    return sender_numbers
+    sender_numbers = sms_sender_pool.senders(notification.service_id)
+    if notification.reply_to_text not in sender_numbers:
+        # The sender might have been added since the service’s senders were cached
+        sms_sender_pool.invalidate(notification.service_id)
+        sender_numbers = sms_sender_pool.senders(notification.service_id)
+    return list(sender_numbers)
 
 
 def send_email_to_provider(notification):
     # Someone needs an email, possibly new registration
-    recipient = redis_store.get(f"email-address-{notification.id}")
-    recipient = recipient.decode("utf-8")
-    personalisation = redis_store.get(f"email-personalisation-{notification.id}")
-    if personalisation:
-        p = personalisation.decode("utf-8")
-
-        p = json.loads(p)
-        notification.personalisation = p
+    (email_context,) = _get_email_contexts([notification])
+    recipient = _set_email_context(notification, email_context)
 
     service = SerialisedService.from_id(notification.service_id)
     if not service.active:
@@ -223,11 +620,7 @@ def send_email_to_provider(notification):
             template_dict, values=notification.personalisation
         )
 
-        html_email = str(html_email)
-        html_email = html_email.replace("%5B", "")
-        html_email = html_email.replace("%5D", "")
-        html_email = html_email.replace("(", "")
-        html_email = html_email.replace(")", "")
+        html_email = html_email.render_in_shell(formatter=remove_brackets)
 
         if notification.key_type == KeyType.TEST:
             notification.reference = str(create_uuid())
@@ -239,16 +632,59 @@ def send_email_to_provider(notification):
                 f'{current_app.config["NOTIFY_EMAIL_DOMAIN"]}>'
             )
 
-            reference = provider.send_email(
-                from_address,
-                recipient,
-                plain_text_email.subject,
-                body=str(plain_text_email),
-                html_body=html_email,
-                reply_to_address=notification.reply_to_text,
-            )
+            wait_for_send_capacity(provider.name)
+            with provider_router.measure(
+                provider.name, ignore=EmailClientNonRetryableException
+            ):
+                reference = provider.send_email(
+                    from_address,
+                    recipient,
+                    plain_text_email.subject,
+                    body=str(plain_text_email),
+                    html_body=html_email,
+                    reply_to_address=notification.reply_to_text,
+                )
             notification.reference = reference
-            update_notification_to_sending(notification, provider)
+            if current_app.config["BUFFER_SENDING_STATUS_UPDATES"]:
+                # SES callbacks look notifications up by their reference, and
+                # can arrive before the buffer is flushed
+                update_notification_reference(notification.id, reference)
+                sending_status_buffer.add(notification.id, provider.name)
+            else:
+                update_notification_to_sending(notification, provider)
+
+
+def _get_email_contexts(notifications):
+    """
+    Gets what’s kept in redis for each email in `notifications`, its address
+    and personalisation, in one round trip.
+    """
+    values = redis_store.mget(
+        [
+            key
+            for notification in notifications
+            for key in (
+                f"email-address-{notification.id}",
+                f"email-personalisation-{notification.id}",
+            )
+        ]
+    )
+    return list(zip(values[::2], values[1::2]))
+
+
+def _set_email_context(notification, email_context):
+    recipient, personalisation = email_context
+    if personalisation:
+        notification.personalisation = json.loads(personalisation.decode("utf-8"))
+    return recipient.decode("utf-8")
+
+
+def remove_brackets(html):
+    html = html.replace("%5B", "")
+    html = html.replace("%5D", "")
+    html = html.replace("(", "")
+    html = html.replace(")", "")
+    return html
 
 
 def update_notification_to_sending(notification, provider):
@@ -263,8 +699,21 @@ def update_notification_to_sending(notification, provider):
 provider_cache = TTLCache(maxsize=8, ttl=10)
 
 
-@cached(cache=provider_cache)
 def provider_to_use(notification_type, international=True):
+    weights = current_app.config[
+        (
+            "SMS_PROVIDER_RESTING_POINTS"
+            if notification_type == NotificationType.SMS
+            else "EMAIL_PROVIDER_RESTING_POINTS"
+        )
+    ]
+    return provider_router.choose(
+        _active_providers(notification_type, international), weights
+    )
+
+
+@cached(cache=provider_cache)
+def _active_providers(notification_type, international):
     active_providers = [
         p
         for p in get_provider_details_by_notification_type(
@@ -277,12 +726,12 @@ def provider_to_use(notification_type, international=True):
         current_app.logger.error(f"{notification_type} failed as no active providers")
         raise Exception(f"No active {notification_type} providers")
 
-    # we only have sns
-    chosen_provider = active_providers[0]
-
-    return notification_provider_clients.get_client_by_name_and_type(
-        chosen_provider.identifier, notification_type
-    )
+    return [
+        notification_provider_clients.get_client_by_name_and_type(
+            provider.identifier, notification_type
+        )
+        for provider in active_providers
+    ]
 
 
 def get_logo_url(base_url, logo_file):
@@ -313,23 +762,32 @@ def get_html_email_options(service):
             "brand_banner": False,
         }
     if isinstance(service, SerialisedService):
-        branding = dao_get_email_branding_by_id(service.email_branding)
-    else:
-        branding = service.email_branding
+        return _email_branding_options(email_branding_cache.get(service.email_branding))
+    # Only what _email_branding_options uses, so this works with anything
+    # which looks like an EmailBranding
+    branding = service.email_branding
+    return _email_branding_options(
+        {
+            key: getattr(branding, key)
+            for key in ("brand_type", "colour", "logo", "name", "text")
+        }
+    )
+
 
+def _email_branding_options(branding):
     logo_url = (
-        get_logo_url(current_app.config["ADMIN_BASE_URL"], branding.logo)
-        if branding.logo
+        get_logo_url(current_app.config["ADMIN_BASE_URL"], branding["logo"])
+        if branding["logo"]
         else None
     )
 
     return {
-        "govuk_banner": branding.brand_type == BrandType.BOTH,
-        "brand_banner": branding.brand_type == BrandType.ORG_BANNER,
-        "brand_colour": branding.colour,
+        "govuk_banner": branding["brand_type"] == BrandType.BOTH,
+        "brand_banner": branding["brand_type"] == BrandType.ORG_BANNER,
+        "brand_colour": branding["colour"],
         "brand_logo": logo_url,
-        "brand_text": branding.text,
-        "brand_name": branding.name,
+        "brand_text": branding["text"],
+        "brand_name": branding["name"],
     }
 
 
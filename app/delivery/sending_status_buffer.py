@@ -0,0 +1,105 @@
+from threading import Lock, Timer
+from time import monotonic
+
+from flask import current_app
+
+from app.dao.notifications_dao import dao_update_notifications_to_sending
+from app.utils import utc_now
+
+# How many flushes an update is kept for if the batch it’s in can’t be
+# written, before it’s written on its own instead
+MAX_FLUSH_ATTEMPTS = 3
+
+
+class SendingStatusBuffer:
+    """
+    Collects the updates which mark notifications as sent to the provider, and
+    writes them to the database together with
+    `dao_update_notifications_to_sending`, instead of with an UPDATE and commit
+    each. Only the status is buffered: the provider’s reference or message id
+    should be written straight away, for delivery receipts to find the
+    notification by.
+
+    Updates are written once there are SENDING_STATUS_BUFFER_SIZE of them, or
+    SENDING_STATUS_BUFFER_MAX_AGE seconds after the oldest was added, whichever
+    is sooner, and when the worker shuts down (see `provider_tasks`). If a
+    batch can’t be written its updates are kept for the next flush. After
+    MAX_FLUSH_ATTEMPTS they’re written one at a time instead, so that one bad
+    update can’t hold up the rest, and any which still can’t be written are
+    kept to try again.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._updates = []
+        self._oldest = None
+        self._app = None
+
+    def add(self, notification_id, sent_by, billable_units=None):
+        config = current_app.config
+        with self._lock:
+            self._app = current_app._get_current_object()
+            self._updates.append(
+                ((notification_id, utc_now(), sent_by, billable_units), 0)
+            )
+            if self._oldest is None:
+                self._start_timer(config["SENDING_STATUS_BUFFER_MAX_AGE"])
+            full = len(self._updates) >= config["SENDING_STATUS_BUFFER_SIZE"] or (
+                monotonic() - self._oldest >= config["SENDING_STATUS_BUFFER_MAX_AGE"]
+            )
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            updates, self._updates = self._updates, []
+            self._oldest = None
+            app = self._app
+        if not updates:
+            return
+
+        with app.app_context():
+            batch = [u for u in updates if u[1] < MAX_FLUSH_ATTEMPTS]
+            pending = [u for u in updates if u[1] >= MAX_FLUSH_ATTEMPTS]
+            if batch:
+                try:
+                    dao_update_notifications_to_sending([update for update, _ in batch])
+                except Exception:
+                    current_app.logger.exception(
+                        f"Failed to mark {len(batch)} notifications as sending"
+                    )
+                    pending += [(update, attempts + 1) for update, attempts in batch]
+
+            retries = []
+            for update, attempts in pending:
+                if attempts < MAX_FLUSH_ATTEMPTS or not self._write_one(update):
+                    retries.append((update, attempts))
+            if retries:
+                with self._lock:
+                    self._updates = retries + self._updates
+                    if self._oldest is None:
+                        self._start_timer(
+                            current_app.config["SENDING_STATUS_BUFFER_MAX_AGE"]
+                        )
+
+    def _write_one(self, update):
+        try:
+            dao_update_notifications_to_sending([update])
+        except Exception:
+            # It has been sent, so keep trying rather than drop it
+            current_app.logger.exception(
+                f"Failed to mark notification {update[0]} as sending, "
+                "keeping it to try again"
+            )
+            return False
+        return True
+
+    def _start_timer(self, max_age):
+        self._oldest = monotonic()
+        timer = Timer(max_age, self.flush)
+        # Don’t keep the worker running just to flush, it flushes on shutdown
+        timer.daemon = True
+        timer.start()
+
+
+sending_status_buffer = SendingStatusBuffer()
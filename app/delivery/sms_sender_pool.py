@@ -0,0 +1,80 @@
+import re
+from threading import Lock
+
+from cachetools import TTLCache
+from flask import current_app
+
+from app import redis_store
+from app.dao.service_sms_sender_dao import dao_get_sms_senders_by_service_id
+from notifications_utils.clients.redis import sms_senders_version_cache_key
+
+# Senders which SNS will send from, rather than using the default number, see
+# `AwsSnsClient.send_sms`
+SENDER_NUMBER_REGEX = re.compile(r"^\+?\d{5,14}$")
+
+
+class SmsSenderPool:
+    """
+    The SMS senders of each service, cached in-process for
+    SMS_SENDER_POOL_CACHE_TTL seconds so they aren’t queried for every
+    message. Call `invalidate` when a service’s senders change. That bumps
+    a version number for the service in redis, which every process checks
+    when it looks the senders up, so they all stop using the old ones. If
+    redis is disabled, other processes carry on using them until they
+    expire from their cache.
+
+    With SPREAD_SMS_ACROSS_SENDERS switched on, a message from one of a
+    service’s numbers can be sent from any of them, and a message from a
+    sender which isn’t a number from any number in PLATFORM_SMS_SENDER_POOL.
+    That way large jobs aren’t limited by the throughput of one number. How
+    fast each number sends is accounted for by its token bucket, see
+    `send_to_providers.take_send_capacity`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._senders = None
+
+    def senders(self, service_id):
+        version = redis_store.get(sms_senders_version_cache_key(service_id))
+        with self._lock:
+            if self._senders is None:
+                self._senders = TTLCache(
+                    maxsize=1024, ttl=current_app.config["SMS_SENDER_POOL_CACHE_TTL"]
+                )
+            cached = self._senders.get(service_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        senders = tuple(
+            sender.sms_sender
+            for sender in dao_get_sms_senders_by_service_id(service_id)
+        )
+        with self._lock:
+            self._senders[service_id] = (version, senders)
+        return senders
+
+    def invalidate(self, service_id):
+        with self._lock:
+            if self._senders is not None:
+                self._senders.pop(service_id, None)
+        redis_store.incr(sms_senders_version_cache_key(service_id))
+
+    def numbers_for(self, service_id, sender):
+        """
+        Returns the numbers which a message from `sender` can be sent from,
+        which is just `sender` unless it’s spread across a pool.
+        """
+        if not current_app.config["SPREAD_SMS_ACROSS_SENDERS"]:
+            return (sender,)
+        if sender and SENDER_NUMBER_REGEX.match(sender):
+            numbers = tuple(
+                number
+                for number in self.senders(service_id)
+                if SENDER_NUMBER_REGEX.match(number)
+            )
+            return numbers if sender in numbers else (sender,)
+        return tuple(current_app.config["PLATFORM_SMS_SENDER_POOL"]) or (sender,)
+
+
+sms_sender_pool = SmsSenderPool()
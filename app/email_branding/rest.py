@@ -6,6 +6,7 @@ from app.dao.email_branding_dao import (
     dao_get_email_branding_options,
     dao_update_email_branding,
 )
+from app.delivery.email_branding_cache import email_branding_cache
 from app.email_branding.email_branding_schema import (
     post_create_email_branding_schema,
     post_update_email_branding_schema,
@@ -54,5 +55,6 @@ def update_email_branding(email_branding_id):
     if "text" not in data.keys() and "name" in data.keys():
         data["text"] = data["name"]
     dao_update_email_branding(fetched_email_branding, **data)
+    email_branding_cache.invalidate(email_branding_id)
 
     return jsonify(data=fetched_email_branding.serialize()), 200
@@ -0,0 +1,183 @@
+"""
+A compact binary encoding of the notifications waiting on message_queue to
+be inserted, which is smaller and quicker to encode and decode than
+`Notification.serialize_for_redis` as JSON.
+
+An encoded notification starts with its schema version, then a bitmap of
+which of that version’s fields are set, then the fixed width fields (UUIDs
+as 16 bytes, timestamps as microseconds since the epoch, numbers and
+booleans) and the lengths of the strings, and then the strings themselves.
+To add a field, add a new version to SCHEMAS with the field on the end, and
+bump VERSION. Notifications encoded with older versions can still be
+decoded, without the new field.
+
+`decode_queued_notification` also decodes notifications queued as JSON.
+"""
+
+import json
+import struct
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+UUID = "uuid"
+TIMESTAMP = "timestamp"
+INT = "int"
+FLOAT = "float"
+BOOL = "bool"
+STR = "str"
+
+FORMATS = {UUID: "16s", TIMESTAMP: "q", INT: "i", FLOAT: "d", BOOL: "?", STR: "I"}
+
+# The fields of each schema version, by the name they’re passed to
+# Notification with. sent_at, api_key_id and message_id aren’t queued, like
+# serialize_for_redis.
+SCHEMAS = {
+    1: (
+        ("id", UUID),
+        ("to", STR),
+        ("normalised_to", STR),
+        ("job_id", UUID),
+        ("job_row_number", INT),
+        ("service_id", UUID),
+        ("template_id", UUID),
+        ("template_version", INT),
+        ("key_type", STR),
+        ("billable_units", INT),
+        ("notification_type", STR),
+        ("created_at", TIMESTAMP),
+        ("sent_by", STR),
+        ("message_cost", FLOAT),
+        ("updated_at", TIMESTAMP),
+        ("status", STR),
+        ("reference", STR),
+        ("client_reference", STR),
+        ("_personalisation", STR),
+        ("international", BOOL),
+        ("phone_prefix", STR),
+        ("rate_multiplier", FLOAT),
+        ("created_by_id", UUID),
+        ("reply_to_text", STR),
+        ("document_download_count", INT),
+        ("provider_response", STR),
+        ("carrier", STR),
+        ("deliver_after_insert", BOOL),
+    ),
+}
+VERSION = 1
+
+HEADER = struct.Struct("<BQ")
+
+
+def _decode_uuid(value):
+    # Quicker than str(uuid.UUID(bytes=value))
+    value = value.hex()
+    return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}"
+
+
+def _decode_timestamp(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+DECODERS = {UUID: _decode_uuid, TIMESTAMP: _decode_timestamp}
+
+
+@lru_cache(maxsize=1024)
+def _layout(version, present):
+    """
+    The struct for the header, fixed width fields and string lengths of a
+    notification encoded with `version` with the fields in the bitmap
+    `present`, and those fields.
+    """
+    fields = tuple(
+        field for i, field in enumerate(SCHEMAS[version]) if present & (1 << i)
+    )
+    fixed = tuple(field for field in fields if field[1] != STR)
+    strings = tuple(name for name, kind in fields if kind == STR)
+    layout = struct.Struct(
+        HEADER.format
+        + "".join(FORMATS[kind] for _, kind in fixed)
+        + FORMATS[STR] * len(strings)
+    )
+    decoders = tuple((name, DECODERS.get(kind)) for name, kind in fixed)
+    return layout, fixed, strings, decoders
+
+
+def _encode_value(kind, value):
+    if kind == UUID:
+        return (value if isinstance(value, uuid.UUID) else uuid.UUID(value)).bytes
+    if kind == TIMESTAMP:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return (value - EPOCH) // ONE_MICROSECOND
+    return value
+
+
+def encode_queued_notification(notification, deliver_after_insert=False):
+    return encode_queued_fields(
+        notification.__dict__, deliver_after_insert=deliver_after_insert
+    )
+
+
+def encode_queued_fields(fields, deliver_after_insert=False):
+    """
+    Encodes a notification from a dict of the fields it would be created
+    with, without building a Notification.
+    """
+    values = {
+        name: fields.get(name)
+        for name, _ in SCHEMAS[VERSION]
+        if name != "deliver_after_insert"
+    }
+    values["deliver_after_insert"] = deliver_after_insert or None
+    present = 0
+    for i, (name, _) in enumerate(SCHEMAS[VERSION]):
+        if values[name] is not None:
+            present |= 1 << i
+
+    layout, fixed, strings, _ = _layout(VERSION, present)
+    encoded_strings = [str(values[name]).encode("utf-8") for name in strings]
+    return layout.pack(
+        VERSION,
+        present,
+        *(_encode_value(kind, values[name]) for name, kind in fixed),
+        *(len(string) for string in encoded_strings),
+    ) + b"".join(encoded_strings)
+
+
+def decode_queued_notification(data):
+    """
+    Returns the fields of a queued notification, to pass to Notification,
+    and whether it should be sent for delivery once it’s inserted. UUIDs are
+    returned as strings, like they’re queued as JSON.
+    """
+    if data[0] not in SCHEMAS:
+        return _decode_json_notification(data)
+
+    version, present = HEADER.unpack_from(data)
+    layout, fixed, strings, decoders = _layout(version, present)
+    values = layout.unpack_from(data)
+    fields = {
+        name: decode(value) if decode else value
+        for (name, decode), value in zip(decoders, values[2:])
+    }
+    offset = layout.size
+    for name, length in zip(strings, values[2 + len(fixed) :]):
+        fields[name] = data[offset : offset + length].decode("utf-8")
+        offset += length
+    return fields, fields.pop("deliver_after_insert", False)
+
+
+def _decode_json_notification(data):
+    fields = json.loads(data.decode("utf-8"))
+    fields["status"] = fields.pop("notification_status")
+    # serialize_for_redis queues ids which aren’t set as "None"
+    for name, kind in SCHEMAS[1]:
+        if kind == UUID and fields.get(name) == "None":
+            fields[name] = None
+    if isinstance(fields.get("created_at"), list):
+        fields["created_at"] = fields["created_at"][0]
+    return fields, fields.pop("deliver_after_insert", False)
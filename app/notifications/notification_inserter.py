@@ -0,0 +1,112 @@
+from datetime import datetime
+from threading import Event
+from time import monotonic, sleep
+
+from flask import current_app
+
+from app import redis_store
+from app.celery.scheduled_tasks import (
+    MESSAGE_QUEUE_KEY,
+    insert_message_queue_batch,
+    recover_message_queue_claims,
+)
+from app.utils import utc_now
+
+# How long to wait for a notification to arrive before checking if the
+# inserter has been stopped
+CLAIM_TIMEOUT = 1
+# How often to look for more notifications while a batch is filling up
+POLL_INTERVAL = 0.005
+
+
+class NotificationInserter:
+    """
+    Inserts notifications from message_queue as soon as they arrive, rather
+    than when batch-insert-notifications next runs, so they’re in the
+    database within tens of milliseconds and inserts are spread out rather
+    than arriving in bursts.
+
+    It waits for a notification with a blocking claim, then claims more
+    until there are NOTIFICATION_INSERTER_BATCH_SIZE or
+    NOTIFICATION_INSERTER_WINDOW seconds have passed, and inserts them as
+    one batch. Batches are claimed like batch-insert-notifications claims
+    them, so both can run at once, and any batch claimed by an inserter
+    which dies is recovered.
+
+    Run it with `flask command run-notification-inserter`.
+    """
+
+    def __init__(self):
+        self._stopped = Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        recover_message_queue_claims()
+        while not self._stopped.is_set():
+            start_time = monotonic()
+            try:
+                inserted = self.insert_next_batch()
+            except Exception:
+                current_app.logger.exception("Failed to insert notifications")
+                inserted = 0
+            if not inserted:
+                # The claim returns straight away, rather than waiting, when
+                # redis is disabled or failing, so wait out the rest of
+                # CLAIM_TIMEOUT instead of trying again immediately
+                self._stopped.wait(max(0, CLAIM_TIMEOUT - (monotonic() - start_time)))
+
+    def insert_next_batch(self):
+        """
+        Waits for up to CLAIM_TIMEOUT seconds for notifications, and inserts
+        the next batch of them. Returns how many were inserted.
+        """
+        batch_size = current_app.config["NOTIFICATION_INSERTER_BATCH_SIZE"]
+        window = current_app.config["NOTIFICATION_INSERTER_WINDOW"]
+
+        claim_key, items = redis_store.claim_list_item(MESSAGE_QUEUE_KEY, CLAIM_TIMEOUT)
+        if not items:
+            return 0
+        claim_keys = [claim_key]
+        deadline = monotonic() + window
+        while len(items) < batch_size and monotonic() < deadline:
+            claim_key, claimed = redis_store.claim_list_batch(
+                MESSAGE_QUEUE_KEY, batch_size - len(items)
+            )
+            if claimed:
+                claim_keys.append(claim_key)
+                items += claimed
+            else:
+                sleep(min(POLL_INTERVAL, max(0, deadline - monotonic())))
+
+        start_time = monotonic()
+        try:
+            inserted = insert_message_queue_batch(items)
+        finally:
+            for claim_key in claim_keys:
+                redis_store.release_list_batch(MESSAGE_QUEUE_KEY, claim_key)
+        if inserted:
+            self._log_lag(inserted, monotonic() - start_time)
+        return len(inserted)
+
+    def _log_lag(self, inserted, insert_time):
+        created_at = [
+            (
+                datetime.fromisoformat(n.created_at)
+                if isinstance(n.created_at, str)
+                else n.created_at
+            )
+            for n in inserted
+        ]
+        now = utc_now()
+        oldest_lag = (now - min(created_at)).total_seconds()
+        mean_lag = sum((now - c).total_seconds() for c in created_at) / len(created_at)
+        current_app.logger.info(
+            f"Inserted {len(inserted)} notifications in {insert_time:.3f}s, "
+            f"{oldest_lag:.3f}s after the oldest was created and {mean_lag:.3f}s "
+            f"on average, with {redis_store.llen(MESSAGE_QUEUE_KEY)} still waiting"
+        )
+
+
+notification_inserter = NotificationInserter()
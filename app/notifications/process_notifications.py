@@ -4,7 +4,7 @@ import uuid
 
 from flask import current_app
 
-from app import redis_store
+from app import encryption, redis_store
 from app.celery import provider_tasks
 from app.config import QueueNames
 from app.dao.notifications_dao import (
@@ -16,10 +16,14 @@ from app.dao.notifications_dao import (
 from app.enums import NotificationStatus, NotificationType
 from app.errors import BadRequestError
 from app.models import Notification
+from app.notifications.notification_codec import (
+    encode_queued_fields,
+    encode_queued_notification,
+)
 from app.utils import hilite, utc_now
 from notifications_utils.recipients import (
+    PhoneNumber,
     format_email_address,
-    get_international_phone_info,
     validate_and_format_phone_number,
 )
 from notifications_utils.template import PlainTextEmailTemplate, SMSMessageTemplate
@@ -115,19 +119,16 @@ def persist_notification(
     )
 
     if notification_type == NotificationType.SMS:
-        formatted_recipient = validate_and_format_phone_number(
-            recipient, international=True
-        )
+        phone_number = PhoneNumber(recipient, international=True)
         current_app.logger.info(
             hilite(
                 f"Persisting notification with job_id: {job_id} row_number: {job_row_number}"
             )
         )
-        recipient_info = get_international_phone_info(formatted_recipient)
-        notification.normalised_to = formatted_recipient
-        notification.international = recipient_info.international
-        notification.phone_prefix = recipient_info.country_prefix
-        notification.rate_multiplier = recipient_info.billable_units
+        notification.normalised_to = phone_number.e164
+        notification.international = phone_number.international
+        notification.phone_prefix = phone_number.country_prefix
+        notification.rate_multiplier = phone_number.billable_units
 
     elif notification_type == NotificationType.EMAIL:
         current_app.logger.info(
@@ -139,33 +140,136 @@ def persist_notification(
             ex=1800,
         )
 
+    # Whether batch_insert_notifications should send it for delivery once it’s
+    # in the database, rather than whoever is persisting it
+    notification.deliver_after_insert = False
+    # Whether a notification with its id was already in the database, in
+    # which case it shouldn’t be sent again. Not known for notifications
+    # queued for batch_insert_notifications, which skips them when inserting
+    notification.already_existed = False
+
     # if simulated create a Notification model to return but do not persist the Notification to the dB
     if not simulated:
         if notification.notification_type == NotificationType.SMS:
             # it's just too hard with redis and timing to test this here
             if os.getenv("NOTIFY_ENVIRONMENT") == "test":
-                dao_create_notification(notification)
+                notification.already_existed = not dao_create_notification(notification)
             elif "verify_code" in str(notification.personalisation):
-                dao_create_notification(notification)
+                notification.already_existed = not dao_create_notification(notification)
 
             else:
+                # Unless deliver-sms-batches will pick it up
+                if current_app.config["DELIVER_AFTER_BATCH_INSERT"] and not (
+                    current_app.config["DELIVER_SMS_IN_BATCHES"] and job_id
+                ):
+                    notification.deliver_after_insert = True
                 redis_store.rpush(
                     "message_queue",
-                    json.dumps(notification.serialize_for_redis(notification)),
+                    serialise_queued_notification(
+                        notification, notification.deliver_after_insert
+                    ),
                 )
         else:
-            dao_create_notification(notification)
+            notification.already_existed = not dao_create_notification(notification)
 
     return notification
 
 
+def queue_sms_notification_fields(
+    *,
+    notification_id,
+    template_id,
+    template_version,
+    recipient,
+    phone_number,
+    service_id,
+    personalisation,
+    api_key_id,
+    key_type,
+    client_reference=None,
+    reply_to_text=None,
+    document_download_count=None,
+):
+    """
+    Queues an SMS sent through the API for batch_insert_notifications to
+    insert, with the same fields persist_notification would give it, but
+    without building a Notification, which is much quicker. `phone_number`
+    is the recipient’s PhoneNumber.
+
+    Only for use with QUEUE_NOTIFICATIONS_IN_BINARY switched on, and for
+    notifications persist_notification would queue, see
+    can_queue_sms_notification_fields. Returns whether it will be sent for
+    delivery once it’s inserted.
+    """
+    current_app.logger.info(f"Persisting notification with id {notification_id}")
+
+    fields = {
+        "id": notification_id,
+        "template_id": template_id,
+        "template_version": template_version,
+        "to": recipient,
+        "service_id": service_id,
+        "_personalisation": encryption.encrypt(personalisation or {}),
+        "notification_type": NotificationType.SMS,
+        "api_key_id": api_key_id,
+        "key_type": key_type,
+        "created_at": utc_now(),
+        "client_reference": client_reference,
+        "status": NotificationStatus.CREATED,
+        "reply_to_text": reply_to_text,
+        "document_download_count": document_download_count,
+        "normalised_to": phone_number.e164,
+        "international": phone_number.international,
+        "phone_prefix": phone_number.country_prefix,
+        "rate_multiplier": phone_number.billable_units,
+    }
+    deliver_after_insert = current_app.config["DELIVER_AFTER_BATCH_INSERT"]
+    redis_store.rpush(
+        "message_queue",
+        encode_queued_fields(fields, deliver_after_insert=deliver_after_insert),
+    )
+    return deliver_after_insert
+
+
+def can_queue_sms_notification_fields(notification_type, personalisation, simulated):
+    return (
+        current_app.config["QUEUE_API_SMS_WITHOUT_MODEL"]
+        and current_app.config["QUEUE_NOTIFICATIONS_IN_BINARY"]
+        and notification_type == NotificationType.SMS
+        and not simulated
+        # Like persist_notification, which writes these to the database itself
+        and os.getenv("NOTIFY_ENVIRONMENT") != "test"
+        and "verify_code" not in str(personalisation)
+    )
+
+
+def serialise_queued_notification(notification, deliver_after_insert):
+    """
+    Serialises a notification to go on message_queue, for
+    batch_insert_notifications to insert, see decode_queued_notification.
+    """
+    if current_app.config["QUEUE_NOTIFICATIONS_IN_BINARY"]:
+        return encode_queued_notification(
+            notification, deliver_after_insert=deliver_after_insert
+        )
+    serialized_notification = notification.serialize_for_redis(notification)
+    if deliver_after_insert:
+        serialized_notification["deliver_after_insert"] = True
+    return json.dumps(serialized_notification)
+
+
 def notification_exists(notification_id):
     return dao_notification_exists(notification_id)
 
 
 def send_notification_to_queue_detached(
-    key_type, notification_type, notification_id, queue=None
+    key_type, notification_type, notification_id, queue=None, deliver_after_insert=False
 ):
+    if deliver_after_insert:
+        current_app.logger.debug(
+            f"{notification_type} {notification_id} will be sent for delivery once it's inserted"
+        )
+        return
 
     if notification_type == NotificationType.SMS:
         if not queue:
@@ -177,7 +281,12 @@ def send_notification_to_queue_detached(
         deliver_task = provider_tasks.deliver_email
 
     try:
-        deliver_task.apply_async([str(notification_id)], queue=queue, countdown=60)
+        # Notifications which are only written to the database by
+        # batch_insert_notifications used to need time to get there
+        countdown = 0 if current_app.config["DELIVER_AFTER_BATCH_INSERT"] else 60
+        deliver_task.apply_async(
+            [str(notification_id)], queue=queue, countdown=countdown
+        )
     except Exception:
         dao_delete_notifications_by_id(notification_id)
         raise
@@ -193,6 +302,8 @@ def send_notification_to_queue(notification, queue=None):
         notification.notification_type,
         notification.id,
         queue,
+        # Notifications from the database don’t have it
+        deliver_after_insert=getattr(notification, "deliver_after_insert", False),
     )
 
 
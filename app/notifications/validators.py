@@ -18,9 +18,8 @@ from app.utils import get_public_notify_type_text
 from notifications_utils import SMS_CHAR_COUNT_LIMIT
 from notifications_utils.clients.redis import total_limit_cache_key
 from notifications_utils.recipients import (
-    get_international_phone_info,
+    PhoneNumber,
     validate_and_format_email_address,
-    validate_and_format_phone_number,
 )
 
 
@@ -130,6 +129,21 @@ def check_if_service_can_send_files_by_email(service_contact_link, service_id):
 def validate_and_format_recipient(
     send_to, key_type, service, notification_type, allow_guest_list_recipients=True
 ):
+    recipient = validate_recipient(
+        send_to, key_type, service, notification_type, allow_guest_list_recipients
+    )
+    if isinstance(recipient, PhoneNumber):
+        return recipient.e164
+    return recipient
+
+
+def validate_recipient(
+    send_to, key_type, service, notification_type, allow_guest_list_recipients=True
+):
+    """
+    Like `validate_and_format_recipient`, but returns the PhoneNumber for an
+    SMS, so that it doesn’t need parsing again.
+    """
     if send_to is None:
         raise BadRequestError(message="Recipient can't be empty")
 
@@ -138,17 +152,13 @@ def validate_and_format_recipient(
     )
 
     if notification_type == NotificationType.SMS:
-        international_phone_info = check_if_service_can_send_to_number(service, send_to)
-
-        return validate_and_format_phone_number(
-            number=send_to, international=international_phone_info.international
-        )
+        return check_if_service_can_send_to_number(service, send_to)
     elif notification_type == NotificationType.EMAIL:
         return validate_and_format_email_address(email_address=send_to)
 
 
 def check_if_service_can_send_to_number(service, number):
-    international_phone_info = get_international_phone_info(number)
+    phone_number = PhoneNumber(number, international=True)
 
     if service.permissions and isinstance(service.permissions[0], ServicePermission):
         permissions = [p.permission for p in service.permissions]
@@ -156,12 +166,12 @@ def check_if_service_can_send_to_number(service, number):
         permissions = service.permissions
 
     if (
-        international_phone_info.international
+        phone_number.international
         and ServicePermissionType.INTERNATIONAL_SMS not in permissions
     ):
         raise BadRequestError(message="Cannot send to international mobile numbers")
     else:
-        return international_phone_info
+        return phone_number
 
 
 def check_is_message_too_long(template_with_content):
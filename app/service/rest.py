@@ -87,6 +87,7 @@ from app.dao.services_dao import (
 )
 from app.dao.templates_dao import dao_get_template_by_id
 from app.dao.users_dao import get_user_by_id
+from app.delivery.sms_sender_pool import sms_sender_pool
 from app.enums import KeyType
 from app.errors import InvalidRequest, register_errors
 from app.models import EmailBranding, Permission, Service
@@ -1030,6 +1031,7 @@ def add_service_sms_sender(service_id):
                 sms_sender=sms_sender,
                 inbound_number_id=inbound_number_id,
             )
+            sms_sender_pool.invalidate(service_id)
 
             return jsonify(new_sms_sender.serialize()), 201
 
@@ -1039,6 +1041,7 @@ def add_service_sms_sender(service_id):
         is_default=form["is_default"],
         inbound_number_id=inbound_number_id,
     )
+    sms_sender_pool.invalidate(service_id)
     return jsonify(new_sms_sender.serialize()), 201
 
 
@@ -1066,6 +1069,7 @@ def update_service_sms_sender(service_id, sms_sender_id):
         is_default=form["is_default"],
         sms_sender=form["sms_sender"],
     )
+    sms_sender_pool.invalidate(service_id)
     return jsonify(new_sms_sender.serialize()), 200
 
 
@@ -1074,6 +1078,7 @@ def update_service_sms_sender(service_id, sms_sender_id):
 )
 def delete_service_sms_sender(service_id, sms_sender_id):
     sms_sender = archive_sms_sender(service_id, sms_sender_id)
+    sms_sender_pool.invalidate(service_id)
 
     return jsonify(data=sms_sender.serialize()), 200
 
@@ -11,7 +11,9 @@ from app.config import QueueNames
 from app.enums import KeyType, NotificationStatus, NotificationType
 from app.models import Notification
 from app.notifications.process_notifications import (
+    can_queue_sms_notification_fields,
     persist_notification,
+    queue_sms_notification_fields,
     send_notification_to_queue_detached,
     simulated_recipient,
 )
@@ -21,7 +23,7 @@ from app.notifications.validators import (
     check_service_email_reply_to_id,
     check_service_has_permission,
     check_service_sms_sender_id,
-    validate_and_format_recipient,
+    validate_recipient,
     validate_template,
 )
 from app.schema_validation import validate
@@ -92,12 +94,13 @@ def process_sms_or_email_notification(
         else form["phone_number"]
     )
 
-    send_to = validate_and_format_recipient(
+    recipient = validate_recipient(
         send_to=form_send_to,
         key_type=api_user.key_type,
         service=service,
         notification_type=notification_type,
     )
+    send_to = str(recipient)
 
     # Do not persist or send notification to the queue if it is a simulated recipient
     simulated = simulated_recipient(send_to, notification_type)
@@ -155,21 +158,38 @@ def process_sms_or_email_notification(
                 f"Notification {notification_id} failed to save to high volume queue. Using normal flow instead"
             )
 
-    persist_notification(
-        notification_id=notification_id,
-        template_id=template.id,
-        template_version=template.version,
-        recipient=form_send_to,
-        service=service,
-        personalisation=personalisation,
-        notification_type=notification_type,
-        api_key_id=api_user.id,
-        key_type=api_user.key_type,
-        client_reference=form.get("reference", None),
-        simulated=simulated,
-        reply_to_text=reply_to_text,
-        document_download_count=document_download_count,
-    )
+    if can_queue_sms_notification_fields(notification_type, personalisation, simulated):
+        deliver_after_insert = queue_sms_notification_fields(
+            notification_id=notification_id,
+            template_id=template.id,
+            template_version=template.version,
+            recipient=form_send_to,
+            phone_number=recipient,
+            service_id=service.id,
+            personalisation=personalisation,
+            api_key_id=api_user.id,
+            key_type=api_user.key_type,
+            client_reference=form.get("reference", None),
+            reply_to_text=reply_to_text,
+            document_download_count=document_download_count,
+        )
+    else:
+        notification = persist_notification(
+            notification_id=notification_id,
+            template_id=template.id,
+            template_version=template.version,
+            recipient=form_send_to,
+            service=service,
+            personalisation=personalisation,
+            notification_type=notification_type,
+            api_key_id=api_user.id,
+            key_type=api_user.key_type,
+            client_reference=form.get("reference", None),
+            simulated=simulated,
+            reply_to_text=reply_to_text,
+            document_download_count=document_download_count,
+        )
+        deliver_after_insert = notification.deliver_after_insert
 
     if not simulated:
         queue_name = None
@@ -178,6 +198,7 @@ def process_sms_or_email_notification(
             notification_type=notification_type,
             notification_id=notification_id,
             queue=queue_name,
+            deliver_after_insert=deliver_after_insert,
         )
     else:
         current_app.logger.debug(
@@ -11,3 +11,21 @@ def total_limit_cache_key(service_id):
 
 def rate_limit_cache_key(service_id, api_key_type):
     return "{}-{}".format(str(service_id), api_key_type)
+
+
+def send_rate_cache_key(provider, sender=None):
+    if sender:
+        return "{}-{}-{}".format("send-rate", provider, sender)
+    return "{}-{}".format("send-rate", provider)
+
+
+def sms_senders_version_cache_key(service_id):
+    return "{}-{}".format("sms-senders-version", str(service_id))
+
+
+def email_branding_version_cache_key(email_branding_id):
+    return "{}-{}".format("email-branding-version", str(email_branding_id))
+
+
+def delivery_swept_cache_key(notification_id):
+    return "{}-{}".format("delivery-swept", str(notification_id))
@@ -62,6 +62,81 @@ class RedisClient:
             return deleted
             """
         )
+        # Take up to ARGV[1] tokens from every token bucket in KEYS, refilling each one first at its rate, with the
+        # rate and capacity of KEYS[i] in ARGV[i * 2] and ARGV[i * 2 + 1]. The same number of tokens is taken from
+        # every bucket, and returned. Buckets use the redis server’s clock, so all clients agree on how full they are.
+        self.scripts["take-tokens"] = self.redis_store.register_script(
+            """
+            redis.replicate_commands()
+            local time = redis.call('time')
+            local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+            local taken = tonumber(ARGV[1])
+            local tokens = {}
+            for i, key in ipairs(KEYS) do
+                local rate = tonumber(ARGV[i * 2])
+                local capacity = tonumber(ARGV[i * 2 + 1])
+                local bucket = redis.call('hmget', key, 'tokens', 'updated_at')
+                local available = tonumber(bucket[1]) or capacity
+                local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+                tokens[i] = math.min(capacity, available + elapsed * rate)
+                taken = math.min(taken, math.floor(tokens[i]))
+            end
+            for i, key in ipairs(KEYS) do
+                local rate = tonumber(ARGV[i * 2])
+                local capacity = tonumber(ARGV[i * 2 + 1])
+                redis.call('hset', key, 'tokens', tokens[i] - taken, 'updated_at', now)
+                redis.call('expire', key, math.ceil(capacity / rate) + 1)
+            end
+            return taken
+            """
+        )
+        # Remove and return up to ARGV[2] members of the sorted set KEYS[1] with a score of at most ARGV[1], lowest
+        # first, so that only one client gets each member.
+        self.scripts["pop-by-score"] = self.redis_store.register_script(
+            """
+            local members = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+            if #members > 0 then
+                redis.call('zrem', KEYS[1], unpack(members))
+            end
+            return members
+            """
+        )
+        # Move up to ARGV[1] items from the front of the list KEYS[1] to the claim list KEYS[2], and record the claim
+        # in the sorted set KEYS[3], scored by when it was made (ARGV[2]), so that it can be recovered if it’s never
+        # released.
+        self.scripts["claim-list-batch"] = self.redis_store.register_script(
+            """
+            local items = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+            if #items > 0 then
+                redis.call('ltrim', KEYS[1], #items, -1)
+                for i=1, #items, 5000 do
+                    redis.call('rpush', KEYS[2], unpack(items, i, math.min(i + 4999, #items)))
+                end
+                redis.call('zadd', KEYS[3], ARGV[2], KEYS[2])
+            end
+            return items
+            """
+        )
+        # Put the items of every claim in the sorted set KEYS[2] made at or before ARGV[1] back on the front of the
+        # list KEYS[1], in order, and return how many there were.
+        self.scripts["recover-list-batches"] = self.redis_store.register_script(
+            """
+            local claims = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])
+            local recovered = 0
+            for _, claim in ipairs(claims) do
+                local items = redis.call('lrange', claim, 0, -1)
+                for i=#items, 1, -1 do
+                    redis.call('lpush', KEYS[1], items[i])
+                end
+                recovered = recovered + #items
+                redis.call('del', claim)
+            end
+            if #claims > 0 then
+                redis.call('zrem', KEYS[2], unpack(claims))
+            end
+            return recovered
+            """
+        )
 
     def delete_by_pattern(self, pattern, raise_exception=False):
         r"""
@@ -136,6 +211,129 @@ class RedisClient:
         else:
             return False
 
+    def take_tokens(self, buckets, requested, raise_exception=False):
+        """
+        Token buckets, for rate limiting that’s shared between processes.
+
+        Takes up to `requested` tokens from every one of `buckets`, a dict of cache key to `(rate, capacity)`,
+        where rate is in tokens per second. A bucket starts full, holds at most `capacity` tokens and refills at
+        `rate`. It’s one atomic call to redis however many buckets and tokens there are, so callers can take
+        tokens in batches.
+
+        Returns how many tokens were taken, which is the same for every bucket and may be fewer than requested,
+        or none. If redis is inactive, or we get an exception, allow the request by returning `requested`.
+        """
+        if self.active and buckets:
+            keys = [prepare_value(key) for key in buckets]
+            args = [requested]
+            for rate, capacity in buckets.values():
+                args += [rate, capacity]
+            try:
+                return self.scripts["take-tokens"](keys=keys, args=args)
+            except Exception as e:
+                self.__handle_exception(
+                    e, raise_exception, "take-tokens", ", ".join(keys)
+                )
+
+        return requested
+
+    def zadd(self, key, mapping, raise_exception=False):
+        key = prepare_value(key)
+        if self.active:
+            try:
+                return self.redis_store.zadd(key, mapping)
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "zadd", key)
+
+    def pop_by_score(self, key, max_score, count, raise_exception=False):
+        """
+        Removes and returns up to `count` members of a sorted set with a score of at most `max_score`, lowest
+        score first, atomically, so that clients popping at the same time never get the same member.
+        """
+        key = prepare_value(key)
+        if self.active:
+            try:
+                return self.scripts["pop-by-score"](keys=[key], args=[max_score, count])
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "pop-by-score", key)
+
+        return []
+
+    def claim_list_batch(self, key, count, raise_exception=False):
+        """
+        Reliable queue, for lists that are consumed in batches.
+
+        Atomically moves up to `count` items from the front of the list `key` to a new claim list, and returns the
+        claim list’s key and the items. Once they’ve been dealt with, call `release_list_batch` with the claim
+        key. Claims that are never released, because the consumer died, are put back on the list by
+        `recover_list_batches`, so every item is consumed at least once.
+
+        If redis is inactive, or we get an exception, nothing is claimed.
+        """
+        key = prepare_value(key)
+        claim_key = f"{key}-claim-{uuid.uuid4()}"
+        if self.active:
+            try:
+                items = self.scripts["claim-list-batch"](
+                    keys=[key, claim_key, f"{key}-claims"], args=[count, time()]
+                )
+                return claim_key, items
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "claim-list-batch", key)
+
+        return claim_key, []
+
+    def claim_list_item(self, key, timeout, raise_exception=False):
+        """
+        Waits up to `timeout` seconds for an item to be added to the list `key` if it’s empty, and claims the
+        first item like `claim_list_batch`. The claim is recorded before waiting, so that the item can be recovered
+        even if the consumer dies as soon as it’s claimed.
+
+        Returns the claim list’s key and a list of the item, or no items if none were added in time.
+        """
+        key = prepare_value(key)
+        claim_key = f"{key}-claim-{uuid.uuid4()}"
+        if self.active:
+            try:
+                self.redis_store.zadd(f"{key}-claims", {claim_key: time()})
+                item = self.redis_store.blmove(key, claim_key, timeout, "LEFT", "RIGHT")
+                if item is not None:
+                    return claim_key, [item]
+                self.redis_store.zrem(f"{key}-claims", claim_key)
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "claim-list-item", key)
+
+        return claim_key, []
+
+    def release_list_batch(self, key, claim_key, raise_exception=False):
+        key = prepare_value(key)
+        if self.active:
+            try:
+                pipe = self.redis_store.pipeline()
+                pipe.delete(claim_key)
+                pipe.zrem(f"{key}-claims", claim_key)
+                pipe.execute()
+            except Exception as e:
+                self.__handle_exception(
+                    e, raise_exception, "release-list-batch", claim_key
+                )
+
+    def recover_list_batches(self, key, claimed_before, raise_exception=False):
+        """
+        Puts the items of claims on the list `key` made at or before the timestamp `claimed_before`, which haven’t
+        been released, back on the front of the list, and returns how many items there were.
+        """
+        key = prepare_value(key)
+        if self.active:
+            try:
+                return self.scripts["recover-list-batches"](
+                    keys=[key, f"{key}-claims"], args=[claimed_before]
+                )
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "recover-list-batches", key)
+
+        return 0
+
     def set(
         self, key, value, ex=None, px=None, nx=False, xx=False, raise_exception=False
     ):
@@ -144,6 +342,26 @@ class RedisClient:
         if self.active:
             self.redis_store.set(key, value, ex, px, nx, xx)
 
+    def set_if_not_exists(self, keys, value, ex, raise_exception=False):
+        """
+        Sets each of `keys` which isn’t set already to `value`, expiring in `ex` seconds, in one round trip, and
+        returns the ones which were set. If redis is unavailable, that’s all of them.
+        """
+        keys = [prepare_value(k) for k in keys]
+        value = prepare_value(value)
+        if self.active:
+            try:
+                pipe = self.redis_store.pipeline()
+                for key in keys:
+                    pipe.set(key, value, ex=ex, nx=True)
+                return [key for key, was_set in zip(keys, pipe.execute()) if was_set]
+            except Exception as e:
+                self.__handle_exception(
+                    e, raise_exception, "set-if-not-exists", ", ".join(keys)
+                )
+
+        return keys
+
     def incr(self, key, raise_exception=False):
         key = prepare_value(key)
         if self.active:
@@ -152,6 +370,14 @@ class RedisClient:
             except Exception as e:
                 self.__handle_exception(e, raise_exception, "incr", key)
 
+    def incrby(self, key, amount, raise_exception=False):
+        key = prepare_value(key)
+        if self.active:
+            try:
+                return self.redis_store.incrby(key, amount)
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "incrby", key)
+
     def get(self, key, raise_exception=False):
         key = prepare_value(key)
         if self.active:
@@ -159,6 +385,20 @@ class RedisClient:
 
         return None
 
+    def mget(self, keys, raise_exception=False):
+        """
+        Gets the values of `keys` in one round trip, with None for any which
+        aren’t set, or for all of them if redis is unavailable.
+        """
+        keys = [prepare_value(k) for k in keys]
+        if self.active:
+            try:
+                return self.redis_store.mget(keys)
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "mget", ", ".join(keys))
+
+        return [None] * len(keys)
+
     def rpush(self, key, value):
         if self.active:
             self.redis_store.rpush(key, value)
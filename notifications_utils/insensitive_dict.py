@@ -15,9 +15,14 @@ class InsensitiveDict(dict):
 
     KEY_TRANSLATION_TABLE = {ord(c): None for c in " _-"}
 
-    def __init__(self, row_dict):
-        for key, value in row_dict.items():
-            self[key] = value
+    def __init__(self, row_dict, normalised_keys=None):
+        if normalised_keys is None:
+            for key, value in row_dict.items():
+                self[key] = value
+        else:
+            super().update(
+                (normalised_keys[key], value) for key, value in row_dict.items()
+            )
 
     @classmethod
     def from_keys(cls, keys):
@@ -57,3 +62,19 @@ class InsensitiveDict(dict):
         if original_key is None:
             return None
         return original_key.translate(InsensitiveDict.KEY_TRANSLATION_TABLE).lower()
+
+
+class NormalisedKeys(dict):
+    """
+    `NormalisedKeys` maps keys to their normalised form, normalising each
+    key the first time it’s looked up.
+
+    `InsensitiveDict.make_key` only remembers the last few keys, which
+    isn’t enough for a spreadsheet with lots of columns. Share one of these
+    between all the rows of a job (or all the values given to a template)
+    so each column header is only normalised once.
+    """
+
+    def __missing__(self, key):
+        self[key] = InsensitiveDict.make_key(key)
+        return self[key]
@@ -16,7 +16,7 @@ from notifications_utils.formatters import (
     strip_all_whitespace,
     strip_and_remove_obscure_whitespace,
 )
-from notifications_utils.insensitive_dict import InsensitiveDict
+from notifications_utils.insensitive_dict import InsensitiveDict, NormalisedKeys
 from notifications_utils.international_billing_rates import INTERNATIONAL_BILLING_RATES
 from notifications_utils.postal_address import (
     address_line_7_key,
@@ -112,11 +112,12 @@ class RecipientCSV:
             self._placeholders = list(value) + self.recipient_column_headers
         except TypeError:
             self._placeholders = self.recipient_column_headers
+        self.column_keys = NormalisedKeys()
         self.placeholders_as_column_keys = [
-            InsensitiveDict.make_key(placeholder) for placeholder in self._placeholders
+            self.column_keys[placeholder] for placeholder in self._placeholders
         ]
         self.recipient_column_headers_as_column_keys = [
-            InsensitiveDict.make_key(placeholder)
+            self.column_keys[placeholder]
             for placeholder in self.recipient_column_headers
         ]
 
@@ -174,7 +175,7 @@ class RecipientCSV:
                 column_value = strip_and_remove_obscure_whitespace(column_value)
 
                 if (
-                    InsensitiveDict.make_key(column_name)
+                    self.column_keys[column_name]
                     in self.recipient_column_headers_as_column_keys
                 ):
                     output_dict[column_name] = column_value or None
@@ -197,6 +198,7 @@ class RecipientCSV:
                 error_fn=self._get_error_for_field,
                 recipient_column_headers=self.recipient_column_headers,
                 placeholders=self.placeholders_as_column_keys,
+                column_keys=self.column_keys,
                 template=self.template,
                 allow_international_letters=self.allow_international_letters,
                 validate_row=self.should_validate,
@@ -259,15 +261,16 @@ class RecipientCSV:
 
     @property
     def column_headers_as_column_keys(self):
-        return InsensitiveDict.from_keys(self.column_headers).keys()
+        return OrderedSet(self.column_keys[key] for key in self.column_headers)
 
     @property
     def missing_column_headers(self):
+        column_headers_as_column_keys = self.column_headers_as_column_keys
         return set(
             key
             for key in self.placeholders
             if (
-                InsensitiveDict.make_key(key) not in self.column_headers_as_column_keys
+                self.column_keys[key] not in column_headers_as_column_keys
                 and not self.is_address_column(key)
             )
         )
@@ -275,9 +278,9 @@ class RecipientCSV:
     @property
     def duplicate_recipient_column_headers(self):
         raw_recipient_column_headers = [
-            InsensitiveDict.make_key(column_header)
+            self.column_keys[column_header]
             for column_header in self._raw_column_headers
-            if InsensitiveDict.make_key(column_header)
+            if self.column_keys[column_header]
             in self.recipient_column_headers_as_column_keys
         ]
 
@@ -285,9 +288,7 @@ class RecipientCSV:
             (
                 column_header
                 for column_header in self._raw_column_headers
-                if raw_recipient_column_headers.count(
-                    InsensitiveDict.make_key(column_header)
-                )
+                if raw_recipient_column_headers.count(self.column_keys[column_header])
                 > 1
             )
         )
@@ -332,10 +333,7 @@ class RecipientCSV:
         if self.is_address_column(key):
             return
 
-        if (
-            InsensitiveDict.make_key(key)
-            in self.recipient_column_headers_as_column_keys
-        ):
+        if self.column_keys[key] in self.recipient_column_headers_as_column_keys:
             if value in [None, ""] or isinstance(value, list):
                 if self.duplicate_recipient_column_headers:
                     return None
@@ -352,7 +350,7 @@ class RecipientCSV:
             except (InvalidEmailError, InvalidPhoneError) as error:
                 return str(error)
 
-        if InsensitiveDict.make_key(key) not in self.placeholders_as_column_keys:
+        if self.column_keys[key] not in self.placeholders_as_column_keys:
             return
 
         if value in [None, ""]:
@@ -374,6 +372,7 @@ class Row(InsensitiveDict):
         template,
         allow_international_letters,
         validate_row=True,
+        column_keys=None,
     ):
         # If we don't need to validate, then:
         # by not setting template we avoid the template level validation (used to check message length)
@@ -400,9 +399,10 @@ class Row(InsensitiveDict):
 
         super().__init__(
             {
-                key: Cell(key, value, error_fn, self.placeholders)
+                key: Cell(key, value, error_fn, self.placeholders, column_keys)
                 for key, value in row_dict.items()
-            }
+            },
+            column_keys,
         )
 
     def __getitem__(self, key):
@@ -467,10 +467,16 @@ class Row(InsensitiveDict):
 class Cell:
     missing_field_error = "Missing"
 
-    def __init__(self, key=None, value=None, error_fn=None, placeholders=None):
+    def __init__(
+        self, key=None, value=None, error_fn=None, placeholders=None, column_keys=None
+    ):
         self.data = value
         self.error = error_fn(key, value) if error_fn else None
-        self.ignore = InsensitiveDict.make_key(key) not in (placeholders or [])
+        self.ignore = (
+            column_keys[key]
+            if column_keys is not None
+            else InsensitiveDict.make_key(key)
+        ) not in (placeholders or [])
 
     def __eq__(self, other):
         if not other.__class__ == self.__class__:
@@ -525,14 +531,119 @@ international_phone_info = namedtuple(
 
 
 def get_international_phone_info(number):
-    number = validate_phone_number(number, international=True)
-    prefix = _get_country_code(number)
+    return PhoneNumber(number, international=True).international_phone_info
 
-    return international_phone_info(
-        international=(prefix != us_prefix),
-        country_prefix=prefix,
-        billable_units=get_billable_units_for_prefix(prefix),
-    )
+
+class PhoneNumber:
+    """
+    A phone number which has been validated, and parsed, once. Validating a
+    number and then getting its international info used to parse it up to
+    seven times.
+
+    Raises `InvalidPhoneError` in the same way as `validate_phone_number`.
+    A notification stores what this holds as `normalised_to` and
+    `phone_prefix`.
+    """
+
+    __slots__ = ("e164", "country_prefix")
+
+    def __init__(self, number, international=False):
+        us_parsed = us_parse_error = None
+        try:
+            us_parsed = phonenumbers.parse(number, "US")
+        except NumberParseException as exc:
+            us_parse_error = exc
+        is_us = (
+            us_parsed is not None and _get_parsed_country_code(us_parsed) == us_prefix
+        )
+
+        if (not international) or is_us:
+            parsed = self._validate_us(us_parsed, us_parse_error, is_us)
+        else:
+            parsed = self._validate_international(number)
+
+        self.e164 = normalize_phone_number(parsed)
+        self.country_prefix = _get_parsed_country_code(parsed)
+
+    @classmethod
+    def from_validated(cls, number):
+        """
+        For a number which was validated earlier, for example when its
+        notification was created, so only needs parsing again.
+        """
+        try:
+            parsed = phonenumbers.parse(number, "US")
+        except NumberParseException as exc:
+            raise InvalidPhoneError(exc._msg) from exc
+        phone_number = cls.__new__(cls)
+        phone_number.e164 = normalize_phone_number(parsed)
+        phone_number.country_prefix = _get_parsed_country_code(parsed)
+        return phone_number
+
+    @staticmethod
+    def _validate_us(parsed, parse_error, is_us):
+        if parse_error:
+            raise InvalidPhoneError(parse_error._msg) from parse_error
+        if not is_us:
+            raise InvalidPhoneError("Not a US number")
+        if phonenumbers.is_valid_number(parsed):
+            return parsed
+        if len(str(parsed.national_number)) > 10:
+            raise InvalidPhoneError("Too many digits")
+        if len(str(parsed.national_number)) < 10:
+            raise InvalidPhoneError("Not enough digits")
+        if phonenumbers.is_possible_number(parsed):
+            raise InvalidPhoneError("Phone number range is not in use")
+        raise InvalidPhoneError("Phone number is not possible")
+
+    @staticmethod
+    def _validate_international(number):
+        try:
+            parsed = phonenumbers.parse(number, None)
+            number = f"{parsed.country_code}{parsed.national_number}"
+            if len(number) < 8:
+                raise InvalidPhoneError("Not enough digits")
+            if len(number) > 15:
+                raise InvalidPhoneError("Too many digits")
+            return parsed
+        except NumberParseException as exc:
+            if exc._msg == "Could not interpret numbers after plus-sign.":
+                raise InvalidPhoneError("Not a valid country prefix") from exc
+            if not isinstance(number, str):
+                raise InvalidPhoneError(
+                    f"Number must be string, not type {type(number)}"
+                )
+            raise InvalidPhoneError(
+                f"Invalid phone number looks like {show_mangled_number_clues(number)} {exc._msg}"
+            )
+
+    @property
+    def international(self):
+        return self.country_prefix != us_prefix
+
+    @property
+    def billable_units(self):
+        return get_billable_units_for_prefix(self.country_prefix)
+
+    @property
+    def international_phone_info(self):
+        return international_phone_info(
+            international=self.international,
+            country_prefix=self.country_prefix,
+            billable_units=self.billable_units,
+        )
+
+    def __str__(self):
+        return self.e164
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.e164!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, PhoneNumber) and self.e164 == other.e164
+
+    def __hash__(self):
+        return hash(self.e164)
 
 
 # NANP_COUNTRY_AREA_CODES are the list of area codes in the North American Numbering Plan
@@ -561,7 +672,10 @@ _NANP_COUNTRY_AREA_CODES = [
 
 
 def _get_country_code(number):
-    parsed = phonenumbers.parse(number, "US")
+    return _get_parsed_country_code(phonenumbers.parse(number, "US"))
+
+
+def _get_parsed_country_code(parsed):
     country_code = str(parsed.country_code)
     if country_code == us_prefix:
         area_code = str(parsed.national_number)[:3]
@@ -585,21 +699,7 @@ def use_numeric_sender(number):
 
 
 def validate_us_phone_number(number):
-    try:
-        parsed = phonenumbers.parse(number, "US")
-        if not is_us_phone_number(number):
-            raise InvalidPhoneError("Not a US number")
-        if phonenumbers.is_valid_number(parsed):
-            return normalize_phone_number(parsed)
-        if len(str(parsed.national_number)) > 10:
-            raise InvalidPhoneError("Too many digits")
-        if len(str(parsed.national_number)) < 10:
-            raise InvalidPhoneError("Not enough digits")
-        if phonenumbers.is_possible_number(parsed):
-            raise InvalidPhoneError("Phone number range is not in use")
-        raise InvalidPhoneError("Phone number is not possible")
-    except NumberParseException as exc:
-        raise InvalidPhoneError(exc._msg) from exc
+    return PhoneNumber(number).e164
 
 
 def show_mangled_number_clues(number):
@@ -623,25 +723,7 @@ def show_mangled_number_clues(number):
 
 
 def validate_phone_number(number, international=False):
-    if (not international) or is_us_phone_number(number):
-        return validate_us_phone_number(number)
-
-    try:
-        parsed = phonenumbers.parse(number, None)
-        number = f"{parsed.country_code}{parsed.national_number}"
-        if len(number) < 8:
-            raise InvalidPhoneError("Not enough digits")
-        if len(number) > 15:
-            raise InvalidPhoneError("Too many digits")
-        return normalize_phone_number(parsed)
-    except NumberParseException as exc:
-        if exc._msg == "Could not interpret numbers after plus-sign.":
-            raise InvalidPhoneError("Not a valid country prefix") from exc
-        if not isinstance(number, str):
-            raise InvalidPhoneError(f"Number must be string, not type {type(number)}")
-        raise InvalidPhoneError(
-            f"Invalid phone number looks like {show_mangled_number_clues(number)} {exc._msg}"
-        )
+    return PhoneNumber(number, international).e164
 
 
 validate_and_format_phone_number = validate_phone_number
@@ -4,6 +4,24 @@ import unicodedata
 from regex import regex
 
 
+class EncodingTable(dict):
+    """
+    Maps codepoints to what `encode_char` returns for them, in the form
+    `str.translate` expects. Each codepoint is only classified the
+    first time it’s seen, so the language checks and unicode
+    decomposition run once per character rather than once per message.
+    """
+
+    def __init__(self, sanitiser):
+        super().__init__()
+        self.sanitiser = sanitiser
+
+    def __missing__(self, codepoint):
+        encoded = self.sanitiser.encode_char(chr(codepoint))
+        self[codepoint] = encoded
+        return encoded
+
+
 class SanitiseText:
     ALLOWED_CHARACTERS = set()
 
@@ -27,7 +45,17 @@ class SanitiseText:
 
     @classmethod
     def encode(cls, content):
-        return "".join(cls.encode_char(char) for char in content)
+        if cls.ALLOWED_CHARACTERS.issuperset(content):
+            return str(content)
+        return content.translate(cls.get_encoding_table())
+
+    @classmethod
+    def get_encoding_table(cls):
+        # Each subclass allows different characters, so needs a table of
+        # its own rather than one inherited from its parent
+        if "_encoding_table" not in cls.__dict__:
+            cls._encoding_table = EncodingTable(cls)
+        return cls._encoding_table
 
     @classmethod
     def get_non_compatible_characters(cls, content):
@@ -36,12 +64,11 @@ class SanitiseText:
 
         This follows the same rules as `cls.encode`, but returns just the characters that encode would replace with `?`
         """
+        encoding_table = cls.get_encoding_table()
         return set(
             c
-            for c in content
-            if c not in cls.ALLOWED_CHARACTERS
-            and cls.is_extended_language(c) is False
-            and cls.downgrade_character(c) is None
+            for c in set(content) - cls.ALLOWED_CHARACTERS
+            if encoding_table[ord(c)] == "?"
         )
 
     @staticmethod
@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+from notifications_utils.sanitise_text import SanitiseSMS
+
+GSM = "gsm"
+UCS2 = "ucs2"
+
+# Characters that keep a message in the 7-bit encoding when we count
+# fragments for billing. This is deliberately the same set the
+# `fragment_count` GSM check has always used: any whitespace, the
+# basic latin letters and digits, and the GSM-7 punctuation and
+# accented letters. Extended characters (eg `[` or `€`) and the Greek
+# capitals are not in it, so messages containing them are counted as
+# UCS-2, which is how existing notifications have been billed.
+GSM_CHARACTERS = frozenset(
+    "abcdefghijklmnopqrstuvwxyz"
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    "0123456789"
+    "_@?£!$\"¥#è¤é%ù&ì\\ò(Ç)*:Ø+;ÄäøÆ,<Ööæ-=ÑñÅß.>ÜüåÉ/§à¡¿'"
+) | frozenset(chr(codepoint) for codepoint in range(0x3001) if chr(codepoint).isspace())
+
+EXTENDED_GSM_CHARACTERS = frozenset(SanitiseSMS.EXTENDED_GSM_CHARACTERS)
+
+sms_segments = namedtuple(
+    "sms_segments",
+    [
+        "encoding",
+        "character_count",
+        "extended_character_count",
+        "fragment_count",
+    ],
+)
+
+
+def get_sms_segments(content):
+    """
+    Works out the encoding, length and number of fragments of a rendered
+    SMS with one scan of the content.
+
+    A fragment is up to 160 GSM characters, or 70 UCS-2 characters. A
+    message longer than that is split into fragments of 153 or 67
+    characters, to leave room for the header which joins them together.
+    """
+    characters = set(content)
+    character_count = len(content)
+
+    extended_characters = characters & EXTENDED_GSM_CHARACTERS
+    extended_character_count = (
+        sum(map(content.count, extended_characters)) if extended_characters else 0
+    )
+
+    if content and characters <= GSM_CHARACTERS:
+        return sms_segments(
+            GSM,
+            character_count,
+            extended_character_count,
+            _fragments(character_count, single=160, multipart=153),
+        )
+
+    return sms_segments(
+        UCS2,
+        character_count,
+        extended_character_count,
+        _fragments(character_count, single=70, multipart=67),
+    )
+
+
+def get_sms_fragment_counts(messages):
+    """
+    Returns the fragment count of each rendered message, in order, for
+    example when recomputing billable units (see the fix-billable-units
+    command).
+    """
+    return [get_sms_segments(message).fragment_count for message in messages]
+
+
+def _fragments(character_count, *, single, multipart):
+    if character_count <= single:
+        return 1 if character_count else 0
+    return -(-character_count // multipart)
@@ -9,8 +9,9 @@ from jinja2 import Environment, FileSystemLoader, select_autoescape
 from markupsafe import Markup
 
 from notifications_utils import MAGIC_SEQUENCE, SMS_CHAR_COUNT_LIMIT
-from notifications_utils.field import Field, PlainTextField
+from notifications_utils.field import Field, Placeholder, PlainTextField
 from notifications_utils.formatters import (
+    OBSCURE_ZERO_WIDTH_WHITESPACE,
     add_prefix,
     add_trailing_newline,
     autolink_urls,
@@ -28,13 +29,14 @@ from notifications_utils.formatters import (
     strip_unsupported_characters,
     unlink_govuk_escaped,
 )
-from notifications_utils.insensitive_dict import InsensitiveDict
+from notifications_utils.insensitive_dict import InsensitiveDict, NormalisedKeys
 from notifications_utils.markdown import (
     notify_email_markdown,
     notify_email_preheader_markdown,
     notify_plain_text_email_markdown,
 )
 from notifications_utils.sanitise_text import SanitiseSMS
+from notifications_utils.sms_segments import get_sms_segments
 from notifications_utils.take import Take
 from notifications_utils.template_change import TemplateChange
 
@@ -103,16 +105,21 @@ class Template(ABC):
     def values(self, value):
         if not value:
             self._values = {}
-        else:
-            placeholders = InsensitiveDict.from_keys(self.placeholders)
-            self._values = InsensitiveDict(value).as_dict_with_keys(
-                self.placeholders
-                | set(
-                    key
-                    for key in value.keys()
-                    if InsensitiveDict.make_key(key) not in placeholders.keys()
-                )
-            )
+            return
+
+        if not hasattr(self, "_normalised_keys"):
+            self._normalised_keys = NormalisedKeys()
+        normalised_keys = self._normalised_keys
+
+        values_by_key = {normalised_keys[key]: item for key, item in value.items()}
+        placeholder_keys = set()
+        self._values = {}
+        for placeholder in self.placeholders:
+            placeholder_keys.add(normalised_keys[placeholder])
+            self._values[placeholder] = values_by_key.get(normalised_keys[placeholder])
+        for key in value.keys():
+            if normalised_keys[key] not in placeholder_keys:
+                self._values[key] = values_by_key[normalised_keys[key]]
 
     @property
     def placeholders(self):
@@ -184,6 +191,7 @@ class BaseSMSTemplate(Template):
         # cached count.
         if self._content_count is not None:
             self._content_count = None
+        self._rendered = (None, None)
 
         # Assigning to super().values doesn’t work here. We need to get
         # the property object instead, which has the special method
@@ -240,40 +248,10 @@ class BaseSMSTemplate(Template):
 
         Since we are supporting more or less "all" languages, it doesn't seem like we really want to count chars,
         and that counting bytes should suffice.
-        """
-
-        # check if all chars are in the GSM-7 character set
-        def gsm_check(x):
-            rule = re.compile(
-                r'^[\sa-zA-Z0-9_@?£!1$"¥#è?¤é%ù&ì\\ò(Ç)*:Ø+;ÄäøÆ,<LÖlöæ\-=ÑñÅß.>ÜüåÉ/§à¡¿\']+$'
-            )
-            gsm_match = rule.search(x)
-            if gsm_match is None:
-                return False
-            return True
-
-        message_str = self.content_with_placeholders_filled_in
-
-        content_len = len(message_str)
-
-        """
-        Checks for GSM-7 char set, calculates msg size, and
-        then fragments based on multipart message rules. ASCII
-        was not specifically called out as almost all messages will
-        switch from 7bit GSM to Unicode.
 
         Calculations are based on https://messente.com/documentation/tools/sms-length-calculator
         """
-        if gsm_check(message_str):
-            if content_len <= 160:
-                return math.ceil(content_len / 160)
-            else:
-                return math.ceil(content_len / 153)
-        else:
-            if content_len <= 70:
-                return math.ceil(content_len / 70)
-            else:
-                return math.ceil(content_len / 67)
+        return get_sms_segments(self.content_with_placeholders_filled_in).fragment_count
 
     def is_message_too_long(self):
         """
@@ -291,23 +269,39 @@ class BaseSMSTemplate(Template):
         # This is faster to call than SMSMessageTemplate.__str__ if all
         # you need to know is how many characters are in the message
         if self.values:
+            render_plan = get_sms_render_plan(self.content, self.prefix)
+            rendered = render_plan.render(self.values)
+            if rendered is not None:
+                return rendered
+            filled = render_plan.fill(self.values)
+            if filled is not None:
+                return normalise_sms_content(filled, self.prefix)
             values = self.values
         else:
             values = {key: MAGIC_SEQUENCE for key in self.placeholders}
-        return (
-            Take(PlainTextField(self.content, values, html="passthrough"))
-            .then(add_prefix, self.prefix)
-            .then(remove_whitespace_before_punctuation)
-            .then(normalise_whitespace_and_newlines)
-            .then(normalise_multiple_newlines)
-            .then(str.strip)
-            .then(str.replace, MAGIC_SEQUENCE, "")
+        return normalise_sms_content(
+            PlainTextField(self.content, values, html="passthrough"), self.prefix
         )
 
 
 class SMSMessageTemplate(BaseSMSTemplate):
     def __str__(self):
-        return sms_encode(self._get_unsanitised_content())
+        # Counting fragments and sending both need the rendered message,
+        # so keep it until the values, content or prefix change
+        cache_key = (self.content, self.prefix)
+        if getattr(self, "_rendered", (None, None))[0] == cache_key:
+            return self._rendered[1]
+
+        rendered = None
+        if self.values:
+            rendered = get_sms_render_plan(self.content, self.prefix).render(
+                self.values, encode=True
+            )
+        if rendered is None:
+            rendered = sms_encode(self._get_unsanitised_content())
+
+        self._rendered = (cache_key, rendered)
+        return rendered
 
 
 class SMSBodyPreviewTemplate(BaseSMSTemplate):
@@ -497,21 +491,14 @@ class BaseEmailTemplate(SubjectMixin, Template):
 
     @property
     def html_body(self):
-        return (
-            Take(
-                Field(
-                    self.content,
-                    self.values,
-                    html="escape",
-                    markdown_lists=True,
-                    redact_missing_personalisation=self.redact_missing_personalisation,
-                )
+        return render_html_email_body(
+            Field(
+                self.content,
+                self.values,
+                html="escape",
+                markdown_lists=True,
+                redact_missing_personalisation=self.redact_missing_personalisation,
             )
-            .then(unlink_govuk_escaped)
-            .then(strip_unsupported_characters)
-            .then(add_trailing_newline)
-            .then(notify_email_markdown)
-            .then(do_nice_typography)
         )
 
     @property
@@ -554,12 +541,15 @@ class BaseEmailTemplate(SubjectMixin, Template):
 
 class PlainTextEmailTemplate(BaseEmailTemplate):
     def __str__(self):
-        return (
-            Take(
-                Field(
-                    self.content, self.values, html="passthrough", markdown_lists=True
-                )
+        filled = None
+        if self.values:
+            filled = get_render_plan(self.content).fill(self.values)
+        if filled is None:
+            filled = Field(
+                self.content, self.values, html="passthrough", markdown_lists=True
             )
+        return (
+            Take(filled)
             .then(unlink_govuk_escaped)
             .then(strip_unsupported_characters)
             .then(add_trailing_newline)
@@ -614,8 +604,8 @@ class HTMLEmailTemplate(BaseEmailTemplate):
 
     @property
     def preheader(self):
-        return " ".join(
-            Take(
+        return self._truncate_preheader(
+            render_email_preheader(
                 Field(
                     self.content,
                     self.values,
@@ -623,13 +613,24 @@ class HTMLEmailTemplate(BaseEmailTemplate):
                     markdown_lists=True,
                 )
             )
-            .then(unlink_govuk_escaped)
-            .then(strip_unsupported_characters)
-            .then(add_trailing_newline)
-            .then(notify_email_preheader_markdown)
-            .then(do_nice_typography)
-            .split()
-        )[: self.PREHEADER_LENGTH_IN_CHARACTERS].strip()
+        )
+
+    def _truncate_preheader(self, preheader):
+        return " ".join(preheader.split())[
+            : self.PREHEADER_LENGTH_IN_CHARACTERS
+        ].strip()
+
+    @property
+    def branding(self):
+        return {
+            "govuk_banner": self.govuk_banner,
+            "complete_html": self.complete_html,
+            "brand_logo": self.brand_logo,
+            "brand_text": self.brand_text,
+            "brand_colour": self.brand_colour,
+            "brand_banner": self.brand_banner,
+            "brand_name": self.brand_name,
+        }
 
     def __str__(self):
         return self.jinja_template.render(
@@ -637,16 +638,94 @@ class HTMLEmailTemplate(BaseEmailTemplate):
                 "subject": self.subject,
                 "body": self.html_body,
                 "preheader": self.preheader,
-                "govuk_banner": self.govuk_banner,
-                "complete_html": self.complete_html,
-                "brand_logo": self.brand_logo,
-                "brand_text": self.brand_text,
-                "brand_colour": self.brand_colour,
-                "brand_banner": self.brand_banner,
-                "brand_name": self.brand_name,
+                **self.branding,
             }
         )
 
+    def render_in_shell(self, formatter=None):
+        """
+        Renders the same HTML as `str(self)`, but reuses the banner and
+        branding rendered for previous emails with the same branding, so
+        only the subject, body and preheader are rendered for each email.
+
+        If a formatter is given, the result is the same as calling it on
+        the whole email, provided it only changes text within the subject,
+        body or preheader and can’t match across their boundaries.
+        """
+        shell = get_html_email_shell(formatter, **self.branding)
+        if shell is None:
+            return formatter(str(self)) if formatter else str(self)
+        return shell.splice(
+            subject=self.subject,
+            body=self._get_html_body_from_render_plan(),
+            preheader=self._get_preheader_from_render_plan(),
+        )
+
+    def _get_html_body_from_render_plan(self):
+        if self.values:
+            rendered = get_html_email_body_render_plan(self.content).render(self.values)
+            if rendered is not None:
+                return rendered
+        return self.html_body
+
+    def _get_preheader_from_render_plan(self):
+        if self.values:
+            rendered = get_email_preheader_render_plan(self.content).render(self.values)
+            if rendered is not None:
+                return self._truncate_preheader(rendered)
+        return self.preheader
+
+
+class HTMLEmailShell:
+    """
+    The HTML that wraps an email, rendered once for a set of branding
+    options with markers where the subject, body and preheader go.
+    """
+
+    slot_markers = re.compile(r"<!--notify-(subject|body|preheader)-->")
+
+    def __init__(self, static_segments, slots, formatter=None):
+        self.static_segments = static_segments
+        self.slots = slots
+        self.formatter = formatter
+
+    @classmethod
+    def from_branding(cls, formatter=None, **branding):
+        html = HTMLEmailTemplate.jinja_template.render(
+            {
+                "subject": "<!--notify-subject-->",
+                "body": "<!--notify-body-->",
+                "preheader": "<!--notify-preheader-->",
+                **branding,
+            }
+        )
+        parts = cls.slot_markers.split(html)
+        slots = tuple(parts[1::2])
+        if len(slots) != len(set(slots)):
+            # The branding itself contains one of our markers, so we
+            # can’t tell which one is really the slot
+            return None
+        static_segments = tuple(parts[0::2])
+        if formatter:
+            static_segments = tuple(formatter(segment) for segment in static_segments)
+        return cls(static_segments, slots, formatter)
+
+    def splice(self, **values):
+        values = {
+            slot: self.formatter(str(value)) if self.formatter else str(value)
+            for slot, value in values.items()
+        }
+        spliced = [self.static_segments[0]]
+        for slot, static_segment in zip(self.slots, self.static_segments[1:]):
+            spliced.append(values[slot])
+            spliced.append(static_segment)
+        return "".join(spliced)
+
+
+@lru_cache(maxsize=128)
+def get_html_email_shell(formatter=None, **branding):
+    return HTMLEmailShell.from_branding(formatter, **branding)
+
 
 class EmailPreviewTemplate(BaseEmailTemplate):
     jinja_template = template_env.get_template("email_preview_template.jinja2")
@@ -721,7 +800,7 @@ def non_gsm_characters(content):
 
 
 def count_extended_gsm_chars(content):
-    return sum(map(content.count, SanitiseSMS.EXTENDED_GSM_CHARACTERS))
+    return get_sms_segments(content).extended_character_count
 
 
 def do_nice_typography(value):
@@ -734,6 +813,304 @@ def do_nice_typography(value):
     )
 
 
+def render_html_email_body(content):
+    return (
+        Take(content)
+        .then(unlink_govuk_escaped)
+        .then(strip_unsupported_characters)
+        .then(add_trailing_newline)
+        .then(notify_email_markdown)
+        .then(do_nice_typography)
+    )
+
+
+def render_email_preheader(content):
+    return (
+        Take(content)
+        .then(unlink_govuk_escaped)
+        .then(strip_unsupported_characters)
+        .then(add_trailing_newline)
+        .then(notify_email_preheader_markdown)
+        .then(do_nice_typography)
+    )
+
+
+def normalise_sms_content(content, prefix=None):
+    return (
+        Take(content)
+        .then(add_prefix, prefix)
+        .then(remove_whitespace_before_punctuation)
+        .then(normalise_whitespace_and_newlines)
+        .then(normalise_multiple_newlines)
+        .then(str.strip)
+        .then(str.replace, MAGIC_SEQUENCE, "")
+    )
+
+
+class RenderPlan:
+    """
+    A template’s content split once into static text and placeholder
+    slots, so that filling it in doesn’t need to run the placeholder
+    regex or build a `Field` for every message.
+    """
+
+    def __init__(self, content):
+        parts = Field.placeholder_pattern.split(content)
+        self.static_segments = tuple(parts[0::2])
+        self.slots = tuple(Placeholder(body) for body in parts[1::2])
+
+    def fill(self, values):
+        """
+        Returns the same string as `Field(content, values, html="passthrough")`
+        would, or `None` if any placeholder is missing a value or has a list
+        as its value, because those need the full formatting of `Field`.
+        """
+        filled = [self.static_segments[0]]
+        for placeholder, static_segment in zip(self.slots, self.static_segments[1:]):
+            value = values.get(placeholder.name)
+            if value is None or isinstance(value, list):
+                return None
+            if placeholder.is_conditional():
+                value = placeholder.get_conditional_body(value)
+            filled.append(str(value))
+            filled.append(static_segment)
+        return "".join(filled)
+
+
+class SMSRenderPlan(RenderPlan):
+    """
+    Compiles the content and prefix of an SMS template with the
+    whitespace, punctuation and encoding rules of `SMSMessageTemplate`
+    already applied to the static text.
+
+    This works by normalising the content once with a private use
+    character standing in for each placeholder. Any value which is
+    non-empty and doesn’t contain whitespace, commas, full stops or
+    characters the normalisation removes can’t interact with the text
+    around it, so it can be spliced in where its stand-in character
+    ended up. Other values fall back to normalising the whole message.
+    """
+
+    FIRST_SLOT_CHARACTER = 0xE000
+    LAST_SLOT_CHARACTER = 0xF8FF
+
+    slot_characters = re.compile(r"([\ue000-\uf8ff])")
+    unsafe_value_characters = re.compile(
+        r"[\s,.{}{}]".format(OBSCURE_ZERO_WIDTH_WHITESPACE, MAGIC_SEQUENCE)
+    )
+
+    def __init__(self, content, prefix=None):
+        super().__init__(content)
+        self.prefix = prefix
+        self.slot_names = None
+        self.normalised_segments = None
+        self.encoded_segments = None
+
+        if any(placeholder.is_conditional() for placeholder in self.slots):
+            return
+
+        if self.slot_characters.search(content + (prefix or "")):
+            return
+
+        slot_names = InsensitiveDict.from_keys(
+            placeholder.name for placeholder in self.slots
+        )
+        if len(slot_names) > self.LAST_SLOT_CHARACTER - self.FIRST_SLOT_CHARACTER:
+            return
+
+        slot_characters = {
+            key: chr(self.FIRST_SLOT_CHARACTER + index)
+            for index, key in enumerate(slot_names.keys())
+        }
+        parts = self.slot_characters.split(
+            normalise_sms_content(
+                self.fill(
+                    {
+                        placeholder.name: slot_characters[
+                            InsensitiveDict.make_key(placeholder.name)
+                        ]
+                        for placeholder in self.slots
+                    }
+                ),
+                prefix,
+            )
+        )
+        names_by_character = {
+            character: slot_names[key] for key, character in slot_characters.items()
+        }
+
+        self.slot_names = tuple(names_by_character[c] for c in parts[1::2])
+        self.normalised_segments = tuple(parts[0::2])
+        self.encoded_segments = tuple(
+            sms_encode(segment) for segment in self.normalised_segments
+        )
+
+    def render(self, values, encode=False):
+        """
+        Returns the message as `SMSMessageTemplate` would render it (or its
+        unsanitised content if `encode` is false), or `None` if the values
+        can’t be spliced into the precomputed segments.
+        """
+        if self.slot_names is None:
+            return None
+
+        segments = self.encoded_segments if encode else self.normalised_segments
+        rendered = [segments[0]]
+        for name, segment in zip(self.slot_names, segments[1:]):
+            value = values.get(name)
+            if value is None or isinstance(value, list):
+                return None
+            value = str(value)
+            if not value or self.unsafe_value_characters.search(value):
+                return None
+            rendered.append(sms_encode(value) if encode else value)
+            rendered.append(segment)
+        return "".join(rendered)
+
+
+class EmailMarkdownRenderPlan(RenderPlan):
+    """
+    Renders the markdown of an email template once, as the HTML body or
+    the preheader, with a token made of letters and digits standing in
+    for each placeholder.
+
+    A value made of letters and digits is treated by the markdown parser
+    and the typography rules in the same way as the token, so it can be
+    substituted for it in the rendered output. Values that could change
+    the structure of the document, or that contain anything else, fall
+    back to rendering the whole body.
+    """
+
+    slot_token_prefix = "xnotifyslot"
+    slot_tokens = re.compile(r"xnotifyslot([0-9]+)x")
+    quotes = ("'", '"', "`")
+    opening_s = re.compile(r"s\b")
+    list_marker_prefix = re.compile(r"^[\s>*+\-0-9.)]*$")
+    list_marker_suffix = re.compile(r"^[0-9]*[.)]")
+
+    def __init__(self, content, renderer=render_html_email_body):
+        super().__init__(content)
+        self.slot_names = None
+        self.rendered_segments = None
+
+        if any(placeholder.is_conditional() for placeholder in self.slots):
+            return
+
+        if self.slot_token_prefix in content.lower():
+            return
+
+        tokens = [
+            f"{self.slot_token_prefix}{index}x" for index in range(len(self.slots))
+        ]
+        parts = self.slot_tokens.split(
+            renderer(
+                Field(
+                    "".join(
+                        segment + token
+                        for segment, token in zip(self.static_segments, tokens + [""])
+                    ),
+                    html="escape",
+                    markdown_lists=True,
+                )
+            )
+        )
+        if any(self.slot_token_prefix in segment for segment in parts[0::2]):
+            # A token has been changed by the renderer, for example
+            # because it was part of a URL
+            return
+        if set(map(int, parts[1::2])) != set(range(len(self.slots))):
+            # A token has been left out, for example because it was
+            # the URL of a link in the preheader
+            return
+
+        self.slot_names = tuple(self.slots[int(index)].name for index in parts[1::2])
+        self.rendered_segments = tuple(parts[0::2])
+        self.keys_between_whitespace = {
+            InsensitiveDict.make_key(placeholder.name) for placeholder in self.slots
+        }
+        self.keys_after_quotes = set()
+        self.keys_at_start_of_line = set()
+        for index, placeholder in enumerate(self.slots):
+            key = InsensitiveDict.make_key(placeholder.name)
+            before = self.static_segments[index]
+            after = self.static_segments[index + 1]
+            # An empty segment between two placeholders joins them into
+            # one word, so is only a boundary at the start or end
+            space_before = before[-1].isspace() if before else index == 0
+            space_after = after[0].isspace() if after else index == len(self.slots) - 1
+            if not (space_before and space_after):
+                self.keys_between_whitespace.discard(key)
+            if before.endswith(self.quotes):
+                # Smartypants decides which way a quote faces from the
+                # character after it
+                self.keys_after_quotes.add(key)
+            if self.list_marker_prefix.match(
+                before.rpartition("\n")[2]
+            ) and self.list_marker_suffix.match(after):
+                # A number here could become an ordered list marker
+                self.keys_at_start_of_line.add(key)
+
+    def _can_substitute(self, name, value):
+        key = InsensitiveDict.make_key(name)
+        words = value.split(" ")
+        if not all(word.isascii() and word.isalnum() for word in words):
+            return False
+        if len(words) > 1 and key not in self.keys_between_whitespace:
+            return False
+        if key in self.keys_after_quotes and (
+            not value[0].isalpha() or self.opening_s.match(value)
+        ):
+            return False
+        if key in self.keys_at_start_of_line and value.isdigit():
+            return False
+        lowercase_value = value.lower()
+        if lowercase_value.endswith("gov") or lowercase_value.startswith("uk"):
+            return False
+        if value.endswith(("http", "https")):
+            return False
+        return True
+
+    def render(self, values):
+        """
+        Returns the same output as the renderer would give for these
+        values, or `None` if any value can’t be substituted.
+        """
+        if self.slot_names is None:
+            return None
+
+        rendered = [self.rendered_segments[0]]
+        for name, segment in zip(self.slot_names, self.rendered_segments[1:]):
+            value = values.get(name)
+            if value is None or isinstance(value, list):
+                return None
+            value = str(value)
+            if not self._can_substitute(name, value):
+                return None
+            rendered.append(value)
+            rendered.append(segment)
+        return "".join(rendered)
+
+
+@lru_cache(maxsize=1024)
+def get_html_email_body_render_plan(content):
+    return EmailMarkdownRenderPlan(content, render_html_email_body)
+
+
+@lru_cache(maxsize=1024)
+def get_email_preheader_render_plan(content):
+    return EmailMarkdownRenderPlan(content, render_email_preheader)
+
+
+@lru_cache(maxsize=1024)
+def get_render_plan(content):
+    return RenderPlan(content)
+
+
+@lru_cache(maxsize=1024)
+def get_sms_render_plan(content, prefix=None):
+    return SMSRenderPlan(content, prefix)
+
+
 @lru_cache(maxsize=1024)
 def get_placeholders(content):
     return Field(content).placeholders
@@ -7,14 +7,19 @@ from celery.exceptions import MaxRetriesExceededError
 
 import app
 from app.celery import provider_tasks
-from app.celery.provider_tasks import deliver_email, deliver_sms
+from app.celery.provider_tasks import (
+    deliver_email,
+    deliver_email_batches,
+    deliver_sms,
+    deliver_sms_batches,
+)
 from app.clients.email import EmailClientNonRetryableException
 from app.clients.email.aws_ses import (
     AwsSesClientException,
     AwsSesClientThrottlingSendRateException,
 )
 from app.clients.sms import SmsClientResponseException
-from app.enums import NotificationStatus
+from app.enums import NotificationStatus, NotificationType
 from app.exceptions import NotificationTechnicalFailureException
 
 
@@ -49,6 +54,339 @@ def test_should_add_to_retry_queue_if_notification_not_found_in_deliver_sms_task
     )
 
 
+def test_deliver_sms_batches_does_nothing_unless_switched_on(notify_api, mocker):
+    mock_claim = mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs"
+    )
+
+    deliver_sms_batches()
+
+    assert mock_claim.called is False
+
+
+def test_deliver_sms_batches_sends_batches_until_none_are_full(notify_api, mocker):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "DELIVER_SMS_IN_BATCHES": True,
+            "SMS_DELIVERY_BATCH_SIZE": 2,
+            "SMS_DELIVERY_CONCURRENCY": 5,
+        },
+    )
+    mock_claim = mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs",
+        side_effect=[["a", "b"], ["c"], ["d"]],
+    )
+    mock_send = mocker.patch(
+        "app.delivery.send_to_providers.send_sms_batch_to_provider",
+        return_value=(1, []),
+    )
+
+    deliver_sms_batches()
+
+    assert mock_claim.call_args_list == [mocker.call(NotificationType.SMS, 2)] * 2
+    assert mock_send.call_args_list == [
+        mocker.call(["a", "b"], max_workers=5),
+        mocker.call(["c"], max_workers=5),
+    ]
+
+
+def test_deliver_sms_batches_retries_failed_notifications_with_deliver_sms(
+    notify_api, mocker
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {"DELIVER_SMS_IN_BATCHES": True, "SMS_DELIVERY_BATCH_SIZE": 2},
+    )
+    mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs",
+        return_value=["a"],
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.send_sms_batch_to_provider",
+        return_value=(0, ["a"]),
+    )
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+
+    deliver_sms_batches()
+
+    mock_deliver_sms.assert_called_once_with(
+        ["a"], queue="retry-tasks", countdown=300, retries=1, expires=ANY
+    )
+
+
+def test_deliver_sms_batches_schedules_retries_in_redis_if_switched_on(
+    notify_api, mocker
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "DELIVER_SMS_IN_BATCHES": True,
+            "SMS_DELIVERY_BATCH_SIZE": 3,
+            "RETRY_DELIVERIES_FROM_REDIS": True,
+        },
+    )
+    mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs",
+        return_value=["a", "b"],
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.send_sms_batch_to_provider",
+        return_value=(0, ["a", "b"]),
+    )
+    mock_redis = mocker.patch("app.celery.provider_tasks.redis_store")
+    mocker.patch("app.celery.provider_tasks.time", return_value=1000)
+    mocker.patch("app.celery.provider_tasks.random.uniform", return_value=12)
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+
+    deliver_sms_batches()
+
+    assert mock_deliver_sms.called is False
+    mock_redis.zadd.assert_called_once_with(
+        "delivery-retries",
+        {
+            json.dumps(
+                {
+                    "task": "deliver_sms",
+                    "notification_id": notification_id,
+                    "retries": 1,
+                }
+            ): 1312
+            for notification_id in ("a", "b")
+        },
+        raise_exception=True,
+    )
+
+
+def test_release_abandoned_delivery_claims_does_nothing_unless_switched_on(
+    notify_api, mocker
+):
+    mock_release = mocker.patch(
+        "app.dao.notifications_dao.dao_release_abandoned_delivery_claims"
+    )
+
+    provider_tasks.release_abandoned_delivery_claims()
+
+    assert mock_release.called is False
+
+
+def test_release_abandoned_delivery_claims(notify_api, mocker):
+    mocker.patch.dict(notify_api.config, {"DELIVER_SMS_IN_BATCHES": True})
+    mock_release = mocker.patch(
+        "app.dao.notifications_dao.dao_release_abandoned_delivery_claims",
+        return_value=3,
+    )
+
+    provider_tasks.release_abandoned_delivery_claims()
+
+    mock_release.assert_called_once_with()
+
+
+def test_deliver_email_batches_does_nothing_unless_switched_on(notify_api, mocker):
+    mock_claim = mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs"
+    )
+
+    deliver_email_batches()
+
+    assert mock_claim.called is False
+
+
+def test_deliver_email_batches_sends_batches_until_none_are_full(notify_api, mocker):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "DELIVER_EMAIL_IN_BATCHES": True,
+            "EMAIL_DELIVERY_BATCH_SIZE": 2,
+            "EMAIL_DELIVERY_CONCURRENCY": 5,
+        },
+    )
+    mock_claim = mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs",
+        side_effect=[["a", "b"], []],
+    )
+    mock_send = mocker.patch(
+        "app.delivery.send_to_providers.send_email_batch_to_provider",
+        return_value=(2, []),
+    )
+
+    deliver_email_batches()
+
+    assert mock_claim.call_args_list == [mocker.call(NotificationType.EMAIL, 2)] * 2
+    mock_send.assert_called_once_with(["a", "b"], max_workers=5)
+
+
+def test_deliver_email_batches_retries_failed_notifications_with_deliver_email(
+    notify_api, mocker
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {"DELIVER_EMAIL_IN_BATCHES": True, "EMAIL_DELIVERY_BATCH_SIZE": 3},
+    )
+    mocker.patch(
+        "app.dao.notifications_dao.dao_claim_created_notifications_from_jobs",
+        return_value=["a", "b"],
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.send_email_batch_to_provider",
+        return_value=(0, ["a", "b"]),
+    )
+    mock_deliver_email = mocker.patch(
+        "app.celery.provider_tasks.deliver_email.apply_async"
+    )
+
+    deliver_email_batches()
+
+    assert mock_deliver_email.call_args_list == [
+        mocker.call(
+            [notification_id],
+            queue="retry-tasks",
+            countdown=30,
+            retries=1,
+            expires=ANY,
+        )
+        for notification_id in ("a", "b")
+    ]
+
+
+@pytest.mark.parametrize("retries, countdown", [(0, 0), (1, 300)])
+def test_deliver_sms_schedules_retries_in_redis_if_switched_on(
+    notify_db_session, notify_api, mocker, retries, countdown
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {"RETRY_DELIVERIES_FROM_REDIS": True, "DELIVERY_RETRY_JITTER": 30},
+    )
+    mock_redis = mocker.patch("app.celery.provider_tasks.redis_store")
+    mocker.patch("app.celery.provider_tasks.time", return_value=1000)
+    mocker.patch("app.celery.provider_tasks.random.uniform", return_value=12)
+    mock_retry = mocker.patch("app.celery.provider_tasks.deliver_sms.retry")
+    notification_id = app.create_uuid()
+
+    deliver_sms.push_request(retries=retries)
+    deliver_sms(notification_id)
+    deliver_sms.pop_request()
+
+    assert mock_retry.called is False
+    mock_redis.zadd.assert_called_once_with(
+        "delivery-retries",
+        {
+            json.dumps(
+                {
+                    "task": "deliver_sms",
+                    "notification_id": str(notification_id),
+                    "retries": retries + 1,
+                }
+            ): 1000
+            + countdown
+            + 12
+        },
+        raise_exception=True,
+    )
+
+
+def test_deliver_email_uses_celery_retries_if_redis_fails(
+    sample_notification, notify_api, mocker
+):
+    mocker.patch.dict(notify_api.config, {"RETRY_DELIVERIES_FROM_REDIS": True})
+    mocker.patch(
+        "app.delivery.send_to_providers.send_email_to_provider",
+        side_effect=Exception("EXPECTED"),
+    )
+    mocker.patch("app.redis_store.get", return_value=None)
+    mock_redis = mocker.patch("app.celery.provider_tasks.redis_store")
+    mock_redis.zadd.side_effect = Exception("redis unavailable")
+    mock_retry = mocker.patch("app.celery.provider_tasks.deliver_email.retry")
+
+    deliver_email(sample_notification.id)
+
+    mock_retry.assert_called_once_with(queue="retry-tasks", expires=ANY)
+
+
+def test_move_due_delivery_retries(notify_api, mocker):
+    mocker.patch("app.celery.provider_tasks.DELIVERY_RETRIES_BATCH_SIZE", 2)
+    mocker.patch("app.celery.provider_tasks.time", return_value=1000)
+    mock_redis = mocker.patch("app.celery.provider_tasks.redis_store")
+    mock_redis.pop_by_score.side_effect = [
+        [
+            json.dumps({"task": "deliver_sms", "notification_id": "a", "retries": 1}),
+            json.dumps({"task": "deliver_email", "notification_id": "b", "retries": 3}),
+        ],
+        [json.dumps({"task": "deliver_sms", "notification_id": "c", "retries": 48})],
+    ]
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+    mock_deliver_email = mocker.patch(
+        "app.celery.provider_tasks.deliver_email.apply_async"
+    )
+
+    provider_tasks.move_due_delivery_retries()
+
+    assert (
+        mock_redis.pop_by_score.call_args_list
+        == [mocker.call("delivery-retries", 1000, 2)] * 2
+    )
+    assert mock_deliver_sms.call_args_list == [
+        mocker.call(["a"], queue="retry-tasks", retries=1, expires=ANY),
+        mocker.call(["c"], queue="retry-tasks", retries=48, expires=ANY),
+    ]
+    mock_deliver_email.assert_called_once_with(
+        ["b"], queue="retry-tasks", retries=3, expires=ANY
+    )
+
+
+def test_move_due_delivery_retries_puts_back_what_it_fails_to_send(notify_api, mocker):
+    mocker.patch("app.celery.provider_tasks.time", return_value=1000)
+    mock_redis = mocker.patch("app.celery.provider_tasks.redis_store")
+    retries = [
+        json.dumps(
+            {"task": "deliver_sms", "notification_id": notification_id, "retries": 1}
+        )
+        for notification_id in ("a", "b", "c")
+    ]
+    mock_redis.pop_by_score.return_value = retries
+    mock_deliver_sms = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms.apply_async",
+        side_effect=[None, Exception("broker unavailable")],
+    )
+
+    provider_tasks.move_due_delivery_retries()
+
+    assert mock_deliver_sms.call_count == 2
+    mock_redis.pop_by_score.assert_called_once()
+    mock_redis.zadd.assert_called_once_with(
+        "delivery-retries", {retries[1]: 1000, retries[2]: 1000}
+    )
+
+
+def test_move_due_delivery_retries_dead_letters_what_it_cannot_decode(
+    notify_api, mocker
+):
+    mocker.patch("app.celery.provider_tasks.time", return_value=1000)
+    mock_redis = mocker.patch("app.celery.provider_tasks.redis_store")
+    unknown_task = json.dumps(
+        {"task": "deliver_letter", "notification_id": "b", "retries": 1}
+    )
+    mock_redis.pop_by_score.return_value = [
+        json.dumps({"task": "deliver_sms", "notification_id": "a", "retries": 1}),
+        unknown_task,
+        b"not_a_valid_json",
+        json.dumps({"task": "deliver_sms", "notification_id": "c", "retries": 2}),
+    ]
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+
+    provider_tasks.move_due_delivery_retries()
+
+    assert mock_deliver_sms.call_args_list == [
+        mocker.call(["a"], queue="retry-tasks", retries=1, expires=ANY),
+        mocker.call(["c"], queue="retry-tasks", retries=2, expires=ANY),
+    ]
+    assert mock_redis.rpush.call_args_list == [
+        mocker.call("delivery-retries-dead-letter", unknown_task),
+        mocker.call("delivery-retries-dead-letter", b"not_a_valid_json"),
+    ]
+    mock_redis.zadd.assert_not_called()
+
+
 def test_should_retry_and_log_warning_if_SmsClientResponseException_for_deliver_sms_task(
     sample_notification, mocker
 ):
@@ -1,10 +1,13 @@
 import json
+import uuid
 from collections import namedtuple
 from datetime import timedelta
 from unittest import mock
 from unittest.mock import ANY, MagicMock, call
 
 import pytest
+from freezegun import freeze_time
+from sqlalchemy.exc import SQLAlchemyError
 
 from app.celery import scheduled_tasks
 from app.celery.scheduled_tasks import (
@@ -13,14 +16,21 @@ from app.celery.scheduled_tasks import (
     check_for_services_with_high_failure_rates_or_sending_to_tv_numbers,
     check_job_status,
     delete_verify_codes,
+    deliver_created_sms_stragglers,
     expire_or_delete_invitations,
     process_delivery_receipts,
+    recover_message_queue_claims,
     replay_created_notifications,
     run_scheduled_jobs,
 )
 from app.config import QueueNames, Test
 from app.dao.jobs_dao import dao_get_job_by_id
 from app.enums import JobStatus, NotificationStatus, TemplateType
+from app.models import Notification
+from app.notifications.notification_codec import (
+    decode_queued_notification,
+    encode_queued_notification,
+)
 from app.utils import utc_now
 from notifications_utils.clients.zendesk.zendesk_client import NotifySupportTicket
 from tests.app import load_example_csv
@@ -261,6 +271,79 @@ def test_check_job_status_task_sets_jobs_to_error(mocker, sample_template):
     assert job_2.job_status == JobStatus.IN_PROGRESS
 
 
+@pytest.mark.parametrize("deliver_sms_in_batches", [False, True])
+def test_deliver_created_sms_stragglers(
+    notify_api, sample_template, sample_job, mocker, deliver_sms_in_batches
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "DELIVER_AFTER_BATCH_INSERT": True,
+            "DELIVER_SMS_IN_BATCHES": deliver_sms_in_batches,
+            "DELIVERY_SWEEP_AGE": 600,
+        },
+    )
+    sms_delivery_queue = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms.apply_async"
+    )
+    straggler = create_notification(
+        sample_template, created_at=utc_now() - timedelta(minutes=20)
+    )
+    job_straggler = create_notification(
+        job=sample_job, created_at=utc_now() - timedelta(minutes=20)
+    )
+    # notifications that are not to be resent
+    create_notification(sample_template, created_at=utc_now() - timedelta(minutes=5))
+    create_notification(sample_template, created_at=utc_now() - timedelta(hours=2))
+    create_notification(
+        sample_template,
+        created_at=utc_now() - timedelta(minutes=20),
+        status=NotificationStatus.SENDING,
+    )
+
+    deliver_created_sms_stragglers()
+
+    expected = [straggler] if deliver_sms_in_batches else [straggler, job_straggler]
+    assert sorted(call.args[0][0] for call in sms_delivery_queue.call_args_list) == (
+        sorted(str(notification.id) for notification in expected)
+    )
+
+
+def test_deliver_created_sms_stragglers_only_sends_each_notification_once(
+    notify_api, mocker
+):
+    mocker.patch.dict(notify_api.config, {"DELIVER_AFTER_BATCH_INSERT": True})
+    swept, new = (Notification(id=uuid.uuid4()) for _ in range(2))
+    mocker.patch(
+        "app.celery.scheduled_tasks.notifications_not_yet_sent",
+        return_value=[swept, new],
+    )
+    mock_set = mocker.patch(
+        "app.celery.scheduled_tasks.redis_store.set_if_not_exists",
+        return_value=[f"delivery-swept-{new.id}"],
+    )
+    mock_send = mocker.patch("app.celery.scheduled_tasks.send_notification_to_queue")
+
+    deliver_created_sms_stragglers()
+
+    mock_set.assert_called_once_with(
+        [f"delivery-swept-{swept.id}", f"delivery-swept-{new.id}"], "1", ex=3600
+    )
+    mock_send.assert_called_once_with(notification=new)
+
+
+def test_deliver_created_sms_stragglers_does_nothing_unless_switched_on(
+    notify_api, mocker
+):
+    mock_not_yet_sent = mocker.patch(
+        "app.celery.scheduled_tasks.notifications_not_yet_sent"
+    )
+
+    deliver_created_sms_stragglers()
+
+    assert mock_not_yet_sent.called is False
+
+
 def test_replay_created_notifications(notify_db_session, sample_service, mocker):
     email_delivery_queue = mocker.patch(
         "app.celery.provider_tasks.deliver_email.apply_async"
@@ -528,26 +611,81 @@ def test_check_for_services_with_high_failure_rates_or_sending_to_tv_numbers(
     mock_send_ticket_to_zendesk.assert_called_once()
 
 
+def mock_message_queue(mocker, notifications):
+    rs = MagicMock()
+    mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
+    rs.claim_list_batch.return_value = (
+        "message_queue-claim-1",
+        [
+            n if isinstance(n, bytes) else json.dumps(n).encode("utf-8")
+            for n in notifications
+        ],
+    )
+    return rs
+
+
 def test_batch_insert_with_valid_notifications(mocker):
-    mocker.patch("app.celery.scheduled_tasks.dao_batch_insert_notifications")
+    mock_insert = mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications"
+    )
+    rs = mock_message_queue(
+        mocker,
+        [
+            {"id": 1, "notification_status": "pending"},
+            {"id": 2, "notification_status": "pending"},
+        ],
+    )
+
+    batch_insert_notifications()
+
+    rs.claim_list_batch.assert_called_once_with("message_queue", 10000)
+    assert [n.id for n in mock_insert.call_args.args[0]] == [1, 2]
+    rs.release_list_batch.assert_called_once_with(
+        "message_queue", "message_queue-claim-1"
+    )
+    rs.lpop.assert_not_called()
+
+
+def test_batch_insert_claims_batches_until_the_queue_is_empty(mocker):
+    mocker.patch("app.celery.scheduled_tasks.MESSAGE_QUEUE_BATCH_SIZE", 2)
+    mock_insert = mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications"
+    )
     rs = MagicMock()
     mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
-    notifications = [
-        {"id": 1, "notification_status": "pending"},
-        {"id": 2, "notification_status": "pending"},
+    rs.claim_list_batch.side_effect = [
+        (
+            f"message_queue-claim-{i}",
+            [
+                json.dumps({"id": id, "notification_status": "pending"}).encode()
+                for id in ids
+            ],
+        )
+        for i, ids in enumerate([["1", "2"], ["3"]])
     ]
-    serialized_notifications = [json.dumps(n).encode("utf-8") for n in notifications]
 
-    pipeline_mock = MagicMock()
+    batch_insert_notifications()
 
-    rs.pipeline.return_value.__enter__.return_value = pipeline_mock
-    rs.llen.return_value = len(notifications)
-    rs.lpop.side_effect = serialized_notifications
+    assert [[n.id for n in call.args[0]] for call in mock_insert.call_args_list] == [
+        ["1", "2"],
+        ["3"],
+    ]
+    assert rs.release_list_batch.call_args_list == [
+        call("message_queue", "message_queue-claim-0"),
+        call("message_queue", "message_queue-claim-1"),
+    ]
+
+
+def test_batch_insert_does_nothing_if_the_queue_is_empty(mocker):
+    mock_insert = mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications"
+    )
+    rs = mock_message_queue(mocker, [])
 
     batch_insert_notifications()
 
-    rs.llen.assert_called_once_with("message_queue")
-    rs.lpop.assert_called_with("message_queue")
+    mock_insert.assert_not_called()
+    rs.release_list_batch.assert_not_called()
 
 
 def test_batch_insert_with_expired_notifications(mocker):
@@ -556,51 +694,206 @@ def test_batch_insert_with_expired_notifications(mocker):
         "app.celery.scheduled_tasks.dao_batch_insert_notifications",
         side_effect=Exception("DB Error"),
     )
-    rs = MagicMock()
-    mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
+    rs = mock_message_queue(
+        mocker,
+        [
+            {
+                "id": 1,
+                "notification_status": "pending",
+                "created_at": utc_now().isoformat(),
+            },
+            {
+                "id": 2,
+                "notification_status": "pending",
+                "created_at": expired_time.isoformat(),
+            },
+        ],
+    )
+
+    batch_insert_notifications()
+
+    rs.rpush.assert_called_once()
+    requeued_notification = json.loads(rs.rpush.call_args[0][1])
+    assert requeued_notification["id"] == "1"
+    # The batch is released once it’s been requeued
+    rs.release_list_batch.assert_called_once_with(
+        "message_queue", "message_queue-claim-1"
+    )
+
+
+def test_batch_insert_sends_notifications_for_delivery_once_inserted(mocker):
+    mock_insert = mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications",
+        return_value={"1", "2"},
+    )
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+    mock_message_queue(
+        mocker,
+        [
+            {"id": "1", "notification_status": "created", "deliver_after_insert": True},
+            {"id": "2", "notification_status": "created"},
+        ],
+    )
+
+    batch_insert_notifications()
+
+    assert [n.id for n in mock_insert.call_args.args[0]] == ["1", "2"]
+    mock_deliver_sms.assert_called_once_with(["1"], queue="send-sms-tasks")
+
+
+def test_batch_insert_only_sends_notifications_it_inserted_for_delivery(mocker):
+    # 1 and 2 were inserted before the batch was recovered
+    mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications",
+        return_value={"3", "4"},
+    )
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+    mock_message_queue(
+        mocker,
+        [
+            {
+                "id": id,
+                "notification_status": "created",
+                "deliver_after_insert": True,
+            }
+            for id in ("1", "2", "3", "4")
+        ],
+    )
+
+    batch_insert_notifications()
+
+    assert mock_deliver_sms.call_args_list == [
+        call(["3"], queue="send-sms-tasks"),
+        call(["4"], queue="send-sms-tasks"),
+    ]
+
+
+def test_batch_insert_keeps_notifications_to_deliver_when_requeued(mocker):
+    mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications",
+        side_effect=Exception("DB Error"),
+    )
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+    rs = mock_message_queue(
+        mocker,
+        [
+            {
+                "id": "1",
+                "notification_status": "created",
+                "created_at": utc_now().isoformat(),
+                "deliver_after_insert": True,
+            }
+        ],
+    )
+
+    batch_insert_notifications()
+
+    assert json.loads(rs.rpush.call_args.args[1])["deliver_after_insert"] is True
+    assert mock_deliver_sms.called is False
+
+
+def test_batch_insert_with_binary_notifications(notify_api, mocker):
+    mock_insert = mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications"
+    )
+    mock_deliver_sms = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
     notifications = [
-        {
-            "id": 1,
-            "notification_status": "pending",
-            "created_at": utc_now().isoformat(),
-        },
-        {
-            "id": 2,
-            "notification_status": "pending",
-            "created_at": expired_time.isoformat(),
-        },
+        Notification(
+            id=uuid.uuid4(), status=NotificationStatus.CREATED, created_at=utc_now()
+        )
+        for _ in range(2)
+    ]
+    mock_message_queue(
+        mocker,
+        [
+            encode_queued_notification(notifications[0], deliver_after_insert=True),
+            encode_queued_notification(notifications[1]),
+        ],
+    )
+
+    mock_insert.return_value = {str(n.id) for n in notifications}
+
+    batch_insert_notifications()
+
+    assert [n.id for n in mock_insert.call_args.args[0]] == [
+        str(n.id) for n in notifications
     ]
-    serialized_notifications = [json.dumps(n).encode("utf-8") for n in notifications]
+    mock_deliver_sms.assert_called_once_with(
+        [str(notifications[0].id)], queue="send-sms-tasks"
+    )
 
-    pipeline_mock = MagicMock()
 
-    rs.pipeline.return_value.__enter__.return_value = pipeline_mock
-    rs.llen.return_value = len(notifications)
-    rs.lpop.side_effect = serialized_notifications
+def test_batch_insert_requeues_notifications_in_binary(notify_api, mocker):
+    mocker.patch.dict(notify_api.config, {"QUEUE_NOTIFICATIONS_IN_BINARY": True})
+    mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications",
+        side_effect=Exception("DB Error"),
+    )
+    notification = Notification(
+        id=uuid.uuid4(), status=NotificationStatus.CREATED, created_at=utc_now()
+    )
+    rs = mock_message_queue(
+        mocker, [encode_queued_notification(notification, deliver_after_insert=True)]
+    )
 
     batch_insert_notifications()
 
-    rs.llen.assert_called_once_with("message_queue")
-    rs.rpush.assert_called_once()
-    requeued_notification = json.loads(rs.rpush.call_args[0][1])
-    assert requeued_notification["id"] == "1"
+    fields, deliver_after_insert = decode_queued_notification(rs.rpush.call_args[0][1])
+    assert fields["id"] == str(notification.id)
+    assert deliver_after_insert is True
 
 
-def test_batch_insert_with_malformed_notifications(mocker):
-    rs = MagicMock()
-    mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
-    malformed_data = b"not_a_valid_json"
-    pipeline_mock = MagicMock()
+def test_batch_insert_moves_malformed_notifications_to_the_dead_letter_list(mocker):
+    mock_insert = mocker.patch(
+        "app.celery.scheduled_tasks.dao_batch_insert_notifications"
+    )
+    rs = mock_message_queue(
+        mocker,
+        [
+            {"id": 1, "notification_status": "pending"},
+            b"not_a_valid_json",
+            {"id": 2, "notification_status": "pending", "not_a_column": "x"},
+            {"id": 3, "notification_status": "pending"},
+        ],
+    )
+
+    batch_insert_notifications()
+
+    assert [n.id for n in mock_insert.call_args.args[0]] == [1, 3]
+    assert rs.rpush.call_args_list[0] == call(
+        "message_queue-dead-letter", b"not_a_valid_json"
+    )
+    assert rs.rpush.call_count == 2
+    assert rs.rpush.call_args_list[1].args[0] == "message_queue-dead-letter"
+    rs.release_list_batch.assert_called_once_with(
+        "message_queue", "message_queue-claim-1"
+    )
 
-    rs.pipeline.return_value.__enter__.return_value = pipeline_mock
-    rs.llen.return_value = 1
-    rs.lpop.side_effect = [malformed_data]
 
-    with pytest.raises(json.JSONDecodeError):
+def test_batch_insert_releases_the_claim_if_inserting_fails(mocker):
+    mocker.patch(
+        "app.celery.scheduled_tasks.insert_message_queue_batch",
+        side_effect=SQLAlchemyError("insert failed"),
+    )
+    rs = mock_message_queue(mocker, [{"id": 1, "notification_status": "pending"}])
+
+    with pytest.raises(SQLAlchemyError, match="insert failed"):
         batch_insert_notifications()
 
-    rs.llen.assert_called_once_with("message_queue")
-    rs.rpush.assert_not_called()
+    rs.release_list_batch.assert_called_once_with(
+        "message_queue", "message_queue-claim-1"
+    )
+
+
+@freeze_time("2024-01-01 12:00:00")
+def test_recover_message_queue_claims(mocker):
+    rs = MagicMock()
+    mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
+    rs.recover_list_batches.return_value = 3
+
+    recover_message_queue_claims()
+
+    rs.recover_list_batches.assert_called_once_with("message_queue", 1704110400.0 - 300)
 
 
 def test_process_delivery_receipts_success(mocker):
@@ -608,9 +901,12 @@ def test_process_delivery_receipts_success(mocker):
         "app.celery.scheduled_tasks.dao_update_delivery_receipts"
     )
     cloudwatch_mock = mocker.patch("app.celery.scheduled_tasks.AwsCloudwatchClient")
-    cloudwatch_mock.return_value.check_delivery_receipts.return_value = (
-        range(2000),
-        range(500),
+    cloudwatch_mock.return_value.stream_delivery_receipts.return_value = iter(
+        [
+            (list(range(1000)), True),
+            (list(range(1000, 2000)), True),
+            (list(range(500)), False),
+        ]
     )
     current_app_mock = mocker.patch("app.celery.scheduled_tasks.current_app")
     current_app_mock.return_value = MagicMock()
@@ -619,8 +915,12 @@ def test_process_delivery_receipts_success(mocker):
     processor.retry = MagicMock()
 
     processor.process_delivery_receipts()
-    assert dao_update_mock.call_count == 3
-    dao_update_mock.assert_any_call(list(range(1000)), True)
-    dao_update_mock.assert_any_call(list(range(1000, 2000)), True)
-    dao_update_mock.assert_any_call(list(range(500)), False)
+    cloudwatch_mock.return_value.stream_delivery_receipts.assert_called_once_with(
+        ANY, ANY, 1000
+    )
+    assert dao_update_mock.call_args_list == [
+        call(list(range(1000)), True),
+        call(list(range(1000, 2000)), True),
+        call(list(range(500)), False),
+    ]
     processor.retry.assert_not_called()
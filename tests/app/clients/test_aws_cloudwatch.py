@@ -1,4 +1,5 @@
 import json
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from flask import current_app
@@ -91,8 +92,112 @@ def test_extract_account_number_gov_staging():
     assert actual_account_number[4] == expected_account_number
 
 
-def test_check_delivery_receipts():
-    pass
+def _receipt_event(message_id, provider_response="Phone accepted msg"):
+    return {
+        "message": json.dumps(
+            {
+                "notification": {
+                    "messageId": message_id,
+                    "timestamp": "2024-01-01 12:00:00.000",
+                },
+                "status": "SUCCESS",
+                "delivery": {
+                    "phoneCarrier": "ATT Mobility",
+                    "providerResponse": provider_response,
+                    "priceInUSD": "0.00881",
+                },
+            }
+        )
+    }
+
+
+def test_stream_delivery_receipts(notify_api, mocker):
+    boto_mock = mocker.patch.object(aws_cloudwatch_client, "_client", create=True)
+    mocker.patch.dict(
+        "os.environ",
+        {
+            "SES_DOMAIN_ARN": "arn:aws:ses:us-west-2:12345:identity/x",
+            "SNS_AWS_REGION": "us-west-2",
+        },
+    )
+    pages = {
+        None: {
+            "events": [_receipt_event("1"), _receipt_event("2")],
+            "nextToken": "page-2",
+        },
+        "page-2": {
+            "events": [
+                _receipt_event("2", "Duplicate"),
+                {"message": "not json"},
+                _receipt_event("3"),
+            ]
+        },
+    }
+    failure_pages = {None: {"events": [_receipt_event("4")]}}
+
+    def filter_log_events(logGroupName, startTime, endTime, nextToken=None):
+        if logGroupName.endswith("/Failure"):
+            return failure_pages[nextToken]
+        return pages[nextToken]
+
+    boto_mock.filter_log_events.side_effect = filter_log_events
+    start = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+    with notify_api.app_context():
+        batches = aws_cloudwatch_client.stream_delivery_receipts(
+            start, start + timedelta(minutes=3), batch_size=2
+        )
+
+        # The first batch is ready before the second page is fetched
+        receipts, delivered = next(batches)
+        assert delivered is True
+        assert [r["notification.messageId"] for r in receipts] == ["1", "2"]
+        assert boto_mock.filter_log_events.call_count == 1
+
+        assert [
+            ([r["notification.messageId"] for r in receipts], delivered)
+            for receipts, delivered in batches
+        ] == [(["2", "3"], True), (["4"], False)]
+
+    assert boto_mock.filter_log_events.call_args_list[0].kwargs == {
+        "logGroupName": "sns/us-west-2/12345/DirectPublishToPhoneNumber",
+        "startTime": 1704110400000,
+        "endTime": 1704110580000,
+    }
+    assert boto_mock.filter_log_events.call_args_list[1].kwargs["nextToken"] == "page-2"
+
+
+def test_stream_delivery_receipts_deduplicates_within_a_batch(notify_api, mocker):
+    boto_mock = mocker.patch.object(aws_cloudwatch_client, "_client", create=True)
+    mocker.patch.dict(
+        "os.environ", {"SES_DOMAIN_ARN": "arn:aws:ses:us-west-2:12345:identity/x"}
+    )
+    boto_mock.filter_log_events.side_effect = lambda logGroupName, **kwargs: {
+        "events": (
+            []
+            if logGroupName.endswith("/Failure")
+            else [
+                _receipt_event("1"),
+                _receipt_event("1", "Again"),
+                _receipt_event("2"),
+            ]
+        )
+    }
+    start = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+    with notify_api.app_context():
+        batches = list(
+            aws_cloudwatch_client.stream_delivery_receipts(
+                start, start + timedelta(minutes=3), batch_size=10
+            )
+        )
+
+    assert len(batches) == 1
+    receipts, delivered = batches[0]
+    assert delivered is True
+    assert [
+        (r["notification.messageId"], r["delivery.providerResponse"]) for r in receipts
+    ] == [("1", "Again"), ("2", "Phone accepted msg")]
 
 
 def test_aws_value_or_default():
@@ -1,6 +1,7 @@
 import pytest
 
 from app import aws_sns_client
+from notifications_utils.recipients import PhoneNumber
 
 
 def test_send_sms_successful_returns_aws_sns_response(notify_api, mocker):
@@ -34,3 +35,16 @@ def test_send_sms_returns_raises_error_if_there_is_no_valid_number_is_found(
     with pytest.raises(ValueError) as excinfo:
         aws_sns_client.send_sms(to, content, reference)
     assert "No valid numbers found for SMS delivery" in str(excinfo.value)
+
+
+def test_send_sms_uses_a_parsed_phone_number_as_it_is(notify_api, mocker):
+    boto_mock = mocker.patch.object(aws_sns_client, "_client", create=True)
+    matcher_mock = mocker.patch(
+        "app.clients.sms.aws_sns.phonenumbers.PhoneNumberMatcher"
+    )
+    with notify_api.app_context():
+        aws_sns_client.send_sms(
+            PhoneNumber("+447700900855", international=True), "foo", "foo"
+        )
+    assert matcher_mock.called is False
+    assert boto_mock.publish.call_args.kwargs["PhoneNumber"] == "+447700900855"
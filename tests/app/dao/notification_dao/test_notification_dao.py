@@ -11,6 +11,8 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from app import db
 from app.dao.notifications_dao import (
+    dao_batch_insert_notifications,
+    dao_claim_created_notifications_from_jobs,
     dao_close_out_delivery_receipts,
     dao_create_notification,
     dao_delete_notifications_by_id,
@@ -20,10 +22,15 @@ from app.dao.notifications_dao import (
     dao_get_notification_count_for_service,
     dao_get_notification_history_by_reference,
     dao_get_notifications_by_recipient_or_reference,
+    dao_release_abandoned_delivery_claims,
     dao_timeout_notifications,
     dao_update_delivery_receipts,
     dao_update_notification,
+    dao_update_notification_statuses_by_id,
     dao_update_notifications_by_reference,
+    dao_update_notifications_to_sending,
+    dao_update_sent_email_notifications,
+    dao_update_sent_sms_notifications,
     get_notification_by_id,
     get_notification_with_personalisation,
     get_notifications_for_job,
@@ -32,6 +39,7 @@ from app.dao.notifications_dao import (
     get_service_ids_with_notifications_on_date,
     notifications_not_yet_sent,
     sanitize_successful_notification_by_id,
+    update_notification_message_id,
     update_notification_status_by_id,
     update_notification_status_by_reference,
 )
@@ -507,6 +515,35 @@ def test_save_notification(sample_email_template, sample_job):
     assert _get_notification_query_count() == 2
 
 
+def test_save_notification_does_not_insert_a_notification_twice(
+    sample_email_template, sample_job
+):
+    notification_id = uuid.uuid4()
+    data = _notification_json(
+        sample_email_template, job_id=sample_job.id, id=notification_id
+    )
+
+    assert dao_create_notification(Notification(**data)) is True
+    assert dao_create_notification(Notification(**data, reference="other")) is False
+
+    assert _get_notification_query_count() == 1
+    assert db.session.get(Notification, notification_id).reference is None
+
+
+def test_save_notification_keeps_the_notification_in_the_session(
+    sample_email_template, sample_job
+):
+    notification = Notification(
+        **_notification_json(sample_email_template, job_id=sample_job.id)
+    )
+    dao_create_notification(notification)
+
+    assert notification.job == sample_job
+    notification.reference = "reference"
+    db.session.commit()
+    assert db.session.get(Notification, notification.id).reference == "reference"
+
+
 def test_save_notification_does_not_creates_history(sample_email_template, sample_job):
     assert _get_notification_query_count() == 0
     data = _notification_json(sample_email_template, job_id=sample_job.id)
@@ -921,6 +958,175 @@ def test_dao_timeout_notifications_only_updates_for_older_notifications(
     assert db.session.get(Notification, pending.id).status == NotificationStatus.PENDING
 
 
+def test_dao_claim_created_notifications_from_jobs(
+    sample_job, sample_template, sample_email_template
+):
+    with freeze_time(utc_now() - timedelta(minutes=2)):
+        oldest = create_notification(job=sample_job)
+    newest = create_notification(job=sample_job)
+    one_off = create_notification(sample_template)
+    test_key = create_notification(job=sample_job, key_type=KeyType.TEST)
+    sending = create_notification(job=sample_job, status=NotificationStatus.SENDING)
+    email = create_notification(job=create_job(sample_email_template))
+    being_retried = create_notification(job=sample_job, updated_at=utc_now())
+    # Sent, waiting for its status to be written
+    sent = create_notification(job=sample_job)
+    update_notification_message_id(sent.id, "message-id")
+
+    claimed = dao_claim_created_notifications_from_jobs(NotificationType.SMS, limit=1)
+
+    assert [notification.id for notification in claimed] == [oldest.id]
+    assert [
+        notification.id
+        for notification in dao_claim_created_notifications_from_jobs(
+            NotificationType.SMS, limit=10
+        )
+    ] == [newest.id]
+    assert (
+        dao_claim_created_notifications_from_jobs(NotificationType.SMS, limit=10) == []
+    )
+    for notification, status in (
+        (oldest, NotificationStatus.SENDING),
+        (newest, NotificationStatus.SENDING),
+        (one_off, NotificationStatus.CREATED),
+        (test_key, NotificationStatus.CREATED),
+        (sending, NotificationStatus.SENDING),
+        (email, NotificationStatus.CREATED),
+        (being_retried, NotificationStatus.CREATED),
+        (sent, NotificationStatus.CREATED),
+    ):
+        assert db.session.get(Notification, notification.id).status == status
+
+
+def test_dao_release_abandoned_delivery_claims(sample_job, sample_template):
+    with freeze_time(utc_now() - timedelta(hours=1)):
+        abandoned = create_notification(job=sample_job)
+        dao_claim_created_notifications_from_jobs(NotificationType.SMS, limit=1)
+        sent = create_notification(
+            job=sample_job, status=NotificationStatus.SENDING, sent_at=utc_now()
+        )
+        one_off = create_notification(
+            sample_template, status=NotificationStatus.SENDING
+        )
+    claimed = create_notification(job=sample_job)
+    dao_claim_created_notifications_from_jobs(NotificationType.SMS, limit=1)
+
+    assert dao_release_abandoned_delivery_claims() == 1
+
+    for notification, status in (
+        (abandoned, NotificationStatus.CREATED),
+        (sent, NotificationStatus.SENDING),
+        (one_off, NotificationStatus.SENDING),
+        (claimed, NotificationStatus.SENDING),
+    ):
+        assert db.session.get(Notification, notification.id).status == status
+    assert [
+        notification.id
+        for notification in dao_claim_created_notifications_from_jobs(
+            NotificationType.SMS, limit=10
+        )
+    ] == [abandoned.id]
+
+
+def test_dao_update_sent_sms_notifications(sample_job):
+    first = create_notification(job=sample_job, status=NotificationStatus.SENDING)
+    second = create_notification(job=sample_job, status=NotificationStatus.SENDING)
+    untouched = create_notification(job=sample_job, status=NotificationStatus.SENDING)
+
+    assert (
+        dao_update_sent_sms_notifications(
+            [
+                (first.id, "message-1", 1, "sns"),
+                (second.id, "message-2", 3, "sns"),
+            ]
+        )
+        == 2
+    )
+
+    for notification, message_id, billable_units in (
+        (first, "message-1", 1),
+        (second, "message-2", 3),
+    ):
+        notification = db.session.get(Notification, notification.id)
+        assert notification.message_id == message_id
+        assert notification.billable_units == billable_units
+        assert notification.sent_by == "sns"
+        assert notification.sent_at is not None
+        assert notification.to == "1"
+    assert db.session.get(Notification, untouched.id).message_id is None
+    assert dao_update_sent_sms_notifications([]) == 0
+
+
+def test_dao_update_sent_email_notifications(sample_email_template):
+    job = create_job(sample_email_template)
+    sent = create_notification(job=job, status=NotificationStatus.SENDING)
+    untouched = create_notification(job=job, status=NotificationStatus.SENDING)
+
+    assert dao_update_sent_email_notifications([(sent.id, "ses-ref", "ses")]) == 1
+
+    sent = db.session.get(Notification, sent.id)
+    assert sent.reference == "ses-ref"
+    assert sent.sent_by == "ses"
+    assert sent.sent_at is not None
+    assert db.session.get(Notification, untouched.id).reference is None
+    assert dao_update_sent_email_notifications([]) == 0
+
+
+def test_dao_update_notifications_to_sending(sample_template):
+    sms = create_notification(sample_template, billable_units=0)
+    email = create_notification(sample_template, reference="original-reference")
+    delivered = create_notification(
+        sample_template, status=NotificationStatus.DELIVERED
+    )
+    sent_at = utc_now()
+
+    assert (
+        dao_update_notifications_to_sending(
+            [
+                (sms.id, sent_at, "sns", 2),
+                (email.id, sent_at, "ses", None),
+                (delivered.id, sent_at, "sns", 1),
+            ]
+        )
+        == 3
+    )
+
+    sms = db.session.get(Notification, sms.id)
+    assert sms.status == NotificationStatus.SENDING
+    assert sms.sent_at == sent_at
+    assert sms.sent_by == "sns"
+    assert sms.billable_units == 2
+    assert sms.to == "1"
+    email = db.session.get(Notification, email.id)
+    assert email.status == NotificationStatus.SENDING
+    assert email.reference == "original-reference"
+    assert email.billable_units == 1
+    delivered = db.session.get(Notification, delivered.id)
+    assert delivered.status == NotificationStatus.DELIVERED
+    assert delivered.billable_units == 1
+    assert dao_update_notifications_to_sending([]) == 0
+
+
+def test_dao_update_notification_statuses_by_id(sample_template):
+    failed = create_notification(sample_template, status=NotificationStatus.SENDING)
+    untouched = create_notification(sample_template, status=NotificationStatus.SENDING)
+
+    assert (
+        dao_update_notification_statuses_by_id(
+            [failed.id], NotificationStatus.TEMPORARY_FAILURE
+        )
+        == 1
+    )
+
+    assert (
+        db.session.get(Notification, failed.id).status
+        == NotificationStatus.TEMPORARY_FAILURE
+    )
+    assert (
+        db.session.get(Notification, untouched.id).status == NotificationStatus.SENDING
+    )
+
+
 def test_should_return_notifications_excluding_jobs_by_default(
     sample_template, sample_job, sample_api_key
 ):
@@ -1984,6 +2190,13 @@ def test_notifications_not_yet_sent(sample_service, notification_type):
         created_at=utc_now(),
         status=NotificationStatus.CREATED,
     )
+    # Sent, waiting for its status to be written
+    sent = create_notification(
+        template=template,
+        created_at=utc_now() - timedelta(seconds=older_than),
+        status=NotificationStatus.CREATED,
+    )
+    update_notification_message_id(sent.id, "message-id")
 
     results = notifications_not_yet_sent(older_than, notification_type)
     assert len(results) == 1
@@ -2018,6 +2231,7 @@ def test_notifications_not_yet_sent_return_no_rows(sample_service, notification_
 
 def test_update_delivery_receipts(mocker):
     mock_session = mocker.patch("app.dao.notifications_dao.db.session")
+    mock_emit = mocker.patch("app.dao.notifications_dao.emit_job_update_summary")
     receipts = [
         '{"notification.messageId": "msg1", "delivery.phoneCarrier": "carrier1", "delivery.providerResponse": "resp1", "@timestamp": "2024-01-01T12:00:00", "delivery.priceInUSD": "0.00881"}',  # noqa
         '{"notification.messageId": "msg2", "delivery.phoneCarrier": "carrier2", "delivery.providerResponse": "resp2", "@timestamp": "2024-01-01T13:00:00", "delivery.priceInUSD": "0.00881"}',  # noqa
@@ -2028,6 +2242,7 @@ def test_update_delivery_receipts(mocker):
     mock_values = MagicMock()
     mock_update.where.return_value = mock_where
     mock_where.values.return_value = mock_values
+    mock_stmt = mock_values.returning.return_value.execution_options.return_value
 
     FakeJob = type(
         "FakeJob",
@@ -2035,24 +2250,82 @@ def test_update_delivery_receipts(mocker):
         {"id": "job-123", "notification_count": 5, "job_status": "delivered"},
     )
 
-    fake_result = MagicMock()
-    fake_result.scalars.return_value.all.return_value = ["job-1", "job-2"]
-    fake_result.scalars.return_value.one.return_value = FakeJob()
+    updated = MagicMock()
+    updated.scalars.return_value.all.return_value = ["job-1", "job-2", None]
+    jobs = MagicMock()
+    jobs.scalars.return_value = [FakeJob(), FakeJob()]
 
-    mock_session.execute.side_effect = lambda *args, **kwargs: fake_result
+    mock_session.execute.side_effect = [updated, jobs]
     with patch("app.dao.notifications_dao.update", return_value=mock_update):
         dao_update_delivery_receipts(receipts, delivered)
     mock_update.where.assert_called_once()
     mock_where.values.assert_called_once()
-    mock_session.execute.assert_any_call(mock_values)
-    assert mock_session.execute.call_count == 4
+    mock_session.execute.assert_any_call(mock_stmt)
+    assert mock_session.execute.call_count == 2
     mock_session.commit.assert_called_once()
+    assert mock_emit.call_count == 2
 
     args, kwargs = mock_where.values.call_args
     assert "carrier" in kwargs
     assert "status" in kwargs
     assert "sent_at" in kwargs
     assert "provider_response" in kwargs
+    assert "message_cost" in kwargs
+
+
+def test_update_delivery_receipts_does_nothing_without_receipts(mocker):
+    mock_session = mocker.patch("app.dao.notifications_dao.db.session")
+
+    dao_update_delivery_receipts([], True)
+
+    mock_session.execute.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "delivered, expected_status",
+    [(True, NotificationStatus.DELIVERED), (False, NotificationStatus.FAILED)],
+)
+def test_update_delivery_receipts_updates_notifications_by_message_id(
+    sample_template, mocker, delivered, expected_status
+):
+    mocker.patch("app.dao.notifications_dao.emit_job_update_summary")
+    notification = create_notification(
+        template=sample_template, status=NotificationStatus.SENDING
+    )
+    other_notification = create_notification(
+        template=sample_template, status=NotificationStatus.SENDING
+    )
+    notification.message_id = "msg1"
+    other_notification.message_id = "msg2"
+    db.session.commit()
+
+    dao_update_delivery_receipts(
+        [
+            {
+                "notification.messageId": "msg1",
+                "delivery.phoneCarrier": "Verizon",
+                "delivery.providerResponse": "Phone accepted msg",
+                "@timestamp": "2024-01-01 12:00:00.000",
+                "delivery.priceInUSD": 0.00881,
+            },
+            {
+                "notification.messageId": "unknown",
+                "delivery.phoneCarrier": "",
+                "delivery.providerResponse": "",
+                "@timestamp": "2024-01-01 12:00:00.000",
+                "delivery.priceInUSD": 0.0,
+            },
+        ],
+        delivered,
+    )
+
+    db.session.expire_all()
+    assert notification.status == expected_status
+    assert notification.carrier == "Verizon"
+    assert notification.provider_response == "Phone accepted msg"
+    assert notification.sent_at == datetime(2024, 1, 1, 12, 0, 0)
+    assert notification.message_cost == 0.00881
+    assert other_notification.status == NotificationStatus.SENDING
 
 
 def test_close_out_delivery_receipts(mocker):
@@ -2199,3 +2472,51 @@ def test_dao_get_notifications_by_recipient_or_reference_covers_sms_search_by_re
     assert found.id == notification.id
     assert found.status == NotificationStatus.FAILED
     assert found.client_reference == "some-ref"
+
+
+def _notification_for_batch(template, **kwargs):
+    return Notification(
+        id=uuid.uuid4(),
+        to="+12028675309",
+        normalised_to="12028675309",
+        service_id=template.service_id,
+        template_id=template.id,
+        template_version=template.version,
+        notification_type=template.template_type,
+        key_type=KeyType.NORMAL,
+        status=NotificationStatus.CREATED,
+        created_at=utc_now(),
+        **kwargs,
+    )
+
+
+def test_dao_batch_insert_notifications(sample_template):
+    batch = [
+        _notification_for_batch(sample_template, client_reference="tab\tand\nnewline"),
+        _notification_for_batch(sample_template, reference=None),
+    ]
+
+    assert dao_batch_insert_notifications(batch) == {str(n.id) for n in batch}
+
+    inserted = {n.id: n for n in db.session.scalars(select(Notification)).all()}
+    assert set(inserted) == {n.id for n in batch}
+    first = inserted[batch[0].id]
+    assert first.client_reference == "tab\tand\nnewline"
+    assert first.billable_units == 0
+    assert first.international is False
+    assert first.status == NotificationStatus.CREATED
+    assert inserted[batch[1].id].reference is None
+
+
+def test_dao_batch_insert_notifications_skips_notifications_already_inserted(
+    sample_template,
+):
+    batch = [_notification_for_batch(sample_template) for _ in range(3)]
+    dao_batch_insert_notifications(batch[:2])
+
+    assert dao_batch_insert_notifications(batch) == {str(batch[2].id)}
+    assert db.session.scalar(select(func.count()).select_from(Notification)) == 3
+
+
+def test_dao_batch_insert_notifications_with_an_empty_batch(notify_db_session):
+    assert dao_batch_insert_notifications([]) == set()
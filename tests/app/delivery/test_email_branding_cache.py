@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.delivery.email_branding_cache import EmailBrandingCache
+
+
+@pytest.fixture
+def mock_get_branding(mocker):
+    return mocker.patch(
+        "app.delivery.email_branding_cache.dao_get_email_branding_by_id",
+        return_value=SimpleNamespace(serialize=lambda: {"name": "Branding"}),
+    )
+
+
+def test_email_branding_cache_caches_brandings_until_invalidated(
+    notify_api, mock_get_branding
+):
+    cache = EmailBrandingCache()
+
+    assert cache.get("branding-id") == {"name": "Branding"}
+    cache.get("branding-id")
+    assert mock_get_branding.call_count == 1
+
+    cache.invalidate("branding-id")
+    cache.get("branding-id")
+    assert mock_get_branding.call_count == 2
+
+
+def test_email_branding_cache_invalidates_brandings_in_other_processes(
+    notify_api, mock_get_branding, mocker
+):
+    versions = {}
+    mock_redis = mocker.patch("app.delivery.email_branding_cache.redis_store")
+    mock_redis.get.side_effect = versions.get
+    mock_redis.incr.side_effect = lambda key: versions.update(
+        {key: versions.get(key, 0) + 1}
+    )
+    cache, other_process_cache = EmailBrandingCache(), EmailBrandingCache()
+
+    cache.get("branding-id")
+    other_process_cache.get("branding-id")
+    other_process_cache.get("branding-id")
+    assert mock_get_branding.call_count == 2
+
+    cache.invalidate("branding-id")
+    other_process_cache.get("branding-id")
+    assert mock_get_branding.call_count == 3
+    mock_redis.incr.assert_called_once_with("email-branding-version-branding-id")
@@ -0,0 +1,147 @@
+from collections import Counter
+
+import pytest
+
+from app.clients.email import EmailClientNonRetryableException
+from app.clients.sms import SmsClient
+from app.delivery import provider_router as provider_router_module
+from app.delivery.provider_router import ProviderRouter
+
+
+class ProviderError(Exception):
+    pass
+
+
+class FakeSmsClient(SmsClient):
+    def __init__(self, name, error=None):
+        self._name = name
+        self.error = error
+
+    def init_app(self, *args, **kwargs):
+        pass
+
+    @property
+    def name(self):
+        return self._name
+
+    def send_sms(self, *args, **kwargs):
+        if self.error:
+            raise self.error
+        return f"{self.name}-message-id"
+
+
+@pytest.fixture
+def router_config(notify_api, mocker):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "PROVIDER_CIRCUIT_BREAKER_FAILURES": 3,
+            "PROVIDER_CIRCUIT_BREAKER_RESET_TIME": 30,
+            "PROVIDER_SLOW_RESPONSE_TIME": 5,
+        },
+    )
+
+
+@pytest.fixture
+def mock_monotonic(mocker):
+    return mocker.patch.object(provider_router_module, "monotonic", return_value=0)
+
+
+def send(router, client):
+    with router.measure(client.name):
+        return client.send_sms()
+
+
+def test_provider_router_routes_by_weight(router_config):
+    router = ProviderRouter()
+    fast, slow = FakeSmsClient("fast"), FakeSmsClient("slow")
+
+    chosen = Counter(
+        router.choose([fast, slow], {"fast": 90, "slow": 10}).name for _ in range(1000)
+    )
+
+    assert 800 < chosen["fast"] < 980
+    assert router.choose([fast, slow], {}) is fast
+
+
+def test_provider_router_prefers_providers_with_lower_latency(
+    router_config, mock_monotonic
+):
+    router = ProviderRouter()
+    fast, slow = FakeSmsClient("fast"), FakeSmsClient("slow")
+    for client, latency in ((fast, 0.1), (slow, 2)):
+        mock_monotonic.side_effect = [0, latency]
+        send(router, client)
+
+    chosen = Counter(
+        router.choose([fast, slow], {"fast": 50, "slow": 50}).name for _ in range(1000)
+    )
+
+    assert chosen["fast"] > 900
+    assert router.health("slow").latency() == 2
+
+
+def test_provider_router_opens_circuit_after_consecutive_failures(
+    router_config, mock_monotonic
+):
+    router = ProviderRouter()
+    healthy, broken = FakeSmsClient("healthy"), FakeSmsClient(
+        "broken", ProviderError("provider is down")
+    )
+
+    for _ in range(3):
+        with pytest.raises(ProviderError, match="provider is down"):
+            send(router, broken)
+
+    assert router.health("broken").error_rate == 1
+    assert {
+        router.choose([healthy, broken], {"healthy": 1, "broken": 99}).name
+        for _ in range(100)
+    } == {"healthy"}
+
+    # After the reset time one send is let through to try the provider again
+    mock_monotonic.return_value = 31
+    router.choose([broken], {"broken": 1})
+    assert router.choose([healthy, broken], {"broken": 1}) is healthy
+
+    broken.error = None
+    send(router, broken)
+    assert router.choose([healthy, broken], {"broken": 1}) is broken
+
+
+def test_provider_router_counts_slow_sends_as_failures(router_config, mock_monotonic):
+    router = ProviderRouter()
+    healthy, slow = FakeSmsClient("healthy"), FakeSmsClient("slow")
+
+    for _ in range(3):
+        mock_monotonic.side_effect = [0, 6, 6]
+        send(router, slow)
+
+    mock_monotonic.side_effect = None
+    assert router.choose([healthy, slow], {"slow": 1}) is healthy
+
+
+def test_provider_router_uses_providers_with_open_circuits_if_theres_nothing_else(
+    router_config,
+):
+    router = ProviderRouter()
+    broken = FakeSmsClient("broken", ProviderError("provider is down"))
+    for _ in range(3):
+        with pytest.raises(ProviderError, match="provider is down"):
+            send(router, broken)
+
+    assert router.choose([broken], {"broken": 1}) is broken
+
+
+def test_provider_router_ignores_failures_caused_by_the_message(router_config):
+    router = ProviderRouter()
+    healthy = FakeSmsClient("healthy")
+    client = FakeSmsClient("ses", EmailClientNonRetryableException("bad address"))
+
+    for _ in range(3):
+        with pytest.raises(EmailClientNonRetryableException):
+            with router.measure(client.name, ignore=EmailClientNonRetryableException):
+                client.send_sms()
+
+    assert router.health("ses").error_rate == 0
+    assert router.choose([healthy, client], {"ses": 1}) is client
@@ -5,26 +5,35 @@ from unittest.mock import ANY
 import pytest
 from flask import current_app
 from requests import HTTPError
-from sqlalchemy import select
+from sqlalchemy import event, select
 
 import app
 from app import aws_sns_client, db, notification_provider_clients
+from app.clients.email import EmailClientNonRetryableException
+from app.clients.email.aws_ses import AwsSesClientThrottlingSendRateException
 from app.cloudfoundry_config import cloud_config
 from app.dao import notifications_dao
 from app.dao.provider_details_dao import get_provider_details_by_identifier
 from app.delivery import send_to_providers
+from app.delivery.email_branding_cache import email_branding_cache
 from app.delivery.send_to_providers import (
     _experimentally_validate_phone_numbers,
     get_html_email_options,
     get_logo_url,
+    remove_brackets,
 )
 from app.enums import BrandType, KeyType, NotificationStatus, NotificationType
-from app.exceptions import NotificationTechnicalFailureException
+from app.exceptions import (
+    NotificationTechnicalFailureException,
+    SendCapacityTimeoutException,
+)
 from app.models import EmailBranding, Notification
 from app.serialised_models import SerialisedService
 from app.utils import utc_now
+from notifications_utils.recipients import PhoneNumber
 from tests.app.db import (
     create_email_branding,
+    create_job,
     create_notification,
     create_reply_to_email,
     create_service,
@@ -38,6 +47,7 @@ def setup_function(_function):
     # pytest will run this function before each test. It makes sure the
     # state of the cache is not shared between tests.
     send_to_providers.provider_cache.clear()
+    email_branding_cache.clear()
 
 
 @pytest.mark.parametrize(
@@ -103,7 +113,7 @@ def test_should_send_personalised_template_to_correct_sms_provider_and_persist(
     send_to_providers.send_sms_to_provider(db_notification)
 
     aws_sns_client.send_sms.assert_called_once_with(
-        to="2028675309",
+        to=PhoneNumber("+2028675309", international=True),
         content="Sample service: Hello Jo\nHere is <em>some HTML</em> & entities",
         reference=str(db_notification.id),
         sender=current_app.config["FROM_NUMBER"],
@@ -130,15 +140,13 @@ def test_should_send_personalised_template_to_correct_email_provider_and_persist
 ):
 
     mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
-    utf8_encoded_email = "jo.smith@example.com".encode("utf-8")
-    mock_redis.get.return_value = utf8_encoded_email
-    email = utf8_encoded_email
+    email = "jo.smith@example.com".encode("utf-8")
     personalisation = {
         "name": "Jo",
     }
     personalisation = json.dumps(personalisation)
     personalisation = personalisation.encode("utf-8")
-    mock_redis.get.side_effect = [email, personalisation]
+    mock_redis.mget.return_value = [email, personalisation]
     db_notification = create_notification(
         template=sample_email_template_with_html,
     )
@@ -187,7 +195,6 @@ def test_should_not_send_email_message_when_service_is_inactive_notifcation_is_i
     mock_personalisation.return_value = {"name": "Jo"}
 
     mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
-    mock_redis.get.return_value = "jo.smith@example.com".encode("utf-8")
     email = "jo.smith@example.com".encode("utf-8")
     personalisation = {
         "name": "Jo",
@@ -195,7 +202,7 @@ def test_should_not_send_email_message_when_service_is_inactive_notifcation_is_i
 
     personalisation = json.dumps(personalisation)
     personalisation = personalisation.encode("utf-8")
-    mock_redis.get.side_effect = [email, personalisation]
+    mock_redis.mget.return_value = [email, personalisation]
 
     with pytest.raises(NotificationTechnicalFailureException) as e:
         send_to_providers.send_email_to_provider(sample_notification)
@@ -271,7 +278,7 @@ def test_send_sms_should_use_template_version_from_notification_not_latest(
     send_to_providers.send_sms_to_provider(db_notification)
 
     aws_sns_client.send_sms.assert_called_once_with(
-        to="2028675309",
+        to=PhoneNumber("+2028675309", international=True),
         content="Sample service: This is a template:\nwith a newline",
         reference=str(db_notification.id),
         sender=current_app.config["FROM_NUMBER"],
@@ -411,6 +418,58 @@ def test_send_sms_should_use_service_sms_sender(
     )
 
 
+def test_send_sms_to_provider_buffers_the_sending_status_update(
+    notify_api, sample_sms_template_with_html, mocker
+):
+    mocker.patch.dict(notify_api.config, {"BUFFER_SENDING_STATUS_UPDATES": True})
+    mocker.patch("app.delivery.send_to_providers._get_verify_code", return_value=None)
+    mocker.patch(
+        "app.delivery.send_to_providers.get_phone_number_from_s3",
+        return_value="2028675309",
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.get_personalisation_from_s3",
+        return_value={"name": "Jo"},
+    )
+    mocker.patch("app.aws_sns_client.send_sms", return_value="message-id")
+    mock_buffer_add = mocker.patch(
+        "app.delivery.send_to_providers.sending_status_buffer.add"
+    )
+    notification = create_notification(
+        template=sample_sms_template_with_html,
+        reply_to_text=sample_sms_template_with_html.service.get_default_sms_sender(),
+    )
+
+    send_to_providers.send_sms_to_provider(notification)
+
+    mock_buffer_add.assert_called_once_with(notification.id, "sns", billable_units=1)
+    notification = db.session.get(Notification, notification.id)
+    assert notification.status == NotificationStatus.CREATED
+    # Written straight away, for delivery receipts to find it by
+    assert notification.message_id == "message-id"
+
+
+def test_send_email_to_provider_buffers_the_sending_status_update(
+    notify_api, sample_email_template, mocker
+):
+    mocker.patch.dict(notify_api.config, {"BUFFER_SENDING_STATUS_UPDATES": True})
+    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
+    mock_redis.mget.return_value = [b"jo.smith@example.com", None]
+    mocker.patch("app.aws_ses_client.send_email", return_value="reference")
+    mock_buffer_add = mocker.patch(
+        "app.delivery.send_to_providers.sending_status_buffer.add"
+    )
+    notification = create_notification(template=sample_email_template)
+
+    send_to_providers.send_email_to_provider(notification)
+
+    mock_buffer_add.assert_called_once_with(notification.id, "ses")
+    notification = db.session.get(Notification, notification.id)
+    assert notification.status == NotificationStatus.CREATED
+    # Written straight away, for SES callbacks to find it by
+    assert notification.reference == "reference"
+
+
 def test_send_email_to_provider_should_not_send_to_provider_when_status_is_not_created(
     sample_email_template, mocker
 ):
@@ -441,16 +500,13 @@ def test_send_email_should_use_service_reply_to_email(
 ):
     mocker.patch("app.aws_ses_client.send_email", return_value="reference")
 
-    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
-    mock_redis.get.return_value = "test@example.com".encode("utf-8")
-
     mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
     email = "foo@bar.com".encode("utf-8")
     personalisation = {}
 
     personalisation = json.dumps(personalisation)
     personalisation = personalisation.encode("utf-8")
-    mock_redis.get.side_effect = [email, personalisation]
+    mock_redis.mget.return_value = [email, personalisation]
 
     db_notification = create_notification(
         template=sample_email_template, reply_to_text="foo@bar.com"
@@ -603,6 +659,265 @@ def test_get_logo_url_works_for_different_environments(base_url, expected_url):
     assert logo_url == expected_url
 
 
+def test_send_sms_batch_to_provider(sample_job, mocker):
+    reply_to_text = sample_job.service.get_default_sms_sender()
+    sent, failed = (
+        create_notification(
+            job=sample_job, job_row_number=row_number, reply_to_text=reply_to_text
+        )
+        for row_number in range(2)
+    )
+    mocker.patch("app.delivery.send_to_providers._get_verify_code", return_value=None)
+    mocker.patch(
+        "app.delivery.send_to_providers.get_phone_number_from_s3",
+        return_value="2028675309",
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.get_personalisation_from_s3", return_value={}
+    )
+    mock_send_sms = mocker.patch(
+        "app.aws_sns_client.send_sms",
+        side_effect=lambda reference, **kwargs: (
+            "message-id" if reference == str(sent.id) else 1 / 0
+        ),
+    )
+    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
+    mock_redis.take_tokens.side_effect = lambda buckets, requested: requested
+
+    assert send_to_providers.send_sms_batch_to_provider(
+        notifications_dao.dao_claim_created_notifications_from_jobs(
+            NotificationType.SMS, 10
+        ),
+        max_workers=2,
+    ) == (1, [failed.id])
+
+    assert mock_send_sms.call_count == 2
+    sent = db.session.get(Notification, sent.id)
+    assert sent.status == NotificationStatus.SENDING
+    assert sent.message_id == "message-id"
+    assert sent.sent_by == "sns"
+    assert sent.billable_units == 1
+    assert db.session.get(Notification, failed.id).status == NotificationStatus.CREATED
+    mock_redis.incrby.assert_called_once_with(ANY, 1)
+
+
+def test_send_email_batch_to_provider(sample_email_template, mocker):
+    job = create_job(sample_email_template)
+    sent, throttled, failed = (
+        create_notification(job=job, job_row_number=row_number)
+        for row_number in range(3)
+    )
+    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
+    mock_redis.take_tokens.side_effect = lambda buckets, requested: requested
+    mock_redis.mget.side_effect = lambda keys: [
+        (
+            f"{key.removeprefix('email-address-')}@example.com".encode("utf-8")
+            if key.startswith("email-address-")
+            else None
+        )
+        for key in keys
+    ]
+
+    def send_email(to_addresses, **kwargs):
+        if to_addresses == f"{sent.id}@example.com":
+            return "reference"
+        if to_addresses == f"{throttled.id}@example.com":
+            raise AwsSesClientThrottlingSendRateException("slow down")
+        raise EmailClientNonRetryableException("bad address")
+
+    mock_send_email = mocker.patch(
+        "app.aws_ses_client.send_email", side_effect=send_email
+    )
+
+    assert send_to_providers.send_email_batch_to_provider(
+        notifications_dao.dao_claim_created_notifications_from_jobs(
+            NotificationType.EMAIL, 10
+        ),
+        max_workers=3,
+    ) == (1, [throttled.id])
+
+    assert mock_send_email.call_count == 3
+    assert "<!DOCTYPE html" in mock_send_email.call_args.kwargs["html_body"]
+    sent = db.session.get(Notification, sent.id)
+    assert sent.status == NotificationStatus.SENDING
+    assert sent.reference == "reference"
+    assert sent.sent_by == "ses"
+    for notification, status in (
+        (throttled, NotificationStatus.CREATED),
+        (failed, NotificationStatus.TECHNICAL_FAILURE),
+    ):
+        assert db.session.get(Notification, notification.id).status == status
+    # Left for deliver_email to retry, rather than being claimed straight away
+    assert (
+        notifications_dao.dao_claim_created_notifications_from_jobs(
+            NotificationType.EMAIL, 10
+        )
+        == []
+    )
+
+
+@pytest.mark.parametrize(
+    "sender, expected_buckets",
+    [
+        (None, {"send-rate-sns": (20, 40)}),
+        (
+            "+12025550100",
+            {"send-rate-sns": (20, 40), "send-rate-sns-+12025550100": (3, 6)},
+        ),
+        (
+            "+12025550101",
+            {"send-rate-sns": (20, 40), "send-rate-sns-+12025550101": (1, 2)},
+        ),
+    ],
+)
+def test_take_send_capacity(notify_api, mocker, sender, expected_buckets):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "PROVIDER_SEND_RATES": {"sns": 20},
+            "SMS_SENDER_SEND_RATES": {"+12025550100": 3},
+            "SMS_SENDER_SEND_RATE": 1,
+            "SEND_RATE_BURST_SECONDS": 2,
+        },
+    )
+    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
+    mock_redis.take_tokens.return_value = 5
+
+    assert send_to_providers.take_send_capacity("sns", 10, sender) == 5
+
+    mock_redis.take_tokens.assert_called_once_with(expected_buckets, 10)
+
+
+def test_take_send_capacity_for_providers_without_a_rate(notify_api, mocker):
+    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
+
+    send_to_providers.take_send_capacity("ses", 10)
+
+    mock_redis.take_tokens.assert_called_once_with({}, 10)
+
+
+def test_send_concurrently_waits_for_send_capacity(notify_api, mocker):
+    mock_take_send_capacity = mocker.patch(
+        "app.delivery.send_to_providers.take_send_capacity", side_effect=[2, 0, 1]
+    )
+    mock_sleep = mocker.patch("app.delivery.send_to_providers.sleep")
+
+    assert send_to_providers._send_concurrently(
+        [("sns", ("+12025550100",), lambda index=index: index) for index in range(3)],
+        max_workers=2,
+    ) == [0, 1, 2]
+
+    assert mock_take_send_capacity.call_args_list == [
+        mocker.call("sns", 3, "+12025550100"),
+        mocker.call("sns", 1, "+12025550100"),
+        mocker.call("sns", 1, "+12025550100"),
+    ]
+    assert mock_sleep.call_count == 2
+
+
+def test_send_concurrently_gives_up_waiting_for_send_capacity(notify_api, mocker):
+    mocker.patch.dict(notify_api.config, {"SEND_CAPACITY_MAX_WAIT": 5})
+    mocker.patch(
+        "app.delivery.send_to_providers.take_send_capacity", side_effect=[1, 0, 0]
+    )
+    mocker.patch("app.delivery.send_to_providers.monotonic", side_effect=[0, 1, 5])
+    mock_sleep = mocker.patch("app.delivery.send_to_providers.sleep")
+
+    results = send_to_providers._send_concurrently(
+        [("sns", (None,), lambda index=index: index) for index in range(3)],
+        max_workers=2,
+    )
+
+    assert results[0] == 0
+    assert all(
+        isinstance(result, SendCapacityTimeoutException) for result in results[1:]
+    )
+    assert mock_sleep.call_count == 1
+
+
+def test_send_concurrently_spreads_sends_across_senders(notify_api, mocker):
+    mock_take_send_capacity = mocker.patch(
+        "app.delivery.send_to_providers.take_send_capacity",
+        side_effect=lambda provider_name, requested, sender: (
+            0 if sender == "+12025550101" else requested
+        ),
+    )
+    senders = ("+12025550100", "+12025550101", "+12025550102")
+
+    results = send_to_providers._send_concurrently(
+        [
+            ("sns", senders, lambda sender, index=index: (index, sender))
+            for index in range(5)
+        ],
+        max_workers=2,
+    )
+
+    assert results == [
+        (0, "+12025550100"),
+        (1, "+12025550100"),
+        (2, "+12025550102"),
+        (3, "+12025550102"),
+        (4, "+12025550102"),
+    ]
+    assert mock_take_send_capacity.call_args_list == [
+        mocker.call("sns", 2, "+12025550100"),
+        mocker.call("sns", 2, "+12025550101"),
+        mocker.call("sns", 3, "+12025550102"),
+    ]
+
+
+def test_wait_for_send_capacity_returns_a_sender_with_capacity(notify_api, mocker):
+    mocker.patch(
+        "app.delivery.send_to_providers.take_send_capacity",
+        side_effect=lambda provider_name, requested, sender: (sender == "+12025550101"),
+    )
+    mock_sleep = mocker.patch("app.delivery.send_to_providers.sleep")
+
+    for _ in range(2):
+        assert (
+            send_to_providers.wait_for_send_capacity(
+                "sns", ("+12025550100", "+12025550101")
+            )
+            == "+12025550101"
+        )
+
+    assert mock_sleep.called is False
+
+
+def test_wait_for_send_capacity_gives_up_after_the_max_wait(notify_api, mocker):
+    mocker.patch.dict(notify_api.config, {"SEND_CAPACITY_MAX_WAIT": 5})
+    mocker.patch(
+        "app.delivery.send_to_providers.take_send_capacity", return_value=False
+    )
+    mocker.patch("app.delivery.send_to_providers.monotonic", side_effect=[0, 1, 5])
+    mock_sleep = mocker.patch("app.delivery.send_to_providers.sleep")
+
+    with pytest.raises(SendCapacityTimeoutException, match="within 5s"):
+        send_to_providers.wait_for_send_capacity("sns")
+
+    assert mock_sleep.call_count == 1
+
+
+def test_get_sender_numbers_refreshes_cached_senders(notify_api, mocker):
+    mock_pool = mocker.patch("app.delivery.send_to_providers.sms_sender_pool")
+    mock_pool.senders.side_effect = [("testing",), ("testing", "+12025550100")]
+    notification = Notification(service_id="service-id", reply_to_text="+12025550100")
+
+    assert send_to_providers.get_sender_numbers(notification) == [
+        "testing",
+        "+12025550100",
+    ]
+
+    mock_pool.invalidate.assert_called_once_with("service-id")
+
+
+def test_remove_brackets():
+    assert (
+        remove_brackets('<a href="https://example.com/%5Bx%5D">(link)</a>')
+        == '<a href="https://example.com/x">link</a>'
+    )
+
+
 @pytest.mark.parametrize(
     "starting_status, expected_status",
     [
@@ -753,7 +1068,7 @@ def test_should_send_sms_to_international_providers(
     send_to_providers.send_sms_to_provider(notification_international)
 
     aws_sns_client.send_sms.assert_called_once_with(
-        to="601117224412",
+        to=PhoneNumber("+601117224412", international=True),
         content=ANY,
         reference=str(notification_international.id),
         sender=current_app.config["FROM_NUMBER"],
@@ -816,7 +1131,7 @@ def test_send_email_to_provider_uses_reply_to_from_notification(
     sample_email_template, mocker
 ):
     mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
-    mock_redis.get.side_effect = [
+    mock_redis.mget.return_value = [
         "test@example.com".encode("utf-8"),
         json.dumps({}).encode("utf-8"),
     ]
@@ -868,7 +1183,7 @@ def test_send_sms_to_provider_should_use_normalised_to(mocker, client, sample_te
     mock_personalisation.return_value = {"ignore": "ignore"}
     send_to_providers.send_sms_to_provider(notification)
     send_mock.assert_called_once_with(
-        to="12028675309",
+        to=PhoneNumber("+12028675309"),
         content=ANY,
         reference=str(notification.id),
         sender=notification.reply_to_text,
@@ -884,16 +1199,12 @@ def test_send_email_to_provider_should_user_normalised_to(
         template=sample_email_template,
     )
     mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
-    mock_redis.get.return_value = "test@example.com".encode("utf-8")
-
-    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
-    mock_redis.get.return_value = "jo.smith@example.com".encode("utf-8")
     email = "test@example.com".encode("utf-8")
     personalisation = {}
 
     personalisation = json.dumps(personalisation)
     personalisation = personalisation.encode("utf-8")
-    mock_redis.get.side_effect = [email, personalisation]
+    mock_redis.mget.return_value = [email, personalisation]
 
     send_to_providers.send_email_to_provider(notification)
     send_mock.assert_called_once_with(
@@ -956,7 +1267,7 @@ def test_send_sms_to_provider_should_return_template_if_found_in_redis(
     assert mock_get_template.called is False
     assert mock_get_service.called is False
     send_mock.assert_called_once_with(
-        to="447700900855",
+        to=PhoneNumber("+447700900855", international=True),
         content=ANY,
         reference=str(notification.id),
         sender=notification.reply_to_text,
@@ -983,11 +1294,10 @@ def test_send_email_to_provider_should_return_template_if_found_in_redis(
     service_dict = service_schema.dump(sample_email_template.service)
     template_dict = template_schema.dump(sample_email_template)
 
+    mocker.patch("app.redis_store.mget", return_value=[email, personalisation])
     mocker.patch(
         "app.redis_store.get",
         side_effect=[
-            email,
-            personalisation,
             json.dumps({"data": service_dict}).encode("utf-8"),
             json.dumps({"data": template_dict}).encode("utf-8"),
         ],
@@ -1032,6 +1342,55 @@ def test_get_html_email_options_return_email_branding_from_serialised_service(
     }
 
 
+def test_get_html_email_options_caches_email_branding_until_invalidated(
+    sample_service,
+):
+    branding = create_email_branding()
+    sample_service.email_branding = branding
+    service = SerialisedService.from_id(sample_service.id)
+    branding_queries = []
+
+    def count_branding_queries(conn, cursor, statement, *args):
+        if "FROM email_branding" in statement:
+            branding_queries.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_branding_queries)
+    try:
+        first_options = get_html_email_options(service)
+        assert get_html_email_options(service) == first_options
+        assert len(branding_queries) == 1
+
+        email_branding_cache.invalidate(branding.id)
+        get_html_email_options(service)
+        assert len(branding_queries) == 2
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_branding_queries)
+
+
+def test_send_email_to_provider_gets_email_context_in_one_round_trip(
+    sample_email_template, mocker
+):
+    mock_redis = mocker.patch("app.delivery.send_to_providers.redis_store")
+    mock_redis.mget.return_value = [
+        b"jo.smith@example.com",
+        json.dumps({"name": "Jo"}).encode("utf-8"),
+    ]
+    send_mock = mocker.patch("app.aws_ses_client.send_email", return_value="ref")
+    notification = create_notification(template=sample_email_template)
+
+    send_to_providers.send_email_to_provider(notification)
+
+    mock_redis.mget.assert_called_once_with(
+        [
+            f"email-address-{notification.id}",
+            f"email-personalisation-{notification.id}",
+        ]
+    )
+    assert mock_redis.get.called is False
+    assert send_mock.call_args.args[1] == "jo.smith@example.com"
+    assert notification.personalisation == {"name": "Jo"}
+
+
 def test_get_html_email_options_add_email_branding_from_service(sample_service):
     branding = create_email_branding()
     sample_service.email_branding = branding
@@ -0,0 +1,103 @@
+import pytest
+
+from app.delivery.sending_status_buffer import SendingStatusBuffer
+
+
+@pytest.fixture
+def buffer_config(notify_api, mocker):
+    mocker.patch.dict(
+        notify_api.config,
+        {"SENDING_STATUS_BUFFER_SIZE": 2, "SENDING_STATUS_BUFFER_MAX_AGE": 60},
+    )
+
+
+@pytest.fixture
+def mock_timer(mocker):
+    return mocker.patch("app.delivery.sending_status_buffer.Timer")
+
+
+@pytest.fixture
+def mock_update(mocker):
+    return mocker.patch(
+        "app.delivery.sending_status_buffer.dao_update_notifications_to_sending"
+    )
+
+
+def test_sending_status_buffer_flushes_when_full(
+    buffer_config, mock_timer, mock_update
+):
+    buffer = SendingStatusBuffer()
+
+    buffer.add("id-1", "sns", billable_units=1)
+    assert mock_update.called is False
+
+    buffer.add("id-2", "ses")
+
+    (updates,) = mock_update.call_args.args
+    assert [(update[0], *update[2:]) for update in updates] == [
+        ("id-1", "sns", 1),
+        ("id-2", "ses", None),
+    ]
+    mock_timer.assert_called_once_with(60, buffer.flush)
+    mock_timer.return_value.start.assert_called_once_with()
+
+
+def test_sending_status_buffer_flushes_when_the_timer_fires(
+    buffer_config, mock_timer, mock_update
+):
+    buffer = SendingStatusBuffer()
+    buffer.add("id-1", "sns")
+
+    buffer.flush()
+    buffer.flush()
+
+    assert mock_update.call_count == 1
+    assert [update[0] for update in mock_update.call_args.args[0]] == ["id-1"]
+
+
+def test_sending_status_buffer_keeps_updates_if_they_cant_be_written(
+    buffer_config, mock_timer, mock_update
+):
+    mock_update.side_effect = [Exception("database unavailable"), 1]
+    buffer = SendingStatusBuffer()
+    buffer.add("id-1", "sns")
+
+    buffer.flush()
+    buffer.flush()
+
+    assert mock_update.call_count == 2
+    assert mock_update.call_args.args[0][0][0] == "id-1"
+    assert mock_timer.call_count == 2
+
+
+def test_sending_status_buffer_writes_updates_one_at_a_time_after_failing_repeatedly(
+    buffer_config, mock_timer, mock_update, mocker
+):
+    mocker.patch("app.delivery.sending_status_buffer.MAX_FLUSH_ATTEMPTS", 2)
+    mock_update.side_effect = [
+        Exception("database unavailable"),
+        Exception("bad update"),
+        Exception("bad update"),
+        1,
+        1,
+    ]
+    buffer = SendingStatusBuffer()
+    buffer.add("id-1", "sns")
+    buffer.flush()
+    assert mock_update.call_count == 1
+
+    buffer.flush()
+
+    assert [
+        [update[0] for update in call.args[0]] for call in mock_update.call_args_list
+    ] == [["id-1"], ["id-1"], ["id-1"]]
+
+    # It’s kept, written on its own, rather than holding up later updates
+    buffer.add("id-2", "sns")
+
+    assert [
+        [update[0] for update in call.args[0]]
+        for call in mock_update.call_args_list[3:]
+    ] == [["id-2"], ["id-1"]]
+    buffer.flush()
+    assert mock_update.call_count == 5
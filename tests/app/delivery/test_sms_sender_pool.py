@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.delivery.sms_sender_pool import SmsSenderPool
+
+
+@pytest.fixture
+def mock_get_senders(mocker):
+    return mocker.patch(
+        "app.delivery.sms_sender_pool.dao_get_sms_senders_by_service_id",
+        return_value=[
+            SimpleNamespace(sms_sender=sender)
+            for sender in ("+12025550100", "Notify.gov", "12025550101")
+        ],
+    )
+
+
+def test_sms_sender_pool_caches_senders_until_invalidated(notify_api, mock_get_senders):
+    pool = SmsSenderPool()
+
+    assert pool.senders("service-id") == ("+12025550100", "Notify.gov", "12025550101")
+    pool.senders("service-id")
+    assert mock_get_senders.call_count == 1
+
+    pool.invalidate("service-id")
+    pool.senders("service-id")
+    assert mock_get_senders.call_count == 2
+
+
+def test_sms_sender_pool_invalidates_senders_in_other_processes(
+    notify_api, mock_get_senders, mocker
+):
+    versions = {}
+    mock_redis = mocker.patch("app.delivery.sms_sender_pool.redis_store")
+    mock_redis.get.side_effect = versions.get
+    mock_redis.incr.side_effect = lambda key: versions.update(
+        {key: versions.get(key, 0) + 1}
+    )
+    pool, other_process_pool = SmsSenderPool(), SmsSenderPool()
+
+    pool.senders("service-id")
+    other_process_pool.senders("service-id")
+    other_process_pool.senders("service-id")
+    assert mock_get_senders.call_count == 2
+
+    pool.invalidate("service-id")
+    other_process_pool.senders("service-id")
+    assert mock_get_senders.call_count == 3
+    mock_redis.incr.assert_called_once_with("sms-senders-version-service-id")
+
+
+@pytest.mark.parametrize(
+    "spread, platform_pool, sender, expected_numbers",
+    [
+        (False, [], "+12025550100", ("+12025550100",)),
+        (True, [], "+12025550100", ("+12025550100", "12025550101")),
+        (True, [], "+12025550199", ("+12025550199",)),
+        (True, [], "Notify.gov", ("Notify.gov",)),
+        (
+            True,
+            ["+18445550100", "+18445550101"],
+            "Notify.gov",
+            ("+18445550100", "+18445550101"),
+        ),
+        (False, ["+18445550100"], "Notify.gov", ("Notify.gov",)),
+    ],
+)
+def test_sms_sender_pool_numbers_for(
+    notify_api,
+    mocker,
+    mock_get_senders,
+    spread,
+    platform_pool,
+    sender,
+    expected_numbers,
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "SPREAD_SMS_ACROSS_SENDERS": spread,
+            "PLATFORM_SMS_SENDER_POOL": platform_pool,
+        },
+    )
+
+    assert SmsSenderPool().numbers_for("service-id", sender) == expected_numbers
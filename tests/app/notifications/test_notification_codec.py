@@ -0,0 +1,152 @@
+import json
+import uuid
+from datetime import datetime
+from time import process_time
+
+import pytest
+
+from app.enums import KeyType, NotificationStatus, NotificationType
+from app.models import Notification
+from app.notifications import notification_codec
+from app.notifications.notification_codec import (
+    decode_queued_notification,
+    encode_queued_notification,
+)
+
+
+def _notification(**kwargs):
+    return Notification(
+        **{
+            "id": uuid.uuid4(),
+            "to": "+12028675309",
+            "normalised_to": "12028675309",
+            "job_id": uuid.uuid4(),
+            "job_row_number": 7,
+            "service_id": uuid.uuid4(),
+            "template_id": uuid.uuid4(),
+            "template_version": 2,
+            "key_type": KeyType.NORMAL,
+            "billable_units": 1,
+            "notification_type": NotificationType.SMS,
+            "created_at": datetime(2024, 1, 1, 12, 0, 0, 123456),
+            "status": NotificationStatus.CREATED,
+            "client_reference": "réf",
+            "_personalisation": "encrypted-personalisation",
+            "international": False,
+            "phone_prefix": "1",
+            "rate_multiplier": 1.0,
+            "reply_to_text": "+18005550100",
+            **kwargs,
+        }
+    )
+
+
+def test_encode_and_decode_queued_notification():
+    notification = _notification()
+
+    fields, deliver_after_insert = decode_queued_notification(
+        encode_queued_notification(notification, deliver_after_insert=True)
+    )
+
+    assert deliver_after_insert is True
+    assert fields == {
+        "id": str(notification.id),
+        "to": "+12028675309",
+        "normalised_to": "12028675309",
+        "job_id": str(notification.job_id),
+        "job_row_number": 7,
+        "service_id": str(notification.service_id),
+        "template_id": str(notification.template_id),
+        "template_version": 2,
+        "key_type": "normal",
+        "billable_units": 1,
+        "notification_type": "sms",
+        "created_at": datetime(2024, 1, 1, 12, 0, 0, 123456),
+        "status": "created",
+        "client_reference": "réf",
+        "_personalisation": "encrypted-personalisation",
+        "international": False,
+        "phone_prefix": "1",
+        "rate_multiplier": 1.0,
+        "reply_to_text": "+18005550100",
+    }
+    assert Notification(**fields).created_at == notification.created_at
+
+
+def test_encode_queued_notification_accepts_ids_and_timestamps_as_strings():
+    notification_id = uuid.uuid4()
+    notification = _notification(
+        id=str(notification_id), created_at="2024-01-01 12:00:00"
+    )
+
+    fields, deliver_after_insert = decode_queued_notification(
+        encode_queued_notification(notification)
+    )
+
+    assert deliver_after_insert is False
+    assert fields["id"] == str(notification_id)
+    assert fields["created_at"] == datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_decode_queued_notification_decodes_json():
+    notification = _notification()
+    serialized_notification = notification.serialize_for_redis(notification)
+    serialized_notification["deliver_after_insert"] = True
+
+    fields, deliver_after_insert = decode_queued_notification(
+        json.dumps(serialized_notification).encode("utf-8")
+    )
+
+    assert deliver_after_insert is True
+    assert fields["id"] == str(notification.id)
+    assert fields["status"] == "created"
+    assert fields["created_at"] == "2024-01-01 12:00:00"
+
+
+def test_decode_queued_notification_decodes_json_ids_which_are_not_set_as_none():
+    notification = _notification(job_id=None, job_row_number=None)
+    serialized_notification = notification.serialize_for_redis(notification)
+    assert serialized_notification["job_id"] == "None"
+
+    fields, _ = decode_queued_notification(
+        json.dumps(serialized_notification).encode("utf-8")
+    )
+
+    assert fields["job_id"] is None
+    assert fields["id"] == str(notification.id)
+
+
+def test_decode_queued_notification_decodes_older_schema_versions(mocker):
+    encoded = encode_queued_notification(_notification())
+    mocker.patch.dict(
+        notification_codec.SCHEMAS,
+        {2: notification_codec.SCHEMAS[1] + (("sent_at", "timestamp"),)},
+    )
+    mocker.patch.object(notification_codec, "VERSION", 2)
+
+    fields, _ = decode_queued_notification(encoded)
+    assert fields["to"] == "+12028675309"
+    assert "sent_at" not in fields
+
+    fields, _ = decode_queued_notification(
+        encode_queued_notification(_notification(sent_at=datetime(2024, 1, 2)))
+    )
+    assert fields["sent_at"] == datetime(2024, 1, 2)
+
+
+def test_decode_queued_notification_rejects_malformed_data():
+    with pytest.raises(json.JSONDecodeError):
+        decode_queued_notification(b"not_a_valid_json")
+
+
+def test_queued_notifications_are_smaller_and_quicker_than_json():
+    notification = _notification()
+    encoded = encode_queued_notification(notification)
+    as_json = json.dumps(notification.serialize_for_redis(notification)).encode()
+
+    assert len(encoded) < len(as_json) / 2
+
+    start = process_time()
+    for _ in range(10000):
+        decode_queued_notification(encode_queued_notification(notification))
+    assert process_time() - start < 1
@@ -0,0 +1,171 @@
+from unittest.mock import MagicMock, call
+
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.models import Notification
+from app.notifications import notification_inserter as notification_inserter_module
+from app.notifications.notification_inserter import NotificationInserter
+from app.utils import utc_now
+
+
+@pytest.fixture
+def inserter_config(notify_api, mocker):
+    mocker.patch.dict(
+        notify_api.config,
+        {"NOTIFICATION_INSERTER_BATCH_SIZE": 3, "NOTIFICATION_INSERTER_WINDOW": 0.05},
+    )
+
+
+@pytest.fixture
+def mock_redis(mocker):
+    rs = MagicMock()
+    rs.llen.return_value = 0
+    return mocker.patch.object(notification_inserter_module, "redis_store", rs)
+
+
+@pytest.fixture
+def mock_insert(mocker):
+    return mocker.patch.object(
+        notification_inserter_module,
+        "insert_message_queue_batch",
+        side_effect=lambda items: [
+            Notification(id=item, created_at=utc_now()) for item in items
+        ],
+    )
+
+
+def test_insert_next_batch_does_nothing_if_no_notifications_arrive(
+    inserter_config, mock_redis, mock_insert
+):
+    mock_redis.claim_list_item.return_value = ("claim-1", [])
+
+    assert NotificationInserter().insert_next_batch() == 0
+
+    mock_redis.claim_list_item.assert_called_once_with("message_queue", 1)
+    mock_insert.assert_not_called()
+    mock_redis.release_list_batch.assert_not_called()
+
+
+def test_insert_next_batch_inserts_a_full_batch_at_once(
+    inserter_config, mock_redis, mock_insert
+):
+    mock_redis.claim_list_item.return_value = ("claim-1", [b"1"])
+    mock_redis.claim_list_batch.side_effect = [("claim-2", [b"2", b"3"])]
+
+    assert NotificationInserter().insert_next_batch() == 3
+
+    mock_redis.claim_list_batch.assert_called_once_with("message_queue", 2)
+    mock_insert.assert_called_once_with([b"1", b"2", b"3"])
+    assert mock_redis.release_list_batch.call_args_list == [
+        call("message_queue", "claim-1"),
+        call("message_queue", "claim-2"),
+    ]
+
+
+def test_insert_next_batch_inserts_what_it_has_once_the_window_has_passed(
+    inserter_config, mock_redis, mock_insert, mocker
+):
+    mocker.patch.object(
+        notification_inserter_module,
+        "monotonic",
+        side_effect=[0, 0, 0.01, 0.02, 0.06, 1, 1],
+    )
+    mock_sleep = mocker.patch.object(notification_inserter_module, "sleep")
+    mock_redis.claim_list_item.return_value = ("claim-1", [b"1"])
+    mock_redis.claim_list_batch.side_effect = [("claim-2", []), ("claim-3", [b"2"])]
+
+    assert NotificationInserter().insert_next_batch() == 2
+
+    mock_sleep.assert_called_once()
+    mock_insert.assert_called_once_with([b"1", b"2"])
+    assert mock_redis.release_list_batch.call_args_list == [
+        call("message_queue", "claim-1"),
+        call("message_queue", "claim-3"),
+    ]
+
+
+def test_insert_next_batch_releases_batches_which_could_not_be_inserted(
+    inserter_config, mock_redis, mock_insert
+):
+    # They’ve already been put back on the queue
+    mock_insert.side_effect = lambda items: []
+    mock_redis.claim_list_item.return_value = ("claim-1", [b"1"])
+    mock_redis.claim_list_batch.return_value = ("claim-2", [b"2", b"3"])
+
+    assert NotificationInserter().insert_next_batch() == 0
+
+    assert mock_redis.release_list_batch.call_count == 2
+
+
+def test_run_recovers_abandoned_batches_and_stops(inserter_config, mock_redis, mocker):
+    mock_recover = mocker.patch.object(
+        notification_inserter_module, "recover_message_queue_claims"
+    )
+    inserter = NotificationInserter()
+    mocker.patch.object(inserter, "insert_next_batch", side_effect=inserter.stop)
+
+    inserter.run()
+
+    mock_recover.assert_called_once_with()
+    inserter.insert_next_batch.assert_called_once_with()
+
+
+def test_insert_next_batch_releases_claims_if_inserting_fails(
+    inserter_config, mock_redis, mock_insert
+):
+    mock_insert.side_effect = SQLAlchemyError("database unavailable")
+    mock_redis.claim_list_item.return_value = ("claim-1", [b"1"])
+    mock_redis.claim_list_batch.return_value = ("claim-2", [b"2", b"3"])
+
+    with pytest.raises(SQLAlchemyError, match="database unavailable"):
+        NotificationInserter().insert_next_batch()
+
+    assert mock_redis.release_list_batch.call_count == 2
+
+
+def test_run_waits_out_the_claim_timeout_if_nothing_was_inserted(
+    inserter_config, mock_redis, mocker
+):
+    mocker.patch.object(notification_inserter_module, "recover_message_queue_claims")
+    mocker.patch.object(
+        notification_inserter_module, "monotonic", side_effect=[0, 0.25, 1, 1]
+    )
+    inserter = NotificationInserter()
+    mock_wait = mocker.patch.object(inserter._stopped, "wait")
+
+    def insert_next_batch():
+        if inserter.insert_next_batch.call_count == 2:
+            inserter.stop()
+        return 0
+
+    mocker.patch.object(inserter, "insert_next_batch", side_effect=insert_next_batch)
+
+    inserter.run()
+
+    assert mock_wait.call_args_list == [call(0.75), call(1)]
+
+
+def test_run_logs_and_carries_on_if_inserting_fails(
+    inserter_config, mock_redis, mocker
+):
+    mocker.patch.object(notification_inserter_module, "recover_message_queue_claims")
+    mock_log = mocker.patch(
+        "app.notifications.notification_inserter.current_app.logger.exception"
+    )
+    inserter = NotificationInserter()
+    mocker.patch.object(inserter._stopped, "wait")
+
+    def insert_next_batch():
+        if inserter.insert_next_batch.call_count == 1:
+            raise Exception("database unavailable")
+        inserter.stop()
+        return 3
+
+    mocker.patch.object(inserter, "insert_next_batch", side_effect=insert_next_batch)
+
+    inserter.run()
+
+    assert inserter.insert_next_batch.call_count == 2
+    mock_log.assert_called_once_with("Failed to insert notifications")
+    inserter._stopped.wait.assert_called_once()
@@ -1,4 +1,5 @@
 import datetime
+import json
 import uuid
 from collections import namedtuple
 
@@ -8,18 +9,22 @@ from freezegun import freeze_time
 from sqlalchemy import func, select
 from sqlalchemy.exc import SQLAlchemyError
 
-from app import db
+from app import db, encryption
 from app.enums import KeyType, NotificationType, ServicePermissionType, TemplateType
 from app.errors import BadRequestError
 from app.models import Notification, NotificationHistory
+from app.notifications.notification_codec import decode_queued_notification
 from app.notifications.process_notifications import (
+    can_queue_sms_notification_fields,
     create_content_for_notification,
     persist_notification,
+    queue_sms_notification_fields,
     send_notification_to_queue,
     simulated_recipient,
 )
 from app.serialised_models import SerialisedTemplate
 from notifications_utils.recipients import (
+    PhoneNumber,
     validate_and_format_email_address,
     validate_and_format_phone_number,
 )
@@ -125,6 +130,26 @@ def test_persist_notification_creates_and_save_to_db(
     )
 
 
+def test_persist_notification_says_if_the_notification_already_existed(
+    sample_email_template, sample_api_key
+):
+    arguments = {
+        "notification_id": uuid.uuid4(),
+        "template_id": sample_email_template.id,
+        "template_version": sample_email_template.version,
+        "recipient": "test@example.com",
+        "service": sample_email_template.service,
+        "personalisation": {},
+        "notification_type": NotificationType.EMAIL,
+        "api_key_id": sample_api_key.id,
+        "key_type": sample_api_key.key_type,
+    }
+
+    assert persist_notification(**arguments).already_existed is False
+    assert persist_notification(**arguments).already_existed is True
+    assert _get_notification_query_count() == 1
+
+
 def test_persist_notification_throws_exception_when_missing_template(sample_api_key):
     assert _get_notification_query_count() == 0
     assert _get_notification_history_query_count() == 0
@@ -268,6 +293,195 @@ def test_send_notification_to_queue(
     )
 
 
+def test_send_notification_to_queue_without_a_countdown_if_delivering_after_batch_insert(
+    notify_api, sample_notification, mocker
+):
+    mocker.patch.dict(notify_api.config, {"DELIVER_AFTER_BATCH_INSERT": True})
+    mocked = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+
+    send_notification_to_queue(sample_notification)
+
+    mocked.assert_called_once_with(
+        [str(sample_notification.id)], queue="send-sms-tasks", countdown=0
+    )
+
+
+def test_send_notification_to_queue_leaves_notifications_for_batch_insert_to_send(
+    notify_api, sample_notification, mocker
+):
+    mocked = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+    sample_notification.deliver_after_insert = True
+
+    send_notification_to_queue(sample_notification)
+
+    assert mocked.called is False
+
+
+@pytest.mark.parametrize(
+    "deliver_sms_in_batches, job, expected_deliver_after_insert",
+    [
+        (False, False, True),
+        (False, True, True),
+        (True, False, True),
+        (True, True, False),
+    ],
+)
+def test_persist_notification_leaves_sms_for_batch_insert_to_send(
+    notify_api,
+    sample_job,
+    sample_api_key,
+    mocker,
+    deliver_sms_in_batches,
+    job,
+    expected_deliver_after_insert,
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "DELIVER_AFTER_BATCH_INSERT": True,
+            "DELIVER_SMS_IN_BATCHES": deliver_sms_in_batches,
+        },
+    )
+    mocker.patch.dict("os.environ", {"NOTIFY_ENVIRONMENT": "development"})
+    mock_redis = mocker.patch("app.notifications.process_notifications.redis_store")
+
+    notification = persist_notification(
+        template_id=sample_job.template.id,
+        template_version=sample_job.template.version,
+        recipient="+447111111111",
+        service=sample_job.service,
+        personalisation=None,
+        notification_type=NotificationType.SMS,
+        api_key_id=sample_api_key.id,
+        key_type=sample_api_key.key_type,
+        job_id=sample_job.id if job else None,
+    )
+
+    assert notification.deliver_after_insert is expected_deliver_after_insert
+    serialized_notification = json.loads(mock_redis.rpush.call_args.args[1])
+    assert (
+        serialized_notification.get("deliver_after_insert", False)
+        is expected_deliver_after_insert
+    )
+    assert _get_notification_query_count() == 0
+
+
+def test_persist_notification_queues_sms_in_binary(
+    notify_api, sample_job, sample_api_key, mocker
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {"QUEUE_NOTIFICATIONS_IN_BINARY": True, "DELIVER_AFTER_BATCH_INSERT": True},
+    )
+    mocker.patch.dict("os.environ", {"NOTIFY_ENVIRONMENT": "development"})
+    mock_redis = mocker.patch("app.notifications.process_notifications.redis_store")
+
+    notification = persist_notification(
+        template_id=sample_job.template.id,
+        template_version=sample_job.template.version,
+        recipient="+447111111111",
+        service=sample_job.service,
+        personalisation=None,
+        notification_type=NotificationType.SMS,
+        api_key_id=sample_api_key.id,
+        key_type=sample_api_key.key_type,
+    )
+
+    fields, deliver_after_insert = decode_queued_notification(
+        mock_redis.rpush.call_args.args[1]
+    )
+    assert fields["id"] == str(notification.id)
+    assert fields["template_id"] == str(sample_job.template.id)
+    assert deliver_after_insert is True
+
+
+@freeze_time("2024-01-01 12:00:00")
+def test_queue_sms_notification_fields_queues_what_persist_notification_would(
+    notify_api, sample_template, sample_api_key, mocker
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {"QUEUE_NOTIFICATIONS_IN_BINARY": True, "DELIVER_AFTER_BATCH_INSERT": True},
+    )
+    mocker.patch.dict("os.environ", {"NOTIFY_ENVIRONMENT": "development"})
+    mock_redis = mocker.patch("app.notifications.process_notifications.redis_store")
+    arguments = {
+        "template_id": sample_template.id,
+        "template_version": sample_template.version,
+        "recipient": "+1 (202) 867-5309",
+        "personalisation": {"name": "Jo"},
+        "api_key_id": sample_api_key.id,
+        "key_type": sample_api_key.key_type,
+        "client_reference": "ref",
+        "reply_to_text": "+18005550100",
+    }
+
+    persist_notification(
+        notification_id=uuid.uuid4(),
+        service=sample_template.service,
+        notification_type=NotificationType.SMS,
+        **arguments,
+    )
+    deliver_after_insert = queue_sms_notification_fields(
+        notification_id=uuid.uuid4(),
+        service_id=sample_template.service.id,
+        phone_number=PhoneNumber.from_validated("+12028675309"),
+        **arguments,
+    )
+
+    persisted, queued = (
+        decode_queued_notification(call.args[1])
+        for call in mock_redis.rpush.call_args_list
+    )
+    for fields, _ in (persisted, queued):
+        del fields["id"]
+        fields["personalisation"] = encryption.decrypt(fields.pop("_personalisation"))
+    assert queued == persisted
+    assert deliver_after_insert is True
+
+
+@pytest.mark.parametrize(
+    "config, notification_type, personalisation, simulated, expected",
+    [
+        ({}, NotificationType.SMS, {"name": "Jo"}, False, True),
+        ({}, NotificationType.EMAIL, {"name": "Jo"}, False, False),
+        ({}, NotificationType.SMS, {"verify_code": "123456"}, False, False),
+        ({}, NotificationType.SMS, {"name": "Jo"}, True, False),
+        (
+            {"QUEUE_NOTIFICATIONS_IN_BINARY": False},
+            NotificationType.SMS,
+            None,
+            False,
+            False,
+        ),
+        (
+            {"QUEUE_API_SMS_WITHOUT_MODEL": False},
+            NotificationType.SMS,
+            None,
+            False,
+            False,
+        ),
+    ],
+)
+def test_can_queue_sms_notification_fields(
+    notify_api, mocker, config, notification_type, personalisation, simulated, expected
+):
+    mocker.patch.dict(
+        notify_api.config,
+        {
+            "QUEUE_NOTIFICATIONS_IN_BINARY": True,
+            "QUEUE_API_SMS_WITHOUT_MODEL": True,
+            **config,
+        },
+    )
+    mocker.patch.dict("os.environ", {"NOTIFY_ENVIRONMENT": "development"})
+
+    assert (
+        can_queue_sms_notification_fields(notification_type, personalisation, simulated)
+        is expected
+    )
+
+
 def test_send_notification_to_queue_throws_exception_deletes_notification(
     sample_notification, mocker
 ):
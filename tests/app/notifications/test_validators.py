@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 import pytest
 
 from app.dao import templates_dao
@@ -22,12 +24,14 @@ from app.notifications.validators import (
     check_template_is_for_notification_type,
     service_can_send_to_recipient,
     validate_and_format_recipient,
+    validate_recipient,
     validate_template,
 )
 from app.serialised_models import SerialisedService, SerialisedTemplate
 from app.service.utils import service_allowed_to_send_to
 from app.utils import get_template_instance
 from notifications_utils import SMS_CHAR_COUNT_LIMIT
+from notifications_utils.recipients import PhoneNumber
 from tests.app.db import (
     create_reply_to_email,
     create_service,
@@ -518,6 +522,21 @@ def test_validate_and_format_recipient_fails_when_no_recipient():
     assert e.value.message == "Recipient can't be empty"
 
 
+def test_validate_recipient_returns_the_parsed_phone_number(mocker):
+    mocker.patch("app.notifications.validators.service_can_send_to_recipient")
+    service = SimpleNamespace(permissions=[ServicePermissionType.SMS])
+
+    recipient = validate_recipient(
+        "(202) 867-5309", KeyType.NORMAL, service, NotificationType.SMS
+    )
+
+    assert recipient == PhoneNumber("+12028675309")
+    assert recipient.country_prefix == "1"
+    assert str(recipient) == validate_and_format_recipient(
+        "(202) 867-5309", KeyType.NORMAL, service, NotificationType.SMS
+    )
+
+
 @pytest.mark.parametrize(
     "notification_type",
     [NotificationType.SMS, NotificationType.EMAIL],
@@ -1,5 +1,5 @@
 import uuid
-from unittest.mock import Mock
+from unittest.mock import Mock, call
 
 import pytest
 from freezegun import freeze_time
@@ -19,22 +19,61 @@ def delete_mock():
 
 
 @pytest.fixture()
-def mocked_redis_client(app, mocked_redis_pipeline, delete_mock, mocker):
+def take_tokens_mock():
+    return Mock(return_value=3)
+
+
+@pytest.fixture()
+def pop_by_score_mock():
+    return Mock(return_value=[b"a", b"b"])
+
+
+@pytest.fixture()
+def claim_list_batch_mock():
+    return Mock(return_value=[b"a", b"b"])
+
+
+@pytest.fixture()
+def recover_list_batches_mock():
+    return Mock(return_value=2)
+
+
+@pytest.fixture()
+def mocked_redis_client(
+    app,
+    mocked_redis_pipeline,
+    delete_mock,
+    take_tokens_mock,
+    pop_by_score_mock,
+    claim_list_batch_mock,
+    recover_list_batches_mock,
+    mocker,
+):
     app.config["REDIS_ENABLED"] = True
 
     redis_client = RedisClient()
     redis_client.init_app(app)
 
     mocker.patch.object(redis_client.redis_store, "get", return_value=100)
+    mocker.patch.object(redis_client.redis_store, "mget", return_value=[b"a", None])
     mocker.patch.object(redis_client.redis_store, "set")
     mocker.patch.object(redis_client.redis_store, "incr")
     mocker.patch.object(redis_client.redis_store, "delete")
+    mocker.patch.object(redis_client.redis_store, "zadd")
     mocker.patch.object(
         redis_client.redis_store, "pipeline", return_value=mocked_redis_pipeline
     )
 
     mocker.patch.object(
-        redis_client, "scripts", {"delete-keys-by-pattern": delete_mock}
+        redis_client,
+        "scripts",
+        {
+            "delete-keys-by-pattern": delete_mock,
+            "take-tokens": take_tokens_mock,
+            "pop-by-score": pop_by_score_mock,
+            "claim-list-batch": claim_list_batch_mock,
+            "recover-list-batches": recover_list_batches_mock,
+        },
     )
 
     mocker.patch.object(
@@ -47,7 +86,7 @@ def mocked_redis_client(app, mocked_redis_pipeline, delete_mock, mocker):
 
 
 @pytest.fixture()
-def failing_redis_client(mocked_redis_client, delete_mock):
+def failing_redis_client(mocked_redis_client, delete_mock, take_tokens_mock):
     # nota bene: using KeyError because flake8 thinks Exception
     # and BaseException are too broad
     mocked_redis_client.redis_store.get.side_effect = KeyError("get failed")
@@ -56,6 +95,7 @@ def failing_redis_client(mocked_redis_client, delete_mock):
     mocked_redis_client.redis_store.pipeline.side_effect = KeyError("pipeline failed")
     mocked_redis_client.redis_store.delete.side_effect = KeyError("delete failed")
     delete_mock.side_effect = KeyError("delete by pattern failed")
+    take_tokens_mock.side_effect = KeyError("take tokens failed")
     return mocked_redis_client
 
 
@@ -87,8 +127,19 @@ def test_should_raise_exception_if_raise_set_to_true(
         failing_redis_client.delete_by_pattern("pattern", raise_exception=True)
     assert str(e.value) == "'delete by pattern failed'"
 
+    with pytest.raises(KeyError) as e:
+        failing_redis_client.take_tokens({"bucket": (1, 1)}, 5, raise_exception=True)
+    assert str(e.value) == "'take tokens failed'"
 
-def test_should_not_call_if_not_enabled(mocked_redis_client, delete_mock):
+
+def test_should_not_call_if_not_enabled(
+    mocked_redis_client,
+    delete_mock,
+    take_tokens_mock,
+    pop_by_score_mock,
+    claim_list_batch_mock,
+    recover_list_batches_mock,
+):
     mocked_redis_client.active = False
 
     assert mocked_redis_client.get("get_key") is None
@@ -97,6 +148,13 @@ def test_should_not_call_if_not_enabled(mocked_redis_client, delete_mock):
     assert mocked_redis_client.exceeded_rate_limit("rate_limit_key", 100, 100) is False
     assert mocked_redis_client.delete("delete_key") is None
     assert mocked_redis_client.delete_by_pattern("pattern") == 0
+    assert mocked_redis_client.take_tokens({"bucket": (1, 1)}, 5) == 5
+    assert mocked_redis_client.zadd("zadd_key", {"member": 1}) is None
+    assert mocked_redis_client.pop_by_score("pop_key", 1, 10) == []
+    assert mocked_redis_client.claim_list_batch("list_key", 10)[1] == []
+    assert mocked_redis_client.claim_list_item("list_key", 1)[1] == []
+    mocked_redis_client.release_list_batch("list_key", "list_key-claim-1")
+    assert mocked_redis_client.recover_list_batches("list_key", 1) == 0
 
     mocked_redis_client.redis_store.get.assert_not_called()
     mocked_redis_client.redis_store.set.assert_not_called()
@@ -104,6 +162,11 @@ def test_should_not_call_if_not_enabled(mocked_redis_client, delete_mock):
     mocked_redis_client.redis_store.delete.assert_not_called()
     mocked_redis_client.redis_store.pipeline.assert_not_called()
     delete_mock.assert_not_called()
+    take_tokens_mock.assert_not_called()
+    mocked_redis_client.redis_store.zadd.assert_not_called()
+    pop_by_score_mock.assert_not_called()
+    claim_list_batch_mock.assert_not_called()
+    recover_list_batches_mock.assert_not_called()
 
 
 def test_should_call_set_if_enabled(mocked_redis_client):
@@ -164,6 +227,26 @@ def test_exceeded_rate_limit_should_not_call_if_not_enabled(
     assert not mocked_redis_client.redis_store.pipeline.called
 
 
+def test_mget(mocked_redis_client):
+    assert mocked_redis_client.mget(["a", uuid.UUID(int=0)]) == [b"a", None]
+    mocked_redis_client.redis_store.mget.assert_called_once_with(
+        ["a", "00000000-0000-0000-0000-000000000000"]
+    )
+
+
+def test_mget_returns_nothing_if_redis_fails(mocked_redis_client):
+    mocked_redis_client.redis_store.mget.side_effect = KeyError("mget failed")
+    assert mocked_redis_client.mget(["a", "b"]) == [None, None]
+
+
+def test_mget_returns_nothing_if_redis_is_disabled(app):
+    app.config["REDIS_ENABLED"] = False
+    redis_client = RedisClient()
+    redis_client.init_app(app)
+
+    assert redis_client.mget(["a", "b"]) == [None, None]
+
+
 def test_delete(mocked_redis_client):
     key = "hash-key"
     mocked_redis_client.delete(key)
@@ -195,3 +278,116 @@ def test_delete_by_pattern(mocked_redis_client, delete_mock):
     ret = mocked_redis_client.delete_by_pattern("foo")
     assert ret == 4
     delete_mock.assert_called_once_with(args=["foo"])
+
+
+def test_take_tokens(mocked_redis_client, take_tokens_mock):
+    assert (
+        mocked_redis_client.take_tokens(
+            {"provider-bucket": (20, 40), "sender-bucket": (1, 2)}, 5
+        )
+        == 3
+    )
+    take_tokens_mock.assert_called_once_with(
+        keys=["provider-bucket", "sender-bucket"], args=[5, 20, 40, 1, 2]
+    )
+
+
+def test_take_tokens_allows_requests_if_redis_fails(
+    failing_redis_client, take_tokens_mock
+):
+    assert failing_redis_client.take_tokens({"bucket": (1, 1)}, 5) == 5
+
+
+def test_take_tokens_without_buckets(mocked_redis_client, take_tokens_mock):
+    assert mocked_redis_client.take_tokens({}, 5) == 5
+    take_tokens_mock.assert_not_called()
+
+
+def test_zadd(mocked_redis_client):
+    mocked_redis_client.zadd("key", {"member": 1.5})
+    mocked_redis_client.redis_store.zadd.assert_called_once_with("key", {"member": 1.5})
+
+
+def test_pop_by_score(mocked_redis_client, pop_by_score_mock):
+    assert mocked_redis_client.pop_by_score("key", 1000, 10) == [b"a", b"b"]
+    pop_by_score_mock.assert_called_once_with(keys=["key"], args=[1000, 10])
+
+
+@freeze_time("2024-01-01 12:00:00")
+def test_claim_list_batch(mocked_redis_client, claim_list_batch_mock):
+    claim_key, items = mocked_redis_client.claim_list_batch("queue", 10)
+
+    assert claim_key.startswith("queue-claim-")
+    assert items == [b"a", b"b"]
+    claim_list_batch_mock.assert_called_once_with(
+        keys=["queue", claim_key, "queue-claims"], args=[10, 1704110400.0]
+    )
+
+
+def test_claim_list_batch_claims_nothing_if_redis_fails(
+    mocked_redis_client, claim_list_batch_mock
+):
+    claim_list_batch_mock.side_effect = KeyError("claim failed")
+
+    assert mocked_redis_client.claim_list_batch("queue", 10)[1] == []
+
+
+@freeze_time("2024-01-01 12:00:00")
+def test_claim_list_item(mocked_redis_client, mocker):
+    blmove = mocker.patch.object(
+        mocked_redis_client.redis_store, "blmove", return_value=b"a"
+    )
+
+    claim_key, items = mocked_redis_client.claim_list_item("queue", 5)
+
+    assert items == [b"a"]
+    mocked_redis_client.redis_store.zadd.assert_called_once_with(
+        "queue-claims", {claim_key: 1704110400.0}
+    )
+    blmove.assert_called_once_with("queue", claim_key, 5, "LEFT", "RIGHT")
+
+
+def test_claim_list_item_forgets_the_claim_if_nothing_is_added(
+    mocked_redis_client, mocker
+):
+    mocker.patch.object(mocked_redis_client.redis_store, "blmove", return_value=None)
+    zrem = mocker.patch.object(mocked_redis_client.redis_store, "zrem")
+
+    claim_key, items = mocked_redis_client.claim_list_item("queue", 5)
+
+    assert items == []
+    zrem.assert_called_once_with("queue-claims", claim_key)
+
+
+def test_release_list_batch(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_client.release_list_batch("queue", "queue-claim-1")
+
+    mocked_redis_pipeline.delete.assert_called_once_with("queue-claim-1")
+    mocked_redis_pipeline.zrem.assert_called_once_with("queue-claims", "queue-claim-1")
+    mocked_redis_pipeline.execute.assert_called_once_with()
+
+
+def test_recover_list_batches(mocked_redis_client, recover_list_batches_mock):
+    assert mocked_redis_client.recover_list_batches("queue", 1000) == 2
+    recover_list_batches_mock.assert_called_once_with(
+        keys=["queue", "queue-claims"], args=[1000]
+    )
+
+
+def test_set_if_not_exists(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_pipeline.execute.return_value = [True, None]
+
+    assert mocked_redis_client.set_if_not_exists(["a", "b"], "1", ex=60) == ["a"]
+
+    assert mocked_redis_pipeline.set.call_args_list == [
+        call("a", "1", ex=60, nx=True),
+        call("b", "1", ex=60, nx=True),
+    ]
+
+
+def test_set_if_not_exists_returns_every_key_if_redis_fails(
+    mocked_redis_client, mocked_redis_pipeline
+):
+    mocked_redis_pipeline.execute.side_effect = Exception("redis unavailable")
+
+    assert mocked_redis_client.set_if_not_exists(["a", "b"], "1", ex=60) == ["a", "b"]
@@ -3,6 +3,13 @@ import requests_mock
 from flask import Flask
 
 from notifications_utils import request_helper
+from notifications_utils.template import (
+    get_email_preheader_render_plan,
+    get_html_email_body_render_plan,
+    get_html_email_shell,
+    get_render_plan,
+    get_sms_render_plan,
+)
 
 
 class FakeService:
@@ -43,3 +50,16 @@ def sample_service():
 def rmock():
     with requests_mock.mock() as rmock:
         yield rmock
+
+
+@pytest.fixture(autouse=True)
+def _clear_render_caches():
+    # Render plans and email shells are built with whatever formatters
+    # are in scope, so one cached while a formatter was mocked mustn’t
+    # leak into other tests
+    yield
+    get_render_plan.cache_clear()
+    get_sms_render_plan.cache_clear()
+    get_html_email_shell.cache_clear()
+    get_html_email_body_render_plan.cache_clear()
+    get_email_preheader_render_plan.cache_clear()
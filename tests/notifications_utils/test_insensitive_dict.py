@@ -2,7 +2,7 @@ from functools import partial
 
 import pytest
 
-from notifications_utils.insensitive_dict import InsensitiveDict
+from notifications_utils.insensitive_dict import InsensitiveDict, NormalisedKeys
 from notifications_utils.recipients import Cell, Row
 
 
@@ -94,3 +94,28 @@ def test_maintains_insertion_order():
     assert d.keys() == ["b", "a", "c"]
     d["BB"] = None
     assert d.keys() == ["b", "a", "c", "bb"]
+
+
+def test_normalised_keys_only_normalises_each_key_once(mocker):
+    make_key = mocker.patch.object(
+        InsensitiveDict, "make_key", side_effect=lambda key: key.lower()
+    )
+    normalised_keys = NormalisedKeys()
+    for _ in range(3):
+        assert [normalised_keys[key] for key in ("Foo", "BAR", "foo")] == [
+            "foo",
+            "bar",
+            "foo",
+        ]
+    assert make_key.call_count == 3
+
+
+def test_insensitive_dict_with_normalised_keys():
+    normalised_keys = NormalisedKeys()
+    row = {"Date of Birth": "01/01/2001", "TOWN": "London", "town": "Paris"}
+    assert InsensitiveDict(row, normalised_keys) == InsensitiveDict(row)
+    assert normalised_keys == {
+        "Date of Birth": "dateofbirth",
+        "TOWN": "town",
+        "town": "town",
+    }
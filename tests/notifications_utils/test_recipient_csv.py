@@ -10,6 +10,7 @@ from ordered_set import OrderedSet
 
 from notifications_utils import SMS_CHAR_COUNT_LIMIT
 from notifications_utils.formatters import strip_and_remove_obscure_whitespace
+from notifications_utils.insensitive_dict import InsensitiveDict
 from notifications_utils.recipients import (
     Cell,
     RecipientCSV,
@@ -318,6 +319,26 @@ def test_big_list_validates_right_through(
     assert big_csv.has_errors
 
 
+def test_wide_list_only_normalises_each_column_header_once(mocker):
+    columns = [f"Column {index}" for index in range(50)]
+    make_key = mocker.spy(InsensitiveDict, "make_key")
+    wide_csv = RecipientCSV(
+        "phone number,"
+        + ",".join(columns)
+        + "\n"
+        + ("2028675309," + ",".join(columns) + "\n") * 1000,
+        template=SMSMessageTemplate(
+            {
+                "content": " ".join(f"(({column}))" for column in columns[:25]),
+                "template_type": "sms",
+            }
+        ),
+    )
+    assert not wide_csv.has_errors
+    assert wide_csv[999].personalisation["column 24"] == "Column 24"
+    assert make_key.call_count < 1000
+
+
 @pytest.mark.parametrize(
     ("template_type", "row_count", "header", "filler"),
     [
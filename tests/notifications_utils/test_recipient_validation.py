@@ -1,8 +1,11 @@
+from time import process_time
+
 import pytest
 
 from notifications_utils.recipients import (
     InvalidEmailError,
     InvalidPhoneError,
+    PhoneNumber,
     allowed_to_send_to,
     format_phone_number_human_readable,
     format_recipient,
@@ -252,6 +255,43 @@ def test_get_international_info_raises(phone_number):
     assert str(error.value) == "Not a valid country prefix"
 
 
+@pytest.mark.parametrize("phone_number", valid_phone_numbers)
+def test_phone_number_matches_validation_and_international_info(phone_number):
+    parsed = PhoneNumber(phone_number, international=True)
+
+    assert parsed.e164 == validate_phone_number(phone_number, international=True)
+    assert parsed.international_phone_info == get_international_phone_info(phone_number)
+    assert str(parsed) == parsed.e164
+    assert PhoneNumber.from_validated(parsed.e164) == parsed
+    assert (
+        PhoneNumber.from_validated(parsed.e164).country_prefix == parsed.country_prefix
+    )
+
+
+@pytest.mark.parametrize("phone_number, error_message", invalid_us_phone_numbers)
+def test_phone_number_raises_like_validation(phone_number, error_message):
+    with pytest.raises(InvalidPhoneError) as error:
+        PhoneNumber(phone_number)
+    assert str(error.value) == error_message
+
+
+def test_phone_number_from_validated_raises_for_unparseable_number():
+    with pytest.raises(InvalidPhoneError):
+        PhoneNumber.from_validated("not a number")
+
+
+def test_phone_number_throughput():
+    start_time = process_time()
+
+    for _ in range(200):
+        for phone_number in valid_phone_numbers:
+            phone_number = PhoneNumber(phone_number, international=True)
+            phone_number.international
+            phone_number.billable_units
+
+    assert process_time() - start_time < 1
+
+
 @pytest.mark.parametrize("phone_number", valid_us_phone_numbers)
 @pytest.mark.parametrize(
     "extra_args",
@@ -1,3 +1,5 @@
+from time import process_time
+
 import pytest
 
 from notifications_utils.sanitise_text import SanitiseASCII, SanitiseSMS, SanitiseText
@@ -311,3 +313,35 @@ def test_sms_supporting_additional_languages(content, expected):
 )
 def test_get_non_compatible_characters(content, expected):
     assert SanitiseSMS.get_non_compatible_characters(content) == expected
+
+
+@pytest.mark.parametrize("cls", [SanitiseSMS, SanitiseASCII])
+def test_encode_matches_encoding_each_character(cls):
+    content = "".join(chr(codepoint) for codepoint in range(0x3000))
+    assert cls.encode(content) == "".join(cls.encode_char(c) for c in content)
+
+
+def test_each_class_has_its_own_encoding_table():
+    assert SanitiseSMS.get_encoding_table() is SanitiseSMS.get_encoding_table()
+    assert SanitiseSMS.get_encoding_table() is not SanitiseASCII.get_encoding_table()
+    assert SanitiseSMS.encode("€") == "€"
+    assert SanitiseASCII.encode("€") == "?"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "Your appointment is on Monday at 10:30am. Reply STOP to opt out.",
+        "Ça été très résumé, señor Müller. Voilà Łódź – “naïve” café…",
+        "这是一条很长的俄语消息，用于测试系统如何计算其成本。これはテストです",
+    ],
+)
+def test_sms_encoding_throughput(content):
+    SanitiseSMS.encode(content)
+
+    start_time = process_time()
+
+    for _ in range(10_000):
+        SanitiseSMS.encode(content)
+
+    assert process_time() - start_time < 1
@@ -0,0 +1,58 @@
+import re
+from time import process_time
+
+import pytest
+
+from notifications_utils.sms_segments import (
+    GSM,
+    GSM_CHARACTERS,
+    UCS2,
+    get_sms_fragment_counts,
+    get_sms_segments,
+)
+
+
+def test_gsm_characters_match_original_gsm_check():
+    rule = re.compile(
+        r'^[\sa-zA-Z0-9_@?£!1$"¥#è?¤é%ù&ì\\ò(Ç)*:Ø+;ÄäøÆ,<LÖlöæ\-=ÑñÅß.>ÜüåÉ/§à¡¿\']+$'
+    )
+    for codepoint in range(0x10000):
+        character = chr(codepoint)
+        assert (character in GSM_CHARACTERS) is bool(rule.search(character))
+
+
+@pytest.mark.parametrize(
+    ("content", "expected"),
+    [
+        ("", (UCS2, 0, 0, 0)),
+        ("a", (GSM, 1, 0, 1)),
+        ("a" * 160, (GSM, 160, 0, 1)),
+        ("a" * 161, (GSM, 161, 0, 2)),
+        ("a" * 306, (GSM, 306, 0, 2)),
+        ("a" * 307, (GSM, 307, 0, 3)),
+        ("Ŵ" * 70, (UCS2, 70, 0, 1)),
+        ("Ŵ" * 71, (UCS2, 71, 0, 2)),
+        ("Ŵ" * 135, (UCS2, 135, 0, 3)),
+        ("€ and [brackets]", (UCS2, 16, 3, 1)),
+        ("tab\tand\nnewline", (GSM, 15, 0, 1)),
+    ],
+)
+def test_get_sms_segments(content, expected):
+    assert get_sms_segments(content) == expected
+
+
+def test_get_sms_fragment_counts():
+    messages = ["a" * 160, "a" * 161, "Ŵ" * 71, ""]
+    assert get_sms_fragment_counts(messages) == [1, 2, 2, 0]
+
+
+def test_counting_billable_units_for_a_large_job_is_fast():
+    messages = [
+        f"Hello person {row}, your appointment is on Monday." for row in range(100_000)
+    ]
+
+    start_time = process_time()
+
+    assert sum(get_sms_fragment_counts(messages)) == 100_000
+
+    assert process_time() - start_time < 1
@@ -7,7 +7,8 @@ from bs4 import BeautifulSoup
 from markupsafe import Markup
 from ordered_set import OrderedSet
 
-from notifications_utils.formatters import unlink_govuk_escaped
+from notifications_utils.field import Field, PlainTextField
+from notifications_utils.formatters import sms_encode, unlink_govuk_escaped
 from notifications_utils.template import (
     BaseBroadcastTemplate,
     BaseEmailTemplate,
@@ -21,6 +22,12 @@ from notifications_utils.template import (
     SMSPreviewTemplate,
     SubjectMixin,
     Template,
+    get_email_preheader_render_plan,
+    get_html_email_body_render_plan,
+    get_html_email_shell,
+    get_render_plan,
+    get_sms_render_plan,
+    normalise_sms_content,
 )
 
 
@@ -2297,3 +2304,222 @@ def test_broadcast_message_single_counts_diacritics_in_gsm(
     )
     assert template.encoded_content_count == 1
     assert template.max_content_count == 1_395
+
+
+@pytest.mark.parametrize(
+    ("content", "values", "prefix"),
+    [
+        ("Hello ((name)), your code is ((code)).", {"name": "Jo", "code": "123"}, None),
+        ("Hello ((name)) , bye", {"name": "Jo"}, "Service"),
+        ("  ((a))\n\n\n\n((b))  ", {"a": "x", "b": "y"}, " Svc "),
+        ("((name))\t\tç…“hi”", {"name": "Ñoño"}, None),
+        ("Hi ((Name)) and ((name))", {"name": "Jo"}, None),
+        ("Hi ((name)) .", {"name": "Jo Smith"}, None),
+        ("Hi ((name)) .", {"name": "Jo."}, None),
+        ("Hi ((name)) .", {"name": ""}, None),
+        ("Hi ((name)) .", {"name": "\u200b"}, None),
+        ("Hi ((name)).", {"name": 12}, None),
+        ("Hi ((name))", {"name": ["a", "b"]}, "Svc"),
+        ("Hi ((name??there))", {"name": "yes"}, None),
+        ("Hi ((name)) ((other))", {"name": "Jo"}, None),
+        ("Hi ((name))", {"other": "Jo"}, None),
+        ("Hi \ue000 ((name))", {"name": "Jo"}, None),
+        ("No placeholders", {"name": "Jo"}, "Svc"),
+    ],
+)
+def test_sms_render_plan_matches_full_render(content, values, prefix):
+    template = SMSMessageTemplate(
+        {"content": content, "template_type": "sms"}, values, prefix=prefix
+    )
+    expected_unsanitised = normalise_sms_content(
+        PlainTextField(content, template.values, html="passthrough"), prefix
+    )
+    assert str(template) == sms_encode(expected_unsanitised)
+    assert template.content_count == len(expected_unsanitised)
+
+
+@pytest.mark.parametrize(
+    ("values", "renders_from_plan"),
+    [
+        ({"name": "Jo", "code": "123"}, True),
+        ({"name": "Ñoño", "code": "Ω"}, True),
+        ({"name": "Jo Smith", "code": "123"}, False),
+        ({"name": "Jo", "code": "1.23"}, False),
+        ({"name": "", "code": "123"}, False),
+        ({"name": "Jo"}, False),
+    ],
+)
+def test_sms_render_plan_only_splices_values_which_cant_change_normalisation(
+    values, renders_from_plan
+):
+    render_plan = get_sms_render_plan("Hi ((name)), code: ((code))", "Svc")
+    assert render_plan.normalised_segments == ("Svc: Hi ", ", code: ", "")
+    assert (render_plan.render(values) is not None) is renders_from_plan
+
+
+def test_sms_render_plan_is_compiled_once_per_content_and_prefix():
+    assert get_sms_render_plan("Hi ((name))", "a") is get_sms_render_plan(
+        "Hi ((name))", "a"
+    )
+    assert get_sms_render_plan("Hi ((name))", "a") is not get_sms_render_plan(
+        "Hi ((name))", "b"
+    )
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"name": "Jo", "show": "yes"},
+        {"name": "Jo Smith", "show": "no"},
+        {"name": "**Jo**\n\n* list", "show": "yes"},
+        {"name": ["Jo", "Sam"], "show": "yes"},
+        {"name": "Jo"},
+    ],
+)
+def test_plain_text_email_render_plan_matches_field(values):
+    content = "Hi ((name)), see GOV.UK ((show??now))\n\n# Heading"
+    template = PlainTextEmailTemplate(
+        {"content": content, "subject": "subject", "template_type": "email"}, values
+    )
+    filled = get_render_plan(content).fill(template.values)
+    if filled is not None:
+        assert filled == str(
+            Field(content, template.values, html="passthrough", markdown_lists=True)
+        )
+    assert "Jo" in str(template)
+
+
+def _remove_brackets(html):
+    return html.replace("%5B", "").replace("%5D", "").replace("(", "").replace(")", "")
+
+
+@pytest.mark.parametrize(
+    "branding",
+    [
+        {},
+        {"govuk_banner": False, "complete_html": False},
+        {
+            "govuk_banner": False,
+            "brand_banner": True,
+            "brand_logo": "https://example.com/logo.png",
+            "brand_text": "Brand & <text>",
+            "brand_colour": "#f00",
+            "brand_name": "Org",
+        },
+        {"brand_logo": "https://example.com/logo.png", "brand_name": "Org (name)"},
+        {"brand_logo": "logo.png", "brand_text": "<!--notify-body-->"},
+    ],
+)
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"name": "Jo <b>&amp;</b>", "link": "https://example.com/[a](b)"},
+        {"name": "(Sam)", "link": "example.com/%5Bx%5D"},
+    ],
+)
+def test_html_email_rendered_in_shell_matches_full_render(branding, values):
+    template = HTMLEmailTemplate(
+        {
+            "content": "Hi ((name)),\n\n* one\n* two\n\nVisit ((link)) & “see”",
+            "subject": "Hello ((name))",
+            "template_type": "email",
+        },
+        values,
+        **branding,
+    )
+    assert template.render_in_shell() == str(template)
+    assert template.render_in_shell(formatter=_remove_brackets) == _remove_brackets(
+        str(template)
+    )
+
+
+def test_html_email_shell_is_rendered_once_per_branding():
+    template = HTMLEmailTemplate(
+        {"content": "content", "subject": "subject", "template_type": "email"},
+        brand_text="Brand",
+    )
+    template.render_in_shell()
+    with mock.patch.object(HTMLEmailTemplate.jinja_template, "render") as render:
+        template.render_in_shell()
+        HTMLEmailTemplate(
+            {"content": "other", "subject": "other", "template_type": "email"},
+            brand_text="Brand",
+        ).render_in_shell()
+    assert render.called is False
+    assert get_html_email_shell(None, **template.branding).slots == (
+        "subject",
+        "preheader",
+        "body",
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "Hi ((name)),\n\nYour code is ((code)).",
+        "# ((name))\n\n* ((name))\n* ((code))\n\n1. ((code))\n2. two",
+        "Dear ((name)) ((code))\n\n> ((name))'s reference is ‘((code))’",
+        '\'((code)) and "((name))"\n\n((code)). done',
+        "Visit https://example.com/((name)) or ((name)).gov.uk",
+        "**((name))** _((code))_ [((name))](https://example.com/((code)))",
+        "((code))\n\n---\n\n((name))\n===",
+        "Visit https://example.com/((name))((code)) now",
+        "((name))((code)) and ((code)) ((name))",
+    ],
+)
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"name": "Jo", "code": "123456"},
+        {"name": "Jo Smith", "code": "80s"},
+        {"name": "x", "code": "foo bar"},
+        {"name": "s", "code": "1"},
+        {"name": "GOV", "code": "UK"},
+        {"name": "José", "code": "https"},
+        {"name": "<b>Jo</b>", "code": "a.b"},
+        {"name": ["a", "b"], "code": "x"},
+        {"code": "x"},
+    ],
+)
+def test_html_email_body_render_plan_matches_full_render(content, values):
+    template = HTMLEmailTemplate(
+        {"content": content, "subject": "subject", "template_type": "email"}, values
+    )
+    rendered = get_html_email_body_render_plan(content).render(template.values)
+    if rendered is not None:
+        assert rendered == template.html_body
+    preheader = get_email_preheader_render_plan(content).render(template.values)
+    if preheader is not None:
+        assert template._truncate_preheader(preheader) == template.preheader
+    assert template.render_in_shell() == str(template)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "((name??conditional))",
+        "Already contains xnotifyslot0x",
+    ],
+)
+def test_html_email_body_render_plan_falls_back_for_content_it_cant_compile(content):
+    assert get_html_email_body_render_plan(content).render({"name": "Jo"}) is None
+
+
+def test_email_preheader_render_plan_falls_back_if_a_placeholder_isnt_rendered():
+    content = "[link](https://example.com/((name)))"
+    assert get_html_email_body_render_plan(content).render({"name": "Jo"})
+    assert get_email_preheader_render_plan(content).render({"name": "Jo"}) is None
+
+
+def test_html_email_body_is_rendered_from_plan_quickly():
+    content = "\n\n".join(
+        f"Dear ((name)), paragraph {index} with **bold** and a [link](https://example.com)"
+        for index in range(20)
+    )
+    template_dict = {"content": content, "subject": "subject", "template_type": "email"}
+    HTMLEmailTemplate(template_dict, {"name": "Jo"}).render_in_shell()
+
+    start_time = process_time()
+    for index in range(1000):
+        HTMLEmailTemplate(template_dict, {"name": f"Jo{index}"}).render_in_shell()
+    assert process_time() - start_time < 1